@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+bench_classify.py
+
+Confronta la classificazione elemento per elemento (is_iccd_poi, normalize_name,
+map_to_persistent, map_to_tourism, tenute qui come riferimento) con il motore a
+colonne usato da process_elements, verificando che i POI prodotti siano identici.
+
+Uso (dalla cartella OSM):
+    python benchmarks/bench_classify.py [--n=500000] [--input=risposta_overpass.json[.gz]]
+
+Senza --input genera N elementi sintetici con una distribuzione di tag simile a un
+estratto regionale (molti elementi senza nome, pochi ICCD, way con center).
+"""
+
+import os
+import random
+import sys
+import time
+from html import unescape
+
+OPTIONS = {}
+for arg in sys.argv[1:]:
+    if arg.startswith("--"):
+        opt_name, _, opt_value = arg[2:].partition("=")
+        OPTIONS[opt_name] = opt_value
+
+# osm_poi.py è uno script: lo si importa come modulo con una riga di comando fittizia
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.argv = ["osm_poi.py", "Benchmark", "--no-cache"]
+import osm_poi  # noqa: E402
+from slkb_osm_overpass.stream import iter_elements_file  # noqa: E402
+
+TAG_VALUES = {
+    "amenity": ["restaurant", "cafe", "bar", "parking", "bench", "pharmacy", "theatre", "fast_food"],
+    "shop": ["wine", "deli", "bakery", "clothes", "supermarket"],
+    "tourism": ["hotel", "guest_house", "viewpoint", "artwork", "museum", "information"],
+    "leisure": ["park", "playground", "pitch"],
+    "public_transport": ["platform", "stop_position"],
+    "highway": ["bus_stop", "crossing"],
+    "railway": ["station", "halt"],
+    "natural": ["water", "tree", "peak"],
+    "historic": ["monument", "memorial", "castle", "wayside_cross"],
+    "building": ["church", "yes", "house"],
+}
+EXTRA_TAGS = {
+    "cuisine": ["pizza", "regional"], "wheelchair": ["yes", "no"], "opening_hours": ["Mo-Fr 09:00-18:00"],
+    "website": ["https://example.org"], "addr:street": ["Via Roma"], "addr:housenumber": ["1", "12"],
+    "wikidata": ["Q1"], "craft": ["carpenter"], "image": ["https://example.org/a.jpg"],
+}
+
+
+def synthetic_elements(n, seed=42):
+    rnd = random.Random(seed)
+    keys = list(TAG_VALUES)
+    extra = list(EXTRA_TAGS)
+    elements = []
+    for i in range(n):
+        tags = {}
+        for k in rnd.sample(keys, rnd.choice((1, 1, 1, 2))):
+            tags[k] = rnd.choice(TAG_VALUES[k])
+        for k in rnd.sample(extra, rnd.randint(0, 4)):
+            tags[k] = rnd.choice(EXTRA_TAGS[k])
+        if rnd.random() < 0.4:
+            tags["name"] = rnd.choice(["Bar Centrale", "  Caff&egrave; Roma ", "Piazza Garibaldi", ""])
+        lat, lon = 40 + rnd.random(), 14 + rnd.random()
+        if rnd.random() < 0.8:
+            elements.append({"type": "node", "id": i, "lat": lat, "lon": lon, "tags": tags})
+        elif rnd.random() < 0.95:
+            elements.append({"type": "way", "id": i, "center": {"lat": lat, "lon": lon}, "tags": tags})
+        else:
+            elements.append({"type": "relation", "id": i, "tags": tags})  # senza coordinate: scartato
+    return elements
+
+
+# ----------------------------
+# Classificazione elemento per elemento
+# ----------------------------
+# Le funzioni di osm_poi.py prima del motore a colonne (TagClassifier): in produzione
+# non girano più, restano qui come riferimento della semantica che classify() deve
+# riprodurre esattamente, sulle stesse tabelle di osm_poi.py.
+def normalize_name(tags):
+    name = tags.get("name")
+    if name:
+        return unescape(name).strip()
+    key = next((k for k in osm_poi.TAG_PRIORITY if k in tags), None)
+    val = tags.get(key) if key else None
+    return val.capitalize() if val else "POI senza nome"
+
+def pick_tag_priority(tags):
+    for key in osm_poi.TAG_PRIORITY:
+        if key in tags:
+            return key, tags[key]
+    return None, None
+
+def map_to_tourism(tags):
+    key, val = pick_tag_priority(tags)
+    return osm_poi.OSM_TO_TOURISM.get((key,val), "Altro / Generico")
+
+def map_to_persistent(tags):
+    key, val = pick_tag_priority(tags)
+    return osm_poi.OSM_TO_PERSISTENT.get((key,val), f"{key}:{val}" if key else "Altro")
+
+def is_iccd_poi(tags):
+    for k,v in osm_poi.ICCD_TAGS:
+        if tags.get(k) == v:
+            return True
+    return False
+
+
+def process_per_element(elements):
+    """Percorso elemento per elemento, come process_elements prima del motore a colonne."""
+    rows = []
+    for el in elements:
+        tags = el.get("tags", {}) or {}
+        if osm_poi.FILTER_ONLY_WITH_LINKS and ("wikidata" not in tags and "wikipedia" not in tags):
+            continue
+        if is_iccd_poi(tags):
+            continue
+        lat = el.get("lat") or el.get("center", {}).get("lat")
+        lon = el.get("lon") or el.get("center", {}).get("lon")
+        if lat is None or lon is None:
+            continue
+        rows.append(osm_poi.make_poi(
+            el.get("type", ""), el.get("id", ""), tags, lat, lon, normalize_name(tags),
+            map_to_persistent(tags), map_to_tourism(tags),
+        ))
+    return rows
+
+
+def classify_per_element(elements):
+    """Solo classificazione, elemento per elemento."""
+    out = []
+    for el in elements:
+        tags = el.get("tags", {}) or {}
+        out.append((is_iccd_poi(tags), normalize_name(tags),
+                    map_to_persistent(tags), map_to_tourism(tags)))
+    return out
+
+
+def timed(label, fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    print(f"{label:<40} {time.perf_counter() - t0:8.2f}s")
+    return result
+
+
+def main():
+    if OPTIONS.get("input"):
+        elements = list(iter_elements_file(OPTIONS["input"]))
+    else:
+        elements = synthetic_elements(int(OPTIONS.get("n") or 500000))
+    print(f"Elementi: {len(elements)}\n")
+
+    timed("classificazione per elemento", classify_per_element, elements)
+    timed("classificazione a colonne", osm_poi.CLASSIFIER.classify, elements)
+    reference = timed("process_elements per elemento", process_per_element, elements)
+    batched = timed("process_elements a colonne", osm_poi.process_elements, elements)
+
+    if reference != batched:
+        diff = next(i for i, (a, b) in enumerate(zip(reference, batched)) if a != b) \
+            if len(reference) == len(batched) else "lunghezze diverse"
+        print(f"\n❌ Output diversi (primo indice diverso: {diff})")
+        sys.exit(1)
+    print(f"\nOutput identici ({len(batched)} POI)")
+
+
+if __name__ == "__main__":
+    main()
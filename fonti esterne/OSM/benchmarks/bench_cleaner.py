@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+bench_cleaner.py
+
+Costo per POI di apply_name_cleaning su POI sintetici che coprono tutte le regole
+(trasporti, stazioni RFI, opere d'arte, categorie generiche, traduzioni, indirizzi),
+e verifica "golden": l'output deve coincidere con quello registrato in
+benchmarks/cleaner_golden.json (generato dall'implementazione precedente), con e
+senza la memo LRU delle firme. --transit misura anche un insieme di fermate molto
+ripetitive (stessi nomi e stesse vie).
+
+Uso (dalla cartella OSM):
+    python benchmarks/bench_cleaner.py [--n=20000] [--repeat=5] [--transit] [--update-golden]
+"""
+
+import copy
+import json
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "packages"))
+from slkb_osm_cleaner.cleaner import apply_name_cleaning  # noqa: E402
+from slkb_osm_cleaner.rules import cached_clean_fields  # noqa: E402
+
+GOLDEN_JSON = os.path.join(HERE, "cleaner_golden.json")
+GOLDEN_SIZE = 1500
+
+OPTIONS = {}
+for arg in sys.argv[1:]:
+    if arg.startswith("--"):
+        opt_name, _, opt_value = arg[2:].partition("=")
+        OPTIONS[opt_name] = opt_value
+
+CITIES = ["Napoli", "Roma", "Torre del Greco", ""]
+ADDRESSES = [
+    "Via Roma, 12, 80100", "Piazza Garibaldi", "Corso Umberto I, 3", "Via Giuseppe Verdi, 80133 Napoli",
+    "Viale Kennedy, 5", "Via San Giovanni Bosco", "Largo Ss. Apostoli", "", "Via dei Mille (Chiaia), 80121",
+    "  Via Toledo ,  Napoli ", "Roma, Via Appia Nuova, 00179 Roma",
+]
+NAMES = [
+    "Bar", "bar", "Stop", "Parking lot", "Restaurant Da Mario", "Farmacia", "Napoli Centrale", "Napoli - Garibaldi",
+    "Museo Archeologico", "", "Fermata Piazza Garibaldi", "P.zza Dante", "l'antica pizzeria", "G.B. Vico",
+    "A.B.C. Snack", "Pharmacy Rossi", "post office", "post_office Roma", "Statua", "Circumvesuviana Barra",
+    "Chiesa di San Gennaro", "Parco", "xx", "Hotel Excelsior", "Caffè Gambrinus", "Ristorante", "Teatro San Carlo",
+    "bus stop", "Roma Termini", "via roma 1", "Bed & Breakfast Sole", "guest house", "  cafe  ", "Parking_lot",
+    "stazione di napoli", "Fermata tram Duomo", "Bar dello Sport", "F. Rossi e figli", "Sant'Anna dei Lombardi",
+]
+TAGS = [
+    "amenity=bar", "highway=bus_stop;bus=yes", "public_transport=platform;bus=yes", "railway=station;operator=RFI",
+    "railway=station;network=RFI;name=Napoli Centrale", "railway=station;operator=EAV", "railway=stop;train=yes",
+    "public_transport=station;subway=yes", "funicular=yes;public_transport=station",
+    "tram=yes;public_transport=stop_position",
+    "tourism=artwork;artwork_type=sculpture;inscription=In memoria di Giovanni Orlandi / Q123 | caduto",
+    "tourism=artwork;artwork_type=bust;inscription=Napoli a Totò", "tourism=artwork;artwork_type=installation",
+    "tourism=artwork;artwork_type=mural;inscription=\"Roma\"", "tourism=artwork", "amenity=pharmacy",
+    "amenity=post_office", "shop=supermarket", "amenity=parking", "public_transport=station;operator=Ferrovie dello Stato",
+    "historic=monument", "", "railway=halt;operator=FAL", "light_rail=yes;network=Roma-Viterbo",
+]
+CATEGORIES = [
+    "Bar", "bar", "amenity:post_office", "pharmacy", "Opera d’arte", "Statua / Monumento", "Opera contemporanea",
+    "opera d'arte", "parcheggio", "teatro", "hotel", "", "Trasporti", "Chiesa", "parco", "supermarket", "atm",
+    "tourism:belvedere", "  cafe ",
+]
+
+
+def synthetic_pois(n, seed=0):
+    rnd = random.Random(seed)
+    pois = []
+    for i in range(n):
+        poi = {
+            "poi_id": f"poi-{i}", "nome_poi": rnd.choice(NAMES), "tag_k3": rnd.choice(TAGS),
+            "categoria_persistente": rnd.choice(CATEGORIES), "address": rnd.choice(ADDRESSES),
+            "citta_comune": rnd.choice(CITIES), "rfi_count": rnd.choice((1, 1, 3)),
+        }
+        if rnd.random() < 0.03:
+            poi["nome_poi"] = None
+        pois.append(poi)
+    return pois
+
+
+def transit_pois(n, seed=0):
+    """Fermate e stazioni: pochi nomi e poche vie ripetuti molte volte, come nei dati GTFS/OSM."""
+    rnd = random.Random(seed)
+    stops = [f"Via {s}" for s in ("Roma", "Toledo", "Caracciolo", "Foria", "Marina", "Manzoni")] + ["Stop", ""]
+    pois = []
+    for i in range(n):
+        pois.append({
+            "poi_id": f"stop-{i}", "nome_poi": rnd.choice(stops),
+            "tag_k3": rnd.choice(TAGS[1:10]), "categoria_persistente": "Trasporti",
+            "address": rnd.choice(ADDRESSES[:6]), "citta_comune": "Napoli", "rfi_count": 3,
+        })
+    return pois
+
+
+def clean_all(pois, use_cache=True):
+    """Output di apply_name_cleaning per ogni POI (nome dell'eccezione se la regola fallisce)."""
+    out = []
+    for poi in pois:
+        try:
+            res = apply_name_cleaning(poi, use_cache=use_cache)
+            out.append([res["nome_poi"], res["categoria_persistente"], res["address"]])
+        except Exception as e:
+            out.append(type(e).__name__)
+    return out
+
+
+def main():
+    golden_input = synthetic_pois(GOLDEN_SIZE, seed=1)
+    results = clean_all(copy.deepcopy(golden_input), use_cache=False)
+    cached_clean_fields.cache_clear()
+    if clean_all(copy.deepcopy(golden_input)) != results:
+        print("❌ risultati diversi con la memo delle firme")
+        sys.exit(1)
+    if "update-golden" in OPTIONS:
+        with open(GOLDEN_JSON, "w", encoding="utf-8") as f:
+            f.write("[\n" + ",\n".join(json.dumps(r, ensure_ascii=False) for r in results) + "\n]\n")
+        print(f"Golden aggiornato: {GOLDEN_JSON} ({len(results)} POI)")
+    else:
+        with open(GOLDEN_JSON, "r", encoding="utf-8") as f:
+            golden = json.load(f)
+        diff = [(poi, g, r) for poi, g, r in zip(golden_input, golden, results) if g != r]
+        for poi, g, r in diff[:10]:
+            print(f"❌ {poi['nome_poi']!r} / {poi['tag_k3']!r} / {poi['categoria_persistente']!r}: atteso {g}, ottenuto {r}")
+        if diff:
+            print(f"❌ {len(diff)}/{len(golden)} POI diversi dal golden")
+            sys.exit(1)
+        print(f"Golden: {len(golden)} POI identici")
+
+    n = int(OPTIONS.get("n") or 20000)
+    datasets = [("misti", synthetic_pois)]
+    if "transit" in OPTIONS:
+        datasets.append(("fermate", transit_pois))
+    for label, make in datasets:
+        for use_cache in (False, True):
+            times = []
+            for _ in range(int(OPTIONS.get("repeat") or 5)):
+                pois = make(n)
+                cached_clean_fields.cache_clear()
+                t0 = time.perf_counter()
+                clean_all(pois, use_cache=use_cache)
+                times.append(time.perf_counter() - t0)
+            elapsed = min(times)
+            info = cached_clean_fields.cache_info()
+            memo = f", memo {info.hits / max(info.hits + info.misses, 1):.0%} hit" if use_cache else ", senza memo"
+            print(f"apply_name_cleaning ({label}{memo}): {n} POI in {elapsed:.2f}s (migliore di {len(times)}), "
+                  f"{elapsed / n * 1e6:.1f} µs per POI")
+
+if __name__ == "__main__":
+    main()
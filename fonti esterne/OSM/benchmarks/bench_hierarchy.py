@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+bench_hierarchy.py
+
+Verifica e tempi di AreaHierarchy.locate_many (discesa dell'albero municipio ->
+quartiere -> rione) su aree sovrapposte di livelli diversi:
+
+- casi noti (CASES): un rione a cavallo di due municipi (radice dell'albero), un
+  rione figlio diretto di un municipio accanto a un quartiere, un quartiere senza
+  municipio; per ogni punto le aree attese di ogni livello;
+- una griglia sintetica di municipi, quartieri e rioni annidati, più rioni a cavallo
+  dei confini: il risultato deve coincidere con il confronto esaustivo (per ogni punto
+  e livello la prima area che lo contiene), e il quartiere_area_urbana ricavato
+  dall'albero (assign_many, il più vicino solo per i punti fuori da ogni area) deve
+  coincidere con l'assegnazione piatta di QuartieriIndex.locate_many.
+
+Uso (dalla cartella OSM):
+    python benchmarks/bench_hierarchy.py [--n=200000]
+"""
+
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import shapely
+from shapely.geometry import box
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "packages"))
+from slkb_osm_geo.hierarchy import LEVELS, AreaHierarchy, area_level  # noqa: E402
+from slkb_osm_geo.quartieri import QuartieriIndex  # noqa: E402
+
+OPTIONS = {}
+for arg in sys.argv[1:]:
+    if arg.startswith("--"):
+        opt_name, _, opt_value = arg[2:].partition("=")
+        OPTIONS[opt_name] = opt_value
+
+MUNICIPIO = {"boundary": "administrative", "admin_level": "9"}
+QUARTIERE = {"boundary": "administrative", "admin_level": "10"}
+RIONE = {"place": "neighbourhood"}
+
+# Aree in ordine Overpass (prima le way dei rioni, poi le relation amministrative)
+CASE_AREAS = [
+    ("RioneStraddle", RIONE, box(0.8, 0.4, 1.2, 0.6)),   # a cavallo di M1 e M2: radice
+    ("RioneM2", RIONE, box(1.4, 0.1, 1.6, 0.3)),         # figlio di M2, metà dentro Q2
+    ("M1", MUNICIPIO, box(0, 0, 1, 1)),
+    ("M2", MUNICIPIO, box(1, 0, 2, 1)),
+    ("Q1", QUARTIERE, box(0, 0, 1, 1)),                   # coincide con M1
+    ("Q2", QUARTIERE, box(1.5, 0, 2, 1)),
+    ("QSenzaMunicipio", QUARTIERE, box(3, 0, 4, 1)),
+]
+# (lon, lat) -> aree attese per livello
+CASES = [
+    ((0.9, 0.5), {"municipio": "M1", "quartiere": "Q1", "rione": "RioneStraddle"}),
+    ((1.1, 0.5), {"municipio": "M2", "quartiere": "", "rione": "RioneStraddle"}),
+    ((1.55, 0.2), {"municipio": "M2", "quartiere": "Q2", "rione": "RioneM2"}),
+    ((1.45, 0.2), {"municipio": "M2", "quartiere": "", "rione": "RioneM2"}),
+    ((0.2, 0.2), {"municipio": "M1", "quartiere": "Q1", "rione": ""}),
+    ((3.5, 0.5), {"municipio": "", "quartiere": "QSenzaMunicipio", "rione": ""}),
+    ((5.0, 5.0), {"municipio": "", "quartiere": "", "rione": ""}),
+]
+
+
+def check_cases():
+    hierarchy = AreaHierarchy(CASE_AREAS)
+    rows = hierarchy.locate_many([lat for (_, lat), _ in CASES], [lon for (lon, _), _ in CASES])
+    errors = []
+    for ((lon, lat), expected), row in zip(CASES, rows):
+        got = hierarchy.names_for(row)
+        if got != expected:
+            errors.append(f"({lon}, {lat}): atteso {expected}, ottenuto {got}")
+    return errors
+
+
+def synthetic_areas(n_municipi=4, seed=1):
+    """
+    Municipi 4x4 km in griglia, quartieri e rioni annidati, rioni a cavallo dei confini
+    e una zona senza livello (solo nome) sovrapposta a tutti i livelli.
+    """
+    rnd = random.Random(seed)
+    size = 0.04
+    rioni, admin = [("ZonaSenzaLivello", {"name": "Zona"}, box(14.12, 40.81, 14.14, 40.83))], []
+    for m in range(n_municipi):
+        x0 = 14.1 + m * size
+        admin.append((f"M{m}", MUNICIPIO, box(x0, 40.8, x0 + size, 40.8 + size)))
+        for q in range(4):
+            qx, qy = x0 + (q % 2) * size / 2, 40.8 + (q // 2) * size / 2
+            admin.append((f"Q{m}-{q}", QUARTIERE, box(qx, qy, qx + size / 2, qy + size / 2)))
+            for r in range(3):
+                rx, ry = qx + rnd.uniform(0, size / 3), qy + rnd.uniform(0, size / 3)
+                rioni.append((f"R{m}-{q}-{r}", RIONE, box(rx, ry, rx + size / 8, ry + size / 8)))
+        if m:
+            rioni.append((f"RCavallo{m}", RIONE, box(x0 - size / 10, 40.81, x0 + size / 10, 40.82)))
+    return rioni + admin
+
+
+def exhaustive(areas, lats, lons):
+    """Per ogni punto e livello la prima area che lo contiene, confrontando tutte le aree."""
+    out = np.full((len(lats), len(LEVELS)), -1, dtype=np.int64)
+    points = shapely.points(lons, lats)
+    for i, (_, tags, geom) in enumerate(areas):
+        level = area_level(tags)
+        if level is None:
+            continue
+        inside = shapely.contains(geom, points) | shapely.touches(geom, points)
+        free = inside & (out[:, level] < 0)
+        out[free, level] = i
+    return out
+
+
+def main():
+    errors = check_cases()
+    for error in errors:
+        print(f"❌ {error}")
+    if errors:
+        sys.exit(1)
+    print(f"Casi noti: {len(CASES)} punti con le aree attese")
+
+    areas = synthetic_areas()
+    hierarchy = AreaHierarchy(areas)
+    print(hierarchy.report())
+    n = int(OPTIONS.get("n") or 200000)
+    rnd = np.random.default_rng(2)
+    lats = rnd.uniform(40.79, 40.85, n)
+    lons = rnd.uniform(14.09, 14.27, n)
+
+    t0 = time.perf_counter()
+    rows = hierarchy.locate_many(lats, lons)
+    elapsed = time.perf_counter() - t0
+    mismatches = int((rows != exhaustive(areas, lats, lons)).any(axis=1).sum())
+    if mismatches:
+        print(f"❌ {mismatches} punti diversi dal confronto esaustivo")
+        sys.exit(1)
+    print(f"locate_many: {n} punti in {elapsed:.2f}s, identici al confronto esaustivo")
+
+    # quartiere_area_urbana come in osm_poi_address.assegna_aree, contro l'indice piatto
+    t0 = time.perf_counter()
+    _, first, tol = hierarchy.assign_many(lats, lons)
+    outside = int((tol != 0).sum())
+    elapsed = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    flat, _, _ = QuartieriIndex([(nome, geom) for nome, _, geom in areas]).locate_many(lats, lons)
+    flat_elapsed = time.perf_counter() - t0
+    mismatches = int((first != flat).sum())
+    if mismatches:
+        print(f"❌ quartiere_area_urbana: {mismatches} punti diversi dall'indice piatto")
+        sys.exit(1)
+    print(f"quartiere_area_urbana: albero {elapsed:.2f}s ({outside} punti fuori dalle aree), "
+          f"indice piatto {flat_elapsed:.2f}s, identici")
+
+
+if __name__ == "__main__":
+    main()
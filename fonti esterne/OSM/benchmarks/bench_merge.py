@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+bench_merge.py
+
+Tempi di merge_nearby_poi (confronto per nome nelle celle vicine di una griglia)
+contro la scansione quadratica precedente, su POI sintetici con molti nomi ripetuti
+(fermate, bar, farmacie) sparsi su un'area urbana. Verifica che i POI tenuti e il log
+"Fuso POI" coincidano con quelli della scansione quadratica, e misura cluster_duplicates
+(duplicati vicini con nomi simili) sul risultato: nessun POI distinto deve sparire, e le
+coppie di DISTINCT_PAIRS / DUPLICATE_PAIRS devono restare separate / essere fuse.
+
+Uso (dalla cartella OSM):
+    python benchmarks/bench_merge.py [--sizes=5000,50000] [--distance=50] [--quadratic-max=10000]
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "packages"))
+from slkb_osm_cleaner.merge import Grid, cluster_duplicates, haversine, merge_nearby_poi  # noqa: E402
+
+OPTIONS = {}
+for arg in sys.argv[1:]:
+    if arg.startswith("--"):
+        opt_name, _, opt_value = arg[2:].partition("=")
+        OPTIONS[opt_name] = opt_value
+
+STREETS = ["Via Roma", "Via Toledo", "Corso Umberto I", "Via Foria", "Piazza Garibaldi", "Via Caracciolo",
+           "Viale Kennedy", "Via dei Mille", "Via Manzoni", "Corso Vittorio Emanuele"]
+GENERIC = ["Bar", "Farmacia", "Pizzeria", "Parcheggio", "Tabacchi", "Bancomat"]
+SPACING_M = 150  # distanza minima tra POI distinti con lo stesso nome
+
+# (nome, nome, categoria): POI distinti a pochi metri, da non fondere
+DISTINCT_PAIRS = [
+    ("Bar Via Roma, 12", "Bar Via Roma, 14", "Bar"),
+    ("Farmacia Via Toledo, 101", "Farmacia Via Toledo, 110", "Farmacia"),
+    ("Parcheggio 1", "Parcheggio 2", "Parcheggio"),
+    ("Scuola Elementare 12", "Scuola Elementare 13", "Scuola"),
+    ("Ristorante Da Mario", "Ristorante Da Maria", "Ristorante"),
+    ("Fermata treno Via Roma", "Fermata Via Roma", "Trasporti"),
+    ("Fermata autobus Via Roma", "Fermata tram Via Roma", "Trasporti"),
+    ("Chiesa di San Gennaro", "Chiesa di San Gennaro all'Olmo", "Chiesa"),
+    ("Luogo 15988", "Luogo 15878", "Luogo"),
+    ("Bar", "Bar Sport", "Bar"),
+]
+# (nome, nome, categoria): lo stesso POI scritto in due modi, da fondere
+DUPLICATE_PAIRS = [
+    ("Pizzeria Da Michele", "Da Michele", "Pizzeria"),
+    ("Pizzeria Da Michele", "Pizzeria da Michelle", "Pizzeria"),
+    ("Luogo 123", "Luogo n. 123", "Luogo"),
+    ("Fermata autobus Via Roma", "Fermata autobus Roma", "Trasporti"),
+    ("McDonald's", "Mc Donald's", "Fast food"),
+]
+
+
+def synthetic_pois(n, seed=0):
+    """
+    Nomi ripetuti (fermate per via, nomi generici) e nomi unici, con duplicati a pochi
+    metri: a volte con lo stesso nome, a volte con una variante ("Luogo n. 12").
+    POI distinti con lo stesso nome distano almeno SPACING_M, così ogni fusione
+    tra POI di "sorgente" diversa è un errore.
+    """
+    rnd = random.Random(seed)
+    grid = Grid(SPACING_M, 41.0)
+    placed = {}  # nome -> {cella: [(lat, lon)]}
+    pois = []
+    while len(pois) < n:
+        r = rnd.random()
+        if r < 0.4:
+            name = f"Fermata autobus {rnd.choice(STREETS)}"
+        elif r < 0.7:
+            name = f"{rnd.choice(GENERIC)} {rnd.choice(STREETS)}"
+        else:
+            name = f"Luogo {rnd.randrange(n)}"
+        lat, lon = rnd.uniform(40.80, 40.90), rnd.uniform(14.15, 14.35)
+        cells = placed.setdefault(name, {})
+        if any(haversine(lat, lon, *q) < SPACING_M
+               for near in grid.neighbours(grid.cell(lat, lon)) for q in cells.get(near, ())):
+            continue
+        cells.setdefault(grid.cell(lat, lon), []).append((lat, lon))
+        category, source = name.split()[0], len(pois)
+        for copy in range(1 + (rnd.random() < 0.2)):  # a volte lo stesso POI mappato due volte
+            if copy and rnd.random() < 0.5:
+                name = name.replace("Fermata autobus Via", "Fermata autobus").replace("Luogo", "Luogo n.")
+            pois.append({"nome_poi": name, "categoria_persistente": category, "sorgente": source,
+                         "latitudine": lat + rnd.gauss(0, 0.0002), "longitudine": lon + rnd.gauss(0, 0.0002)})
+    return pois[:n]
+
+
+def merge_quadratic(pois, max_distance_m=50):
+    """La scansione precedente: ogni POI contro tutti quelli già tenuti."""
+    merged = []
+    fusi = []
+    for poi in pois:
+        found = False
+        for m in merged:
+            if (
+                poi["nome_poi"] == m["nome_poi"]
+                and haversine(poi["latitudine"], poi["longitudine"], m["latitudine"], m["longitudine"]) < max_distance_m
+            ):
+                found = True
+                fusi.append((poi, m))
+                break
+        if not found:
+            merged.append(poi)
+    for poi, m in fusi:
+        print(f"Fuso POI '{poi['nome_poi']}' ({poi['latitudine']},{poi['longitudine']}) "
+              f"in '{m['nome_poi']}' ({m['latitudine']},{m['longitudine']})")
+    print(f"Totale POI finali: {len(merged)}")
+    return merged
+
+
+def check_pairs(distance):
+    """Le coppie note, a 5 m l'una dall'altra: DISTINCT_PAIRS separate, DUPLICATE_PAIRS fuse."""
+    errors = []
+    for pairs, expected in ((DISTINCT_PAIRS, 2), (DUPLICATE_PAIRS, 1)):
+        for a, b, category in pairs:
+            pois = [{"nome_poi": name, "categoria_persistente": category, "latitudine": 40.85,
+                     "longitudine": 14.25 + k * 0.00006} for k, name in enumerate((a, b))]
+            kept, _, _ = timed(cluster_duplicates, pois, distance)
+            if len(kept) != expected:
+                errors.append(f"{a!r} / {b!r}: {'fusi' if len(kept) == 1 else 'non fusi'}")
+    return errors
+
+
+def timed(fn, pois, distance):
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        t0 = time.perf_counter()
+        merged = fn(pois, max_distance_m=distance)
+        elapsed = time.perf_counter() - t0
+    return merged, out.getvalue(), elapsed
+
+
+def main():
+    sizes = [int(s) for s in (OPTIONS.get("sizes") or "5000,50000").split(",")]
+    distance = float(OPTIONS.get("distance") or 50)
+    quadratic_max = int(OPTIONS.get("quadratic-max") or 10000)
+
+    errors = check_pairs(distance)
+    for error in errors:
+        print(f"❌ duplicati simili: {error}")
+    if errors:
+        sys.exit(1)
+    print(f"Duplicati simili: {len(DISTINCT_PAIRS)} coppie distinte separate, {len(DUPLICATE_PAIRS)} duplicate fuse")
+
+    for n in sizes:
+        pois = synthetic_pois(n)
+        merged, log, elapsed = timed(merge_nearby_poi, pois, distance)
+        line = f"{n} POI -> {len(merged)} ({log.count('Fuso POI')} fusi): griglia {elapsed:.3f}s"
+        if n <= quadratic_max:
+            ref, ref_log, ref_elapsed = timed(merge_quadratic, pois, distance)
+            if [id(p) for p in ref] != [id(p) for p in merged] or ref_log != log:
+                print(f"❌ {n} POI: risultato diverso dalla scansione quadratica")
+                sys.exit(1)
+            line += f", quadratica {ref_elapsed:.3f}s (identici, {ref_elapsed / elapsed:.0f}x)"
+        print(line)
+        clustered, log, elapsed = timed(cluster_duplicates, merged, distance)
+        lost = {p["sorgente"] for p in merged} - {p["sorgente"] for p in clustered}
+        if lost:
+            print(f"❌ {n} POI: {len(lost)} POI distinti fusi per errore dai duplicati simili")
+            sys.exit(1)
+        print(f"   duplicati simili: {len(merged)} -> {len(clustered)} ({log.count('Fuso POI simile')} fusi) "
+              f"in {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
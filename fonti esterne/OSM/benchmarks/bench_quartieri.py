@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+bench_quartieri.py
+
+Tempi dell'assegnazione punto -> quartiere: locate() punto per punto contro la
+join vettoriale locate_many(), su 10k, 100k e 1M punti casuali attorno a quartieri
+sintetici (o a quelli reali di un file <citta>_neighborhood.json con --quartieri).
+Verifica anche che i due metodi scelgano lo stesso quartiere.
+
+Uso (dalla cartella OSM):
+    python benchmarks/bench_quartieri.py [--sizes=10000,100000,1000000] [--quartieri=FILE]
+        [--scalar-max=100000]
+"""
+
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "packages"))
+from shapely.geometry import Polygon  # noqa: E402
+
+from slkb_osm_geo.geometry_store import load_neighborhoods  # noqa: E402
+from slkb_osm_geo.quartieri import QuartieriIndex  # noqa: E402
+
+OPTIONS = {}
+for arg in sys.argv[1:]:
+    if arg.startswith("--"):
+        opt_name, _, opt_value = arg[2:].partition("=")
+        OPTIONS[opt_name] = opt_value
+
+
+def synthetic_quartieri(nx=12, ny=10, vertices=200, seed=1):
+    """Griglia di quartieri dal contorno frastagliato, con piccoli buchi e sovrapposizioni."""
+    rnd = random.Random(seed)
+    size = 0.01
+    quartieri = []
+    for i in range(nx):
+        for j in range(ny):
+            cx, cy = 14.20 + (i + 0.5) * size, 40.80 + (j + 0.5) * size
+            ring = []
+            for k in range(vertices):
+                a = 2 * math.pi * k / vertices
+                r = size * 0.5 * rnd.uniform(0.85, 1.15) / max(abs(math.cos(a)), abs(math.sin(a)))
+                ring.append((cx + r * math.cos(a), cy + r * math.sin(a)))
+            quartieri.append((f"Quartiere {i}-{j}", Polygon(ring).buffer(0)))
+    return quartieri
+
+
+def load_quartieri(path_json):
+    """Quartieri reali [(nome, geom)] da un file Overpass <citta>_neighborhood.json."""
+    return [(nome, geom) for nome, _, geom in load_neighborhoods(path_json)]
+
+
+def random_points(n, bounds, margin=0.03, seed=2):
+    rnd = random.Random(seed)
+    minx, miny, maxx, maxy = bounds
+    lats = [rnd.uniform(miny - margin, maxy + margin) for _ in range(n)]
+    lons = [rnd.uniform(minx - margin, maxx + margin) for _ in range(n)]
+    return lats, lons
+
+
+def main():
+    if OPTIONS.get("quartieri"):
+        quartieri = load_quartieri(OPTIONS["quartieri"])
+    else:
+        quartieri = synthetic_quartieri()
+
+    t0 = time.perf_counter()
+    index = QuartieriIndex(quartieri)
+    print(f"Indice di {len(index)} quartieri: {time.perf_counter() - t0:.3f}s\n")
+
+    bounds = index.tree.geometries[0].bounds
+    for g in index.geoms[1:]:
+        b = g.bounds
+        bounds = (min(bounds[0], b[0]), min(bounds[1], b[1]), max(bounds[2], b[2]), max(bounds[3], b[3]))
+
+    sizes = [int(s) for s in (OPTIONS.get("sizes") or "10000,100000,1000000").split(",")]
+    scalar_max = int(OPTIONS.get("scalar-max") or 100000)
+
+    print(f"{'punti':>10} {'locate_many':>12} {'locate':>10}  assegnati")
+    for n in sizes:
+        lats, lons = random_points(n, bounds)
+        t0 = time.perf_counter()
+        bulk, _, _ = index.locate_many(lats, lons)
+        t_bulk = time.perf_counter() - t0
+
+        t_scalar = "-"
+        if n <= scalar_max:
+            t0 = time.perf_counter()
+            scalar = [index.locate(lat, lon) for lat, lon in zip(lats, lons)]
+            t_scalar = f"{time.perf_counter() - t0:.2f}s"
+            mismatches = sum(1 for s, b in zip(scalar, bulk) if (s[0] if s else -1) != b)
+            if mismatches:
+                print(f"❌ {mismatches} punti assegnati diversamente")
+                sys.exit(1)
+
+        print(f"{n:>10} {t_bulk:>11.2f}s {t_scalar:>10}  {int((bulk >= 0).sum())}")
+
+
+if __name__ == "__main__":
+    main()
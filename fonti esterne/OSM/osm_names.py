@@ -1,17 +1,21 @@
-import json
+import logging
 import pandas as pd
 import sys, os
-from math import radians, cos, sin, asin, sqrt
 
 sys.path.append(r"packages")
-from slkb_osm_cleaner.cleaner import clean_list
+from slkb_osm_cleaner.cleaner import clean_list, default_workers
+from slkb_osm_cleaner.merge import DEFAULT_MIN_SIMILARITY, cluster_duplicates, merge_nearby_poi
+from slkb_osm_overpass.incremental import input_version, load_changes, mark_processed, reusable_outputs
+from slkb_osm_store.memo import StageMemo, memo_path
+from slkb_osm_store.columnar import output_format, read_pois, write_pois
 
 
 # ---------------------------
 # Legge argomenti da riga di comando
 # ---------------------------
 if len(sys.argv) < 2:
-    print("❌ Uso: python script.py <CITTÀ>")
+    print("❌ Uso: python script.py <CITTÀ> [--incremental] [--no-memo] [--workers=N] [--format=json|parquet|both] [--debug]"
+          " [--fuzzy[=SOGLIA]]")
     sys.exit(1)
 
 CITY_NAME = sys.argv[1]
@@ -19,62 +23,63 @@ CITY_CAPITALIZED = " ".join(word.capitalize() for word in CITY_NAME.split())
 city_slug = CITY_CAPITALIZED.lower().replace(" ", "_")
 INPUT_JSON = f"{city_slug}_osm_address.json"
 OUTPUT_JSON = f"{city_slug}_osm_poi_name.json"
+RULES_REPORT_JSON = f"{city_slug}_osm_poi_name_rules.json"  # contatori e tempi delle regole di pulizia
+INCREMENTAL = "--incremental" in sys.argv  # pulisce solo i POI modificati (osm_poi.py --incremental)
+USE_MEMO = "--no-memo" not in sys.argv  # riusa la pulizia dei POI già elaborati con lo stesso input
+OUTPUT_FORMAT = output_format(sys.argv)  # l'input è letto nel formato più recente disponibile
+# --workers=N: processi per la pulizia dei nomi (default: numero di core, 1 = senza pool)
+try:
+    WORKERS = int(next((a.split("=", 1)[1] for a in sys.argv if a.startswith("--workers=")), default_workers()))
+except ValueError:
+    print("--workers non valido, uso il numero di core")
+    WORKERS = default_workers()
+# --fuzzy[=SOGLIA]: fonde anche i duplicati vicini con nomi simili (somiglianza minima
+# 0-1, default DEFAULT_MIN_SIMILARITY); senza, solo i nomi identici. Facoltativo finché
+# non è verificato sui dati reali
+FUZZY = any(a == "--fuzzy" or a.startswith("--fuzzy=") for a in sys.argv)
+try:
+    FUZZY_SIMILARITY = float(next((a.split("=", 1)[1] for a in sys.argv if a.startswith("--fuzzy=")),
+                                  DEFAULT_MIN_SIMILARITY))
+except ValueError:
+    print("--fuzzy non valido, uso il default")
+    FUZZY_SIMILARITY = DEFAULT_MIN_SIMILARITY
+
+# --debug: dettaglio della pulizia di ogni POI (log DEBUG di slkb_osm_cleaner)
+logging.basicConfig(level=logging.DEBUG if "--debug" in sys.argv else logging.WARNING, format="%(message)s")
+
+# Versione dello stadio: va incrementata quando cambiano le regole di pulizia
+STAGE_VERSION = "1"
 
 
 
-def haversine(lat1, lon1, lat2, lon2):
-    """Distanza in metri tra due coordinate geografiche"""
-    R = 6371000
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
-    return 2 * R * asin(sqrt(a))
-
-
-def merge_nearby_poi(pois, max_distance_m=50):
-    """
-    Unisce POI con stesso nome e distanza inferiore a max_distance_m (default 50 m)
-    per ridurre duplicati visivi come fermate bus adiacenti.
-    """
-    merged = []
-    fusi = []  # lista per tenere traccia dei POI fusi
-
-    for poi in pois:
-        found = False
-        for m in merged:
-            if (
-                poi["nome_poi"] == m["nome_poi"]
-                and haversine(poi["latitudine"], poi["longitudine"], m["latitudine"], m["longitudine"]) < max_distance_m
-            ):
-                found = True
-                fusi.append((poi, m))  # salva la coppia: POI attuale e quello già presente
-                break
-        if not found:
-            merged.append(poi)
-
-    # stampa dettagliata dei POI fusi
-    for poi, m in fusi:
-        print(f"Fuso POI '{poi['nome_poi']}' ({poi['latitudine']},{poi['longitudine']}) "
-              f"in '{m['nome_poi']}' ({m['latitudine']},{m['longitudine']})")
-
-    print(f"Totale POI finali: {len(merged)}")
-    return merged
-
-
 def main():
     # Carica JSON arricchito
-    with open(INPUT_JSON, "r", encoding="utf-8") as f:
-        pois = json.load(f)
-
-    # Applica pulizia automatica nomi
-    pois_clean = clean_list(pois)
+    version = input_version(city_slug, "address")  # dataset da cui derivava l'input
+    pois = read_pois(INPUT_JSON)
+
+    # Applica pulizia automatica nomi (con --incremental solo ai POI modificati;
+    # il contesto cittadino, es. rfi_count, resta calcolato su tutti i POI)
+    previous = [None] * len(pois)
+    if INCREMENTAL:
+        previous = reusable_outputs(pois, OUTPUT_JSON, load_changes(city_slug, "names", version))
+        print(f"POI invariati riutilizzati: {sum(p is not None for p in previous)}/{len(pois)}")
+    to_clean = [poi for poi, prev in zip(pois, previous) if prev is None]
+    with StageMemo(memo_path(city_slug), "names", version=STAGE_VERSION, enabled=USE_MEMO) as memo:
+        cleaned = iter(clean_list(to_clean, city_pois=pois, memo=memo, workers=WORKERS,
+                                  report_path=RULES_REPORT_JSON))
+        print(memo.report())
+    pois_clean = [prev if prev is not None else next(cleaned) for prev in previous]
 
     # Applica fusione dei POI troppo vicini con stesso nome
     pois_final = merge_nearby_poi(pois_clean, max_distance_m=50)
 
+    # Con --fuzzy fonde anche i duplicati vicini con nomi simili e categoria compatibile
+    if FUZZY:
+        pois_final = cluster_duplicates(pois_final, max_distance_m=50, min_similarity=FUZZY_SIMILARITY)
+
     # Salva JSON pulito
-    with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-        json.dump(pois_final, f, ensure_ascii=False, indent=2)
+    write_pois(OUTPUT_JSON, pois_final, OUTPUT_FORMAT)
+    mark_processed(city_slug, "names", version)
 
     print("Pulizia e fusione completate")
     print(f"→ {OUTPUT_JSON}")
@@ -2,18 +2,56 @@ import requests
 import sys
 import time
 import json
+import gzip
+import shutil
+
+sys.path.append(r"packages")
+from slkb_osm_overpass.client import HedgedOverpassClient, AIOHTTP_AVAILABLE
+from slkb_osm_overpass.cache import cache_from_options, describe_cache
+from slkb_osm_overpass.stream import save_response, raise_for_remark_file, count_elements_file
+from slkb_osm_geo.local_geocoder import address_query, ADDRESS_CENTER_SELECTORS, STREET_GEOM_SELECTORS
+from slkb_osm_geo.geometry_store import NeighborhoodStore, store_path, DEFAULT_SIMPLIFY_M
+
+# --- Opzioni "--nome" / "--nome=valore", ammesse in qualsiasi posizione ---
+OPTIONS = {}
+for arg in sys.argv[1:]:
+    if arg.startswith("--"):
+        opt_name, _, opt_value = arg[2:].partition("=")
+        OPTIONS[opt_name] = opt_value
+ARGS = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
 
 # --- Legge il nome del comune da riga di comando ---
-if len(sys.argv) < 2:
-    print("Uso: python script.py <NOME_COMUNE>")
+if len(ARGS) < 1:
+    print("Uso: python script.py <NOME_COMUNE> [--hedged] [--use-cache|--refresh] [--cache-dir=DIR] "
+          "[--cache-ttl=SECONDI] [--extract=FILE] [--addresses] [--simplify=METRI]")
+    print("Cache Overpass disattivata di default; con --use-cache le risposte sono riusate "
+          "per --cache-ttl secondi (default 24 h)")
     sys.exit(1)
 
-CITY_NAME = sys.argv[1]
+CITY_NAME = ARGS[0]
 CITY_CAPITALIZED = " ".join(word.capitalize() for word in CITY_NAME.split())
 city_slug = CITY_CAPITALIZED.lower().replace(" ", "_")
 
 OUTPUT_JSON = f"{city_slug}_neighborhood.json"
 
+# --addresses: scarica anche civici e strade con nome per il geocoder locale di osm_poi_address.py
+ADDRESSES_JSON = f"{city_slug}_addresses.json"
+WITH_ADDRESSES = "addresses" in OPTIONS
+
+# --simplify=METRI: tolleranza dei poligoni semplificati salvati in <citta>_neighborhood.geom.sqlite
+try:
+    SIMPLIFY_M = float(OPTIONS.get("simplify") or DEFAULT_SIMPLIFY_M)
+except ValueError:
+    print("--simplify non valido, uso il default")
+    SIMPLIFY_M = DEFAULT_SIMPLIFY_M
+
+# --- Multipoligoni assemblati e semplificati, pronti per osm_poi_address.py ---
+def build_geometry_store():
+    try:
+        NeighborhoodStore(store_path(OUTPUT_JSON)).build(OUTPUT_JSON, SIMPLIFY_M)
+    except Exception as e:
+        print(f"❌ Errore preparazione geometrie quartieri: {e}")
+
 
 # --- Lista server Overpass pubblici ---
 OVERPASS_SERVERS = [
@@ -23,13 +61,21 @@ OVERPASS_SERVERS = [
 ]
 
 # --- Funzione POST con retry e gestione risposta vuota ---
-def post_with_retry(servers, query, retries=3, wait=5):
+# Con path la risposta viene scritta su file in streaming invece di essere tenuta in memoria.
+def post_with_retry(servers, query, retries=3, wait=5, path=None):
     last_error = None
     for server in servers:
         for attempt in range(retries):
             try:
                 print(f"Richiesta a {server}, tentativo {attempt+1}/{retries}")
-                response = requests.post(server, data={"data": query}, timeout=300)
+                response = requests.post(server, data={"data": query}, timeout=300, stream=path is not None)
+                if path is not None:
+                    # in streaming la connessione va rilasciata anche se lo stato HTTP è un errore
+                    with response:
+                        response.raise_for_status()
+                        save_response(response, path)
+                    raise_for_remark_file(path)
+                    return response
                 response.raise_for_status()
                 if not response.text.strip():
                     raise Exception("Risposta vuota dal server")
@@ -40,6 +86,86 @@ def post_with_retry(servers, query, retries=3, wait=5):
                 time.sleep(wait)
     raise Exception(f"Tutti i server falliti: {last_error}")
 
+# --- Client hedged opzionale (--hedged, richiede aiohttp) ---
+HEDGED_CLIENT = None
+if "hedged" in OPTIONS:
+    if AIOHTTP_AVAILABLE:
+        HEDGED_CLIENT = HedgedOverpassClient(OVERPASS_SERVERS)
+    else:
+        print("aiohttp non installato, --hedged ignorato")
+
+# --- Cache delle risposte, solo se richiesta (--use-cache, --refresh, --cache-dir=DIR,
+# --cache-ttl=SECONDI, default 24 h): senza, ogni esecuzione interroga Overpass ---
+CACHE = cache_from_options(OPTIONS)
+print(describe_cache(CACHE))
+
+def fetch_json(query):
+    """Esegue la query e restituisce il JSON della risposta (dalla cache o hedged se attivi)."""
+    if CACHE:
+        cached = CACHE.get(query)
+        if cached is not None:
+            print("Risposta letta dalla cache")
+            return cached
+    if HEDGED_CLIENT:
+        data = HEDGED_CLIENT.fetch_sync(query)
+    else:
+        data = post_with_retry(OVERPASS_SERVERS, query).json()
+    print("Risposta scaricata da Overpass" + (" e salvata nella cache" if CACHE else ""))
+    if CACHE:
+        CACHE.put(query, data)
+    return data
+
+def fetch_to_file(query, path):
+    """
+    Come fetch_json, ma scrive la risposta direttamente in path senza decodificarla:
+    le risposte 'out geom' delle grandi città non passano mai per la memoria.
+    """
+    if CACHE:
+        cached_path = CACHE.get_path(query)
+        if cached_path:
+            print("Risposta letta dalla cache")
+            with gzip.open(cached_path, "rb") as src, open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            return
+    if HEDGED_CLIENT:
+        HEDGED_CLIENT.fetch_to_file_sync(query, path)
+    else:
+        post_with_retry(OVERPASS_SERVERS, query, path=path)
+    print("Risposta scaricata da Overpass" + (" e salvata nella cache" if CACHE else ""))
+    if CACHE:
+        CACHE.put_file(query, path)
+
+# --- Backend offline: estratto locale .osm.pbf / .osm(.xml) (--extract=FILE) ---
+# Stessi filtri di query_quartieri, valutati localmente; nessuna richiesta di rete.
+NEIGHBORHOOD_SELECTORS = [
+    'relation["boundary"="administrative"]["admin_level"~"9|10"]',
+    'relation["place"~"suburb|neighbourhood|quarter"]',
+    'way["place"~"suburb|neighbourhood|quarter"]',
+]
+
+EXTRACT_PATH = OPTIONS.get("extract")
+if EXTRACT_PATH:
+    from slkb_osm_overpass.extract import OsmExtract
+
+    elements = OsmExtract(EXTRACT_PATH, geom_selectors=NEIGHBORHOOD_SELECTORS).elements(CITY_CAPITALIZED)
+    if elements is None:
+        print(f"Comune '{CITY_CAPITALIZED}' non trovato nell'estratto {EXTRACT_PATH}.")
+        with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
+            json.dump({"error": "Comune non trovato", "quartieri_trovati": 0}, f, ensure_ascii=False, indent=2)
+        sys.exit(0)
+    with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
+        json.dump({"generator": "slkb_osm_overpass.extract", "elements": elements}, f, ensure_ascii=False, indent=2)
+    print(f"File salvato in '{OUTPUT_JSON}' con {len(elements)} elementi.")
+    build_geometry_store()
+
+    if WITH_ADDRESSES:
+        addresses = OsmExtract(EXTRACT_PATH, center_selectors=ADDRESS_CENTER_SELECTORS,
+                               geom_selectors=STREET_GEOM_SELECTORS).elements(CITY_CAPITALIZED)
+        with open(ADDRESSES_JSON, "w", encoding="utf-8") as f:
+            json.dump({"generator": "slkb_osm_overpass.extract", "elements": addresses}, f, ensure_ascii=False)
+        print(f"Indirizzi salvati in '{ADDRESSES_JSON}' con {len(addresses)} elementi.")
+    sys.exit(0)
+
 # --- Query per la relation del comune ---
 query_relation = f"""
 [out:json][timeout:180];
@@ -49,8 +175,7 @@ out ids tags;
 
 # --- Ottieni la relation ---
 try:
-    response = post_with_retry(OVERPASS_SERVERS, query_relation)
-    data = response.json()
+    data = fetch_json(query_relation)
 except Exception as e:
     print(f"❌ Errore ottenimento relation: {e}")
     sys.exit(1)
@@ -80,19 +205,25 @@ map_to_area->.a;
 out geom;
 """
 
-# --- Esegui query quartieri ---
+# --- Esegui query quartieri, salvando direttamente il JSON raw in streaming ---
 try:
-    response = post_with_retry(OVERPASS_SERVERS, query_quartieri)
-    data = response.json()
+    fetch_to_file(query_quartieri, OUTPUT_JSON)
 except Exception as e:
     print(f"Errore ottenimento quartieri: {e}")
     with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
         json.dump({"error": str(e), "quartieri_trovati": 0}, f, ensure_ascii=False, indent=2)
     sys.exit(1)
 
-# --- Salva direttamente il JSON raw ---
-with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-    json.dump(data, f, ensure_ascii=False, indent=2)
+print(f"File salvato in '{OUTPUT_JSON}' con {count_elements_file(OUTPUT_JSON)} elementi.")
+build_geometry_store()
 
-elements = data.get("elements", [])
-print(f"File salvato in '{OUTPUT_JSON}' con {len(elements)} elementi.")
+# --- Dati indirizzo per il geocoder locale (--addresses) ---
+if WITH_ADDRESSES:
+    try:
+        fetch_to_file(address_query(f"relation({relation_id});\nmap_to_area->.a;"), ADDRESSES_JSON)
+        print(f"Indirizzi salvati in '{ADDRESSES_JSON}' con {count_elements_file(ADDRESSES_JSON)} elementi.")
+    except Exception as e:
+        print(f"❌ Errore ottenimento indirizzi: {e}")
+
+if CACHE:
+    print(CACHE.report())
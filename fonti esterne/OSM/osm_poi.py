@@ -7,14 +7,39 @@ classifica secondo la tassonomia fornita e genera:
  - osm_poi_<citta>.json
 
 Mantiene tutte le funzionalità degli script originali, con limite globale sui POI.
+
+Uso:
+    python osm_poi.py <CITTÀ> [MAX_POI] [SOLO_CON_LINK] [--union[=N]] [--tiled] [--hedged]
+        [--extract=FILE] [--incremental] [--format=json|parquet|both]
+        [--use-cache|--refresh|--offline] [--cache-dir=DIR] [--cache-ttl=SECONDI]
+
+Cache delle risposte Overpass: disattivata di default, ogni esecuzione interroga
+Overpass. Con --use-cache le risposte salvate vengono riusate finché hanno meno di
+--cache-ttl secondi (default 24 h): i dati possono quindi essere vecchi fino a un
+giorno. --refresh scarica e salva senza leggere la cache, --offline rilegge solo le
+risposte registrate. Ogni esecuzione stampa la modalità della cache, e per ogni query
+se la risposta viene dalla cache o da Overpass.
 """
 
 import requests
 import time
-import json
-import uuid
 import sys
-from html import unescape
+import os
+import tempfile
+from itertools import islice
+
+sys.path.append(r"packages")
+from slkb_osm_overpass.query import chunk_selectors, union_body, route_elements
+from slkb_osm_overpass.response import OverpassTimeout, raise_for_timeout_status
+from slkb_osm_overpass.stream import save_response, raise_for_remark_file, iter_elements_file, read_osm_base
+from slkb_osm_overpass.incremental import (load_state, save_state, newer_filter, merge_changes,
+                                           append_changes, reset_changes)
+from slkb_osm_overpass.tiles import fetch_tiled, bbox_filter
+from slkb_osm_overpass.client import HedgedOverpassClient, AIOHTTP_AVAILABLE
+from slkb_osm_overpass.cache import cache_from_options, describe_cache
+from slkb_osm_overpass.classify import TagClassifier
+from slkb_osm_store.identity import stable_poi_id
+from slkb_osm_store.columnar import output_format, write_pois, read_pois, pois_exist, parquet_path
 
 # ---------- CONFIG ----------
 OVERPASS_SERVERS = [
@@ -26,23 +51,33 @@ RETRY = 5
 SLEEP_BETWEEN_RETRY = 10  # seconds
 SLEEP_BETWEEN_QUERIES = 5  # secondi tra query successive
 
-if len(sys.argv) < 2:
+# Opzioni "--nome" / "--nome=valore", ammesse in qualsiasi posizione
+OPTIONS = {}
+for arg in sys.argv[1:]:
+    if arg.startswith("--"):
+        opt_name, _, opt_value = arg[2:].partition("=")
+        OPTIONS[opt_name] = opt_value
+ARGS = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+
+if len(ARGS) < 1:
     print("Errore: devi specificare una città.")
     sys.exit(1)
 
-CITY_NAME = sys.argv[1]
+CITY_NAME = ARGS[0]
 CITY_CAPITALIZED = " ".join(word.capitalize() for word in CITY_NAME.split())
 city_slug = CITY_CAPITALIZED.lower().replace(" ", "_")
 OUTPUT_JSON = f"{city_slug}_osm_poi.json"
+# --format=json|parquet|both: Parquet (<citta>_osm_poi.parquet) con categorie a dizionario
+OUTPUT_FORMAT = output_format(sys.argv)
 
 # valori di default:
 # MAX_POI = 0 (illimitato)
 # FILTER_ONLY_WITH_LINKS = False (non limitato ai soli poi con web url
 
 # MAX_POI (opzionale)
-if len(sys.argv) > 2:
+if len(ARGS) > 1:
     try:
-        MAX_POI = int(sys.argv[2])
+        MAX_POI = int(ARGS[1])
     except ValueError:
         print("MAX_POI non valido, uso il default")
         MAX_POI = 0
@@ -50,15 +85,57 @@ else:
     MAX_POI = 0
 
 # FILTER_ONLY_WITH_LINKS (opzionale)
-if len(sys.argv) > 3:
+if len(ARGS) > 2:
     try:
-      FILTER_ONLY_WITH_LINKS = sys.argv[3].lower() in ("1", "true", "yes")
+      FILTER_ONLY_WITH_LINKS = ARGS[2].lower() in ("1", "true", "yes")
     except ValueError:
         print("FILTER_ONLY_WITH_LINKS non valido, uso il default")
         FILTER_ONLY_WITH_LINKS = False
 else:
     FILTER_ONLY_WITH_LINKS = False
 
+# --union[=N]: compila i selettori in query unione (N = max selettori per query, 0 = tutti)
+UNION_MODE = "union" in OPTIONS
+try:
+    UNION_MAX_SELECTORS = int(OPTIONS.get("union") or 0)
+except ValueError:
+    print("--union=N non valido, uso un'unica query")
+    UNION_MAX_SELECTORS = 0
+
+# --tiled: scarica per tile a quadtree sul bbox del comune (utile per Roma, Napoli, ...)
+# --tile-workers=N: numero massimo di tile in volo contemporaneamente
+TILED_MODE = "tiled" in OPTIONS
+try:
+    TILE_WORKERS = max(1, int(OPTIONS.get("tile-workers") or 2))
+except ValueError:
+    print("--tile-workers=N non valido, uso il default")
+    TILE_WORKERS = 2
+TILE_MIN_DEG = 0.005  # lato minimo del tile (~500 m) sotto il quale non si divide più
+TILE_MAXSIZE = 268435456  # 256 MB: oltre, Overpass rifiuta il tile che va quindi diviso
+
+# --hedged: client asincrono che interroga i mirror in parallelo (hedging) e privilegia il più sano
+HEDGED_CLIENT = None
+if "hedged" in OPTIONS:
+    if AIOHTTP_AVAILABLE:
+        HEDGED_CLIENT = HedgedOverpassClient(OVERPASS_SERVERS)
+    else:
+        print("aiohttp non installato, --hedged ignorato")
+
+# --extract=FILE: legge i POI da un estratto locale .osm.pbf / .osm(.xml) invece che da Overpass
+EXTRACT_PATH = OPTIONS.get("extract")
+
+# Cache delle risposte Overpass, solo se richiesta (--use-cache, --refresh, --cache-dir=DIR,
+# --cache-ttl=SECONDI, default 24 h); --offline: usa solo risposte già registrate nella
+# cache, anche se scadute (replay senza rete)
+CACHE = cache_from_options(OPTIONS)
+OFFLINE_MODE = bool(CACHE and CACHE.offline)
+
+# --incremental: scarica solo gli elementi modificati dall'ultima estrazione (stato in <citta>_osm_state.json)
+INCREMENTAL_MODE = "incremental" in OPTIONS
+
+# timestamp osm_base delle risposte usate in questa esecuzione: il minimo diventa il nuovo stato
+OSM_BASE_TIMESTAMPS = []
+
 
 # ---------- MAPPATURE ----------
 OSM_TO_TOURISM = {
@@ -108,6 +185,18 @@ OSM_TO_PERSISTENT = {
 
 TAG_PRIORITY = ["amenity", "shop", "tourism", "leisure", "public_transport", "highway", "railway", "natural"]
 
+# Tag ICCD: questi elementi sono gestiti dalla pipeline ICCD e non diventano POI
+ICCD_TAGS = [
+    ("historic","monument"), ("historic","archaeological_site"),
+    ("historic","castle"), ("historic","palace"), ("historic","city_gate"),
+    ("historic","ruins"), ("building","church"), ("building","cathedral"),
+    ("building","monastery"), ("tourism","museum")
+]
+
+# Tabelle compilate una volta sola per la classificazione a lotti (process_elements)
+CLASSIFIER = TagClassifier(TAG_PRIORITY, OSM_TO_TOURISM, OSM_TO_PERSISTENT, ICCD_TAGS)
+CLASSIFY_BATCH_SIZE = 5000  # elementi per lotto: la memoria resta limitata anche sulle risposte in streaming
+
 OUTPUT_FIELDS = [
     "poi_id","nome_poi","categoria_persistente","categoria_turistica","tag_k3",
     "autore_compilazione","data_compilazione","citta_comune","quartiere_area_urbana",
@@ -126,6 +215,42 @@ area["name"="{city}"]["boundary"="administrative"]["admin_level"="8"]->.a;
 out center;
 '''
 
+# Variante unione: l'area del comune viene risolta una sola volta per tutti i selettori
+UNION_TEMPLATE = '''
+[out:json][timeout:180];
+area["name"="{city}"]["boundary"="administrative"]["admin_level"="8"]->.a;
+(
+{body}
+);
+out center;
+'''
+
+# Variante a tile: stessa area, ristretta al bbox del tile
+TILE_TEMPLATE = '''
+[out:json][timeout:90][maxsize:{maxsize}];
+area["name"="{city}"]["boundary"="administrative"]["admin_level"="8"]->.a;
+(
+{body}
+);
+out center;
+'''
+
+# Solo gli id degli elementi oggi presenti: serve a individuare quelli rimossi
+IDS_TEMPLATE = '''
+[out:json][timeout:180];
+area["name"="{city}"]["boundary"="administrative"]["admin_level"="8"]->.a;
+(
+{body}
+);
+out ids;
+'''
+
+BBOX_QUERY = '''
+[out:json][timeout:60];
+relation["name"="{city}"]["boundary"="administrative"]["admin_level"="8"];
+out tags bb;
+'''
+
 # ---------- LISTA POI/TAG ----------  
 POI_QUERIES = [
 
@@ -176,34 +301,80 @@ POI_QUERIES = [
 
 
 # ---------- HELPERS ----------    
-def run_overpass_query(query):
+def run_overpass_query(query, raise_on_timeout=False, refresh=False):
     """
     Tenta la query su tutti i server alternativi finché non va a buon fine.
+    La risposta viene scritta su disco in streaming e restituita come iteratore
+    sugli elementi, letti uno alla volta: la memoria non cresce con la città.
+    Con raise_on_timeout=True una query troppo pesante (timeout/memoria) solleva subito
+    OverpassTimeout e il fallimento di tutti i server solleva un'eccezione invece di
+    restituire una lista vuota: serve al fetch a tile per decidere se dividere.
+    Le risposte complete sono lette e salvate nella cache su disco, se attiva.
+    Con refresh=True la cache non viene letta (la risposta deve riflettere lo stato
+    attuale, es. l'aggiornamento incrementale) ma la nuova risposta vi è salvata.
     """
+    if CACHE:
+        cached_path = None if refresh else CACHE.get_path(query)
+        if cached_path:
+            print("Risposta letta dalla cache")
+            OSM_BASE_TIMESTAMPS.append(read_osm_base(cached_path))
+            return iter_elements_file(cached_path)
+        if OFFLINE_MODE:
+            print("❌ Risposta aggiornata non disponibile (--offline)" if refresh
+                  else "❌ Risposta non presente nella cache (--offline)")
+            if raise_on_timeout:
+                raise Exception("Risposta non presente nella cache (--offline)")
+            return []
+
+    fd, tmp_path = tempfile.mkstemp(prefix="overpass_", suffix=".json")
+    os.close(fd)
+
+    def completed():
+        OSM_BASE_TIMESTAMPS.append(read_osm_base(tmp_path))
+        if CACHE:
+            CACHE.put_file(query, tmp_path)
+        print("Risposta scaricata da Overpass" + (" e salvata nella cache" if CACHE else ""))
+        time.sleep(SLEEP_BETWEEN_QUERIES)  # riduce frequenza query
+        return iter_elements_file(tmp_path, delete=True)
+
+    if HEDGED_CLIENT:
+        try:
+            HEDGED_CLIENT.fetch_to_file_sync(query, tmp_path)
+        except Exception as e:
+            os.remove(tmp_path)
+            print(f"❌ Tutti i server hanno fallito per questa query: {e}")
+            if raise_on_timeout:
+                raise
+            return []
+        return completed()
+
     for server in OVERPASS_SERVERS:
         for attempt in range(1, RETRY+1):
             try:
-                resp = requests.post(server, data={"data": query}, timeout=180)
-                resp.raise_for_status()
+                with requests.post(server, data={"data": query}, timeout=180, stream=True) as resp:
+                    raise_for_timeout_status(resp.status_code)
+                    resp.raise_for_status()
+                    save_response(resp, tmp_path)
+                raise_for_remark_file(tmp_path)
                 print(f"Query eseguita con successo su {server}")
-                time.sleep(SLEEP_BETWEEN_QUERIES)  # riduce frequenza query
-                return resp.json().get("elements", [])
+                return completed()
+            except OverpassTimeout as e:
+                if raise_on_timeout:
+                    os.remove(tmp_path)
+                    raise
+                print(f"Tentativo {attempt} su {server}: query troppo pesante ({e})")
+                time.sleep(SLEEP_BETWEEN_RETRY)
             except Exception as e:
                 print(f"Tentativo {attempt} su {server} fallito: {e}")
                 time.sleep(SLEEP_BETWEEN_RETRY)
         print(f"Server {server} non ha risposto correttamente, passo al successivo...")
+    os.remove(tmp_path)
     print("❌ Tutti i server hanno fallito per questa query.")
+    if raise_on_timeout:
+        raise Exception("Tutti i server hanno fallito per questa query")
     return []
     
 
-def normalize_name(tags):
-    name = tags.get("name")
-    if name:
-        return unescape(name).strip()
-    key = next((k for k in TAG_PRIORITY if k in tags), None)
-    val = tags.get(key) if key else None
-    return val.capitalize() if val else "POI senza nome"
-
 def build_k3_tags(tags):
     """
     Seleziona fino a 5 tag utili per arricchire l'esperienza turistica,
@@ -245,96 +416,221 @@ def build_k3_tags(tags):
 
     return candidates[:5]
 
-def pick_tag_priority(tags):
-    for key in TAG_PRIORITY:
-        if key in tags:
-            return key, tags[key]
-    return None, None
-
-def map_to_tourism(tags):
-    key, val = pick_tag_priority(tags)
-    return OSM_TO_TOURISM.get((key,val), "Altro / Generico")
-
-def map_to_persistent(tags):
-    key, val = pick_tag_priority(tags)
-    return OSM_TO_PERSISTENT.get((key,val), f"{key}:{val}" if key else "Altro")
-
-def is_iccd_poi(tags):
-    iccd_tags = [
-        ("historic","monument"), ("historic","archaeological_site"),
-        ("historic","castle"), ("historic","palace"), ("historic","city_gate"),
-        ("historic","ruins"), ("building","church"), ("building","cathedral"),
-        ("building","monastery"), ("tourism","museum")
-    ]
-    for k,v in iccd_tags:
-        if tags.get(k) == v:
-            return True
-    return False
-
-def process_elements(elements):
-    rows = []
-    for el in elements:
-        tags = el.get("tags", {}) or {}
-        if FILTER_ONLY_WITH_LINKS and ("wikidata" not in tags and "wikipedia" not in tags):
-            continue
-        if is_iccd_poi(tags):
-            continue
-        lat = el.get("lat") or el.get("center", {}).get("lat")
-        lon = el.get("lon") or el.get("center", {}).get("lon")
-        if lat is None or lon is None:
-            continue
-        poi = {
-            "poi_id": str(uuid.uuid4()),
-            "osm_type": el.get("type", ""),
-            "osm_id": el.get("id", ""),
-            "nome_poi": normalize_name(tags),
-            "categoria_persistente": map_to_persistent(tags),
-            "categoria_turistica": map_to_tourism(tags),
-            "tag_k3": ";".join(build_k3_tags(tags)),
-            "autore_compilazione": "",
-            "data_compilazione": "",
-            "citta_comune": CITY_CAPITALIZED,
-            "quartiere_area_urbana": tags.get("addr:suburb",""),
-            "zona_turistica": "",
-            "sito_complesso_appartenenza": tags.get("is_in",""),
-            "distanza_landmark": "",
-            "storia_cronologia": "",
-            "architettura_arte_forma": "",
-            "rilevanza_culturale": "",
-            "curiosita": "",
-            "esperienza": "",
-            "atmosfera": "",
-            "relazione_con_il_luogo": "",
-            "orari": "",
-            "tipo_accesso": "",
-            "contatti": tags.get("contact:phone",""),
-            "sito_web": tags.get("website", tags.get("contact:website","")),
-            "durata_consigliata": "",
-            "attivita_consigliate": "",
-            "foto": tags.get("image",""),
-            "video": "",
-            "modello_3d": "",
-            "audio": "",
-            "latitudine": lat,
-            "longitudine": lon,
-            "tipo_geometria": "point",
-            "address": ", ".join([tags.get(k,"") for k in ("addr:street","addr:housenumber","addr:postcode","addr:city") if k in tags]),
-            "wikipedia": tags.get("wikipedia", ""),
-            "wikidata": tags.get("wikidata", ""),
-            "source": "OpenStreetMap (ODbL)"
-        }
-        rows.append(poi)
-    return rows
+def make_poi(osm_type, osm_id, tags, lat, lon, nome_poi, categoria_persistente, categoria_turistica):
+    """Record POI nel formato SLKB a partire da un elemento già classificato."""
+    return {
+        "poi_id": stable_poi_id("osm", osm_type, osm_id),
+        "osm_type": osm_type,
+        "osm_id": osm_id,
+        "nome_poi": nome_poi,
+        "categoria_persistente": categoria_persistente,
+        "categoria_turistica": categoria_turistica,
+        "tag_k3": ";".join(build_k3_tags(tags)),
+        "autore_compilazione": "",
+        "data_compilazione": "",
+        "citta_comune": CITY_CAPITALIZED,
+        "quartiere_area_urbana": tags.get("addr:suburb",""),
+        "zona_turistica": "",
+        "sito_complesso_appartenenza": tags.get("is_in",""),
+        "distanza_landmark": "",
+        "storia_cronologia": "",
+        "architettura_arte_forma": "",
+        "rilevanza_culturale": "",
+        "curiosita": "",
+        "esperienza": "",
+        "atmosfera": "",
+        "relazione_con_il_luogo": "",
+        "orari": "",
+        "tipo_accesso": "",
+        "contatti": tags.get("contact:phone",""),
+        "sito_web": tags.get("website", tags.get("contact:website","")),
+        "durata_consigliata": "",
+        "attivita_consigliate": "",
+        "foto": tags.get("image",""),
+        "video": "",
+        "modello_3d": "",
+        "audio": "",
+        "latitudine": lat,
+        "longitudine": lon,
+        "tipo_geometria": "point",
+        "address": ", ".join([tags.get(k,"") for k in ("addr:street","addr:housenumber","addr:postcode","addr:city") if k in tags]),
+        "wikipedia": tags.get("wikipedia", ""),
+        "wikidata": tags.get("wikidata", ""),
+        "source": "OpenStreetMap (ODbL)"
+    }
+
+def process_elements(elements, batch_size=CLASSIFY_BATCH_SIZE):
+    """
+    Classifica gli elementi con il motore a colonne (CLASSIFIER) e restituisce i
+    record POI, nell'ordine degli elementi. Gli elementi (anche un iteratore in
+    streaming da run_overpass_query) sono letti a lotti di batch_size: in memoria
+    restano solo il lotto corrente e il suo DataFrame, oltre ai POI prodotti.
+    """
+    elements = iter(elements)
+    pois = []
+    while True:
+        batch = list(islice(elements, batch_size))
+        if not batch:
+            return pois
+        pois.extend(_process_batch(batch))
+
+def _process_batch(elements):
+    frame = CLASSIFIER.classify(elements)
+    keep = ~frame["iccd"] & frame["lat"].notna() & frame["lon"].notna()
+    if FILTER_ONLY_WITH_LINKS:
+        keep &= frame["has_links"]
+    frame = frame[keep]
+
+    columns = ("type", "id", "tags", "lat", "lon", "nome_poi", "categoria_persistente", "categoria_turistica")
+    return [make_poi(*row) for row in zip(*(frame[c].tolist() for c in columns))]
+
+def fetch_union(selectors, max_per_query=0):
+    """
+    Esegue i selettori come una (o poche) query unione e smista lato client
+    gli elementi ricevuti verso il selettore di origine.
+    Genera coppie (selettore, elementi) nell'ordine dei selettori.
+    """
+    chunks = chunk_selectors(selectors, max_per_query)
+    for i, chunk in enumerate(chunks, 1):
+        query = UNION_TEMPLATE.format(city=CITY_CAPITALIZED, body=union_body(chunk))
+        print(f"Eseguo query unione {i}/{len(chunks)} ({len(chunk)} selettori) ...")
+        elements = list(run_overpass_query(query))
+        print(f"  Elementi ricevuti: {len(elements)}")
+        yield from route_elements(elements, chunk).items()
+
+def get_city_bbox():
+    """Bounding box (sud, ovest, nord, est) della relation amministrativa del comune."""
+    for el in run_overpass_query(BBOX_QUERY.format(city=CITY_CAPITALIZED)):
+        b = el.get("bounds")
+        if b:
+            return b["minlat"], b["minlon"], b["maxlat"], b["maxlon"]
+    return None
+
+def fetch_tiled_chunks(chunks):
+    """
+    Esegue ogni gruppo di selettori con il fetch adattivo a tile sul bbox del comune
+    e smista gli elementi deduplicati verso i rispettivi selettori.
+    Genera coppie (selettore, elementi) nell'ordine dei selettori.
+    """
+    bbox = get_city_bbox()
+    if not bbox:
+        print(f"❌ Bbox di {CITY_CAPITALIZED} non trovato, impossibile procedere a tile.")
+        return
+    print(f"Bbox {CITY_CAPITALIZED}: {bbox_filter(bbox)}")
+
+    def run_tile_query(query):
+        return run_overpass_query(query, raise_on_timeout=True)
+
+    for i, chunk in enumerate(chunks, 1):
+        def build_query(tile, chunk=chunk):
+            body = union_body(chunk, suffix=f"(area.a){bbox_filter(tile)}")
+            return TILE_TEMPLATE.format(city=CITY_CAPITALIZED, body=body, maxsize=TILE_MAXSIZE)
+
+        print(f"Eseguo query a tile {i}/{len(chunks)} ({len(chunk)} selettori) ...")
+        elements, failed = fetch_tiled(build_query, run_tile_query, bbox,
+                                       max_workers=TILE_WORKERS, min_tile_deg=TILE_MIN_DEG)
+        print(f"  Elementi ricevuti: {len(elements)}")
+        if failed:
+            print(f"⚠️ {len(failed)} tile non scaricati: i risultati di questo gruppo sono incompleti")
+        yield from route_elements(elements, chunk).items()
+
+def fetch_from_extract():
+    """
+    Valuta POI_QUERIES su un estratto OSM locale in un'unica passata
+    (l'indice dell'estratto è riusato per tutti i comuni che contiene).
+    Genera coppie (selettore, elementi) nell'ordine dei selettori.
+    """
+    from slkb_osm_overpass.extract import OsmExtract  # richiede shapely (e pyosmium per i .pbf)
 
-# ---------- MAIN ----------
-def main():
-    all_pois = []
-    for el_selector in POI_QUERIES:
+    extract = OsmExtract(EXTRACT_PATH, center_selectors=POI_QUERIES)
+    elements = extract.elements(CITY_CAPITALIZED)
+    if elements is None:
+        print(f"❌ Comune '{CITY_CAPITALIZED}' non trovato nell'estratto {EXTRACT_PATH}")
+        return
+    print(f"Elementi dall'estratto: {len(elements)}")
+    yield from route_elements(elements, POI_QUERIES).items()
+
+def fetch_by_selector():
+    """
+    Genera (selettore, elementi) per ogni voce di POI_QUERIES, nell'ordine della lista:
+    da estratto locale (--extract), una query per selettore, in modalità unione (--union)
+    e/o a tile (--tiled). Nella modalità base gli elementi sono un iteratore in streaming
+    sulla risposta, da consumare prima di passare al selettore successivo.
+    """
+    if EXTRACT_PATH:
+        return fetch_from_extract()
+
+    if TILED_MODE:
+        if UNION_MODE:
+            chunks = chunk_selectors(POI_QUERIES, UNION_MAX_SELECTORS)
+        else:
+            chunks = [[sel] for sel in POI_QUERIES]
+        return fetch_tiled_chunks(chunks)
+
+    if UNION_MODE:
+        return fetch_union(POI_QUERIES, UNION_MAX_SELECTORS)
+
+    return fetch_one_by_one(POI_QUERIES)
+
+def fetch_one_by_one(selectors):
+    """Una query Overpass per selettore, come negli script originali."""
+    for el_selector in selectors:
         query = TEMPLATE.format(city=CITY_CAPITALIZED, element_selector=el_selector)
         print(f"Eseguo query: {el_selector} ...")
-        elements = run_overpass_query(query)
+        yield el_selector, run_overpass_query(query)
+
+def incremental_update():
+    """
+    Aggiorna il dataset dell'ultima esecuzione scaricando solo gli elementi modificati
+    dal timestamp salvato (filtro newer:) e gli id oggi presenti (per le rimozioni).
+    Restituisce (POI aggiornati, modifiche) oppure None se serve l'estrazione completa.
+    """
+    state = load_state(city_slug)
+    since = state.get("timestamp_osm_base")
+    if not since or not pois_exist(OUTPUT_JSON):
+        print("Nessuna estrazione precedente: eseguo l'estrazione completa.")
+        return None
+    if MAX_POI > 0 or EXTRACT_PATH:
+        print("--incremental richiede MAX_POI=0 e Overpass: eseguo l'estrazione completa.")
+        return None
+
+    previous = read_pois(OUTPUT_JSON)
+
+    try:
+        print("Elenco degli elementi presenti ...")
+        ids_query = IDS_TEMPLATE.format(city=CITY_CAPITALIZED, body=union_body(POI_QUERIES))
+        # mai dalla cache: id o modifiche vecchi scarterebbero i POI nuovi e terrebbero i rimossi
+        current_keys = {(el["type"], el["id"])
+                        for el in run_overpass_query(ids_query, raise_on_timeout=True, refresh=True)}
+
+        print(f"Elementi modificati dal {since} ...")
+        body = union_body(POI_QUERIES, suffix="(area.a)" + newer_filter(since))
+        newer_query = UNION_TEMPLATE.format(city=CITY_CAPITALIZED, body=body)
+        changed_elements = list(run_overpass_query(newer_query, raise_on_timeout=True, refresh=True))
+    except Exception as e:
+        print(f"❌ Aggiornamento incrementale non riuscito ({e}): eseguo l'estrazione completa.")
+        return None
+
+    # stessi criteri dell'estrazione completa: ordine dei selettori, primo selettore vince
+    changed_keys = {(el["type"], el["id"]) for el in changed_elements}
+    changed_pois, seen = [], set()
+    for el_selector, elements in route_elements(changed_elements, POI_QUERIES).items():
+        for poi in process_elements(elements):
+            key = (poi["osm_type"], poi["osm_id"])
+            if key not in seen:
+                seen.add(key)
+                changed_pois.append(poi)
+
+    pois, changed_ids, removed_ids = merge_changes(previous, changed_keys, changed_pois, current_keys)
+    print(f"  POI modificati o nuovi: {len(changed_ids)}, rimossi: {len(removed_ids)}")
+    return pois, {"since": since, "changed": changed_ids, "removed": removed_ids}
+
+def full_extraction():
+    """Estrazione completa: tutti i selettori, deduplica e selezione round-robin fino a MAX_POI."""
+    all_pois = []
+    for el_selector, elements in fetch_by_selector():
         processed = process_elements(elements)
-        print(f"  POI trovati: {len(processed)}")
+        print(f"  {el_selector} → POI trovati: {len(processed)}")
         all_pois.extend(processed)
 
     # 🔹 Deduplica per osm_type e osm_id        
@@ -364,11 +660,39 @@ def main():
             if not pois_by_category[cat]:  # rimuovi categoria vuota
                 categories_with_pois.remove(cat)
 
-    # Salva output
-    with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-        json.dump(unique_pois, f, ensure_ascii=False, indent=2)
+    return unique_pois
 
-    print(f"Output creato: {OUTPUT_JSON} ({len(unique_pois)} POI)")
+# ---------- MAIN ----------
+def main():
+    print(describe_cache(CACHE))
+    result = incremental_update() if INCREMENTAL_MODE else None
+    if result is not None:
+        unique_pois, changes = result
+    else:
+        unique_pois, changes = full_extraction(), None
+
+    # Salva output
+    write_pois(OUTPUT_JSON, unique_pois, OUTPUT_FORMAT)
+    output_path = parquet_path(OUTPUT_JSON) if OUTPUT_FORMAT == "parquet" else OUTPUT_JSON
+    print(f"Output creato: {output_path} ({len(unique_pois)} POI)")
+
+    # Stato per il prossimo aggiornamento incrementale (non disponibile da estratto locale)
+    timestamps = [t for t in OSM_BASE_TIMESTAMPS if t]
+    until = min(timestamps) if timestamps and not EXTRACT_PATH else None
+    if until:
+        save_state(city_slug, {"timestamp_osm_base": until})
+
+    # Modifiche per gli stadi successivi, accumulate finché ogni stadio non le elabora;
+    # dopo un'estrazione completa va rielaborato tutto
+    if changes is not None:
+        append_changes(city_slug, {**changes, "until": until})
+    else:
+        reset_changes(city_slug)
+    if HEDGED_CLIENT:
+        print("Stato mirror Overpass:")
+        print(HEDGED_CLIENT.report())
+    if CACHE:
+        print(CACHE.report())
     
 if __name__ == "__main__":
     main()    
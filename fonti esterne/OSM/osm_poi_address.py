@@ -1,18 +1,23 @@
-import json
 import csv
-import time
-import requests
 import os
 import sys
-from shapely.geometry import Point, Polygon
-from shapely.errors import ShapelyError
-from shapely.ops import unary_union
+
+sys.path.append(r"packages")
+from slkb_osm_overpass.incremental import input_version, load_changes, mark_processed, reusable_outputs
+from slkb_osm_store.identity import file_fingerprint
+from slkb_osm_store.memo import StageMemo, memo_path
+from slkb_osm_store.columnar import output_format, read_pois, write_pois
+from slkb_osm_geo.geometry_store import load_neighborhoods, DEFAULT_SIMPLIFY_M
+from slkb_osm_geo.hierarchy import AreaHierarchy
+from slkb_osm_geo.nominatim_cache import geocache_from_argv
+from slkb_osm_geo.local_geocoder import LocalGeocoder, DEFAULT_MAX_DISTANCE_M
+from slkb_osm_geo.nominatim import AsyncNominatimClient, NominatimClient, PUBLIC_NOMINATIM_URL
 
 # ----------------------------
 # Parametri da riga di comando
 # ----------------------------
 if len(sys.argv) < 2:
-    print("Uso: python enrich_osm_poi.py <NOME_COMUNE> [--use-cache|--no-cache]")
+    print("Uso: python enrich_osm_poi.py <NOME_COMUNE> [--use-cache|--no-cache] [--geocache=FILE] [--geocache-grid=METRI] [--geocache-ttl=SECONDI] [--local-geocoder[=METRI]] [--simplify=METRI] [--lookup] [--nominatim-url=URL] [--nominatim-rate=RICHIESTE_AL_SECONDO[:BURST]] [--nominatim-concurrency=N] [--incremental] [--no-memo] [--format=json|parquet|both]")
     sys.exit(1)
 
 CITY_NAME = sys.argv[1]
@@ -20,6 +25,31 @@ CITY_CAPITALIZED = " ".join(word.capitalize() for word in CITY_NAME.split())
 city_slug = CITY_CAPITALIZED.lower().replace(" ", "_")
 
 USE_CACHE = "--no-cache" not in sys.argv  # di default usa la cache
+# --local-geocoder[=METRI]: indirizzi dal file <citta>_addresses.json (osm_neighborhood.py --addresses)
+# entro METRI (default 30), Nominatim solo per i punti senza indirizzi vicini
+LOCAL_GEOCODER_ARG = next((a for a in sys.argv if a.split("=", 1)[0] == "--local-geocoder"), None)
+
+# --simplify=METRI: tolleranza di semplificazione dei poligoni dei quartieri (default 2, 0 = nessuna)
+try:
+    SIMPLIFY_M = float(next((a.split("=", 1)[1] for a in sys.argv if a.startswith("--simplify=")), DEFAULT_SIMPLIFY_M))
+except ValueError:
+    print("--simplify non valido, uso il default")
+    SIMPLIFY_M = DEFAULT_SIMPLIFY_M
+
+# --lookup: indirizzi con /lookup per osm_type/osm_id (50 POI per richiesta), reverse solo per i mancanti
+USE_LOOKUP = "--lookup" in sys.argv
+NOMINATIM_URL = next((a.split("=", 1)[1] for a in sys.argv if a.startswith("--nominatim-url=")), PUBLIC_NOMINATIM_URL)
+# --nominatim-rate=R[:BURST] / --nominatim-concurrency=N: client asincrono per istanze self-hosted,
+# con R richieste al secondo (token bucket) e al più N richieste in parallelo
+NOMINATIM_RATE = next((a.split("=", 1)[1] for a in sys.argv if a.startswith("--nominatim-rate=")), None)
+NOMINATIM_CONCURRENCY = next((a.split("=", 1)[1] for a in sys.argv if a.startswith("--nominatim-concurrency=")), None)
+
+INCREMENTAL = "--incremental" in sys.argv  # rielabora solo i POI modificati (osm_poi.py --incremental)
+USE_MEMO = "--no-memo" not in sys.argv  # riusa l'output dei POI già arricchiti con lo stesso input
+OUTPUT_FORMAT = output_format(sys.argv)  # l'input è letto nel formato più recente disponibile
+
+# Versione dello stadio: va incrementata quando cambia la logica di arricchimento
+STAGE_VERSION = "3"
 
 # ----------------------------
 # Config dinamica
@@ -27,9 +57,8 @@ USE_CACHE = "--no-cache" not in sys.argv  # di default usa la cache
 INPUT_JSON = f"{city_slug}_osm_poi.json"
 OUTPUT_JSON = f"{city_slug}_osm_address.json"
 QUARTIERI_JSON = f"{city_slug}_neighborhood.json"
-CACHE_FILE = f"{city_slug}_nominatim_cache.json"
-
-NOMINATIM_URL = "https://nominatim.openstreetmap.org/reverse"
+ADDRESSES_JSON = f"{city_slug}_addresses.json"
+LEGACY_CACHE_FILE = f"{city_slug}_nominatim_cache.json"  # vecchia cache JSON, importata se presente
 
 print(f"Comune: {CITY_CAPITALIZED}")
 print(f"Input: {INPUT_JSON}")
@@ -40,45 +69,63 @@ print(f"Cache: {'attiva' if USE_CACHE else 'disattivata'}")
 # ----------------------------
 # Cache Nominatim
 # ----------------------------
-if USE_CACHE and os.path.exists(CACHE_FILE):
-    with open(CACHE_FILE, "r", encoding="utf-8") as f:
-        NOMINATIM_CACHE = json.load(f)
-else:
-    NOMINATIM_CACHE = {}
+# SQLite condivisa tra le città, chiavi agganciate a una griglia di ~10 m
+NOMINATIM_CACHE = geocache_from_argv(sys.argv) if USE_CACHE else None
+if NOMINATIM_CACHE:
+    imported = NOMINATIM_CACHE.import_json(LEGACY_CACHE_FILE)
+    if imported:
+        print(f"Importate {imported} voci da {LEGACY_CACHE_FILE}")
+
+def nominatim_client():
+    """Client sincrono (1 richiesta/s) o, con --nominatim-rate/--nominatim-concurrency, asincrono."""
+    if NOMINATIM_RATE is None and NOMINATIM_CONCURRENCY is None:
+        return NominatimClient(NOMINATIM_URL, cache=NOMINATIM_CACHE)
+    try:
+        rate, _, burst = (NOMINATIM_RATE or "1").partition(":")
+        rate, burst = float(rate), int(burst or max(1, float(rate)))
+        concurrency = int(NOMINATIM_CONCURRENCY or max(1, burst))
+    except ValueError:
+        print("--nominatim-rate/--nominatim-concurrency non validi, uso il client sincrono")
+        return NominatimClient(NOMINATIM_URL, cache=NOMINATIM_CACHE)
+    try:
+        return AsyncNominatimClient(NOMINATIM_URL, cache=NOMINATIM_CACHE,
+                                    rates={NOMINATIM_URL.rstrip("/"): (rate, burst)}, concurrency=concurrency)
+    except ImportError:
+        print("aiohttp non installato: uso il client sincrono")
+        return NominatimClient(NOMINATIM_URL, cache=NOMINATIM_CACHE)
 
-def save_cache():
-    if USE_CACHE:
-        with open(CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(NOMINATIM_CACHE, f, ensure_ascii=False, indent=2)
+
+NOMINATIM = nominatim_client()
+ASYNC_NOMINATIM = isinstance(NOMINATIM, AsyncNominatimClient)
+
+# ----------------------------
+# Geocoder locale (opzionale)
+# ----------------------------
+LOCAL_GEOCODER = None
+if LOCAL_GEOCODER_ARG:
+    if os.path.exists(ADDRESSES_JSON):
+        try:
+            max_distance = float(LOCAL_GEOCODER_ARG.split("=", 1)[1]) if "=" in LOCAL_GEOCODER_ARG else DEFAULT_MAX_DISTANCE_M
+        except ValueError:
+            print("--local-geocoder: distanza non valida, uso il default")
+            max_distance = DEFAULT_MAX_DISTANCE_M
+        LOCAL_GEOCODER = LocalGeocoder.from_file(ADDRESSES_JSON, max_distance_m=max_distance)
+        print(LOCAL_GEOCODER.report())
+    else:
+        print(f"{ADDRESSES_JSON} non trovato (osm_neighborhood.py --addresses): uso solo Nominatim")
+
+# Reverse geocoding già tentato e fallito (client asincrono): da non ritentare né memorizzare
+GEOCODE_FAILED = object()
 
 def reverse_geocode(lat, lon):
-    key = f"{lat},{lon}"
-
-    # Usa la cache solo se abilitata
-    if USE_CACHE and key in NOMINATIM_CACHE:
-        return NOMINATIM_CACHE[key]
-
-    params = {
-        "lat": lat,
-        "lon": lon,
-        "format": "json",
-        "addressdetails": 1,
-        "accept-language": "it"
-    }
-    url = NOMINATIM_URL + "?" + requests.compat.urlencode(params)
-    time.sleep(1)
-    try:
-        r = requests.get(url, headers={"User-Agent": "SLKB-Geocoder"})
-        if r.status_code == 200:
-            data = r.json()
-            if USE_CACHE:
-                NOMINATIM_CACHE[key] = data
-                save_cache()
-            return data
-        return None
-    except Exception as e:
-        print(f"❌ Errore Nominatim per {lat},{lon}: {e}")
-        return None
+    # Prima il geocoder locale, Nominatim solo se non c'è un indirizzo abbastanza vicino
+    if LOCAL_GEOCODER:
+        local = LOCAL_GEOCODER.reverse(lat, lon)
+        if local is not None:
+            return local
+
+    # Nominatim con cache (se abilitata) e una richiesta al secondo
+    return NOMINATIM.reverse(lat, lon)
 
 def estrai_address(addr):
     if not addr:
@@ -92,119 +139,52 @@ def estrai_address(addr):
 # ----------------------------
 # Carica e normalizza quartieri
 # ----------------------------
-def load_quartieri(path_json):
-    with open(path_json, "r", encoding="utf-8") as f:
-        raw = json.load(f)
-
-    elements = raw.get("elements", [])
-    quartieri_poligoni = []
-
-    print(f"Trovati {len(elements)} elementi raw Overpass")
-
-    def safe_polygon(coords):
-        try:
-            poly = Polygon(coords)
-            if not poly.is_valid:
-                poly = poly.buffer(0)
-            return poly if poly.is_valid else None
-        except ShapelyError:
-            return None
-
-    for el in elements:
-        nome = el.get("tags", {}).get("name", "unknown").strip() or "unknown"
-        geom = None
-
-        if el["type"] == "way" and "geometry" in el:
-            coords = [(n["lon"], n["lat"]) for n in el["geometry"]]
-            if len(coords) >= 4:
-                geom = safe_polygon(coords)
-
-        elif el["type"] == "relation":
-            polys = []
-            for member in el.get("members", []):
-                if member["type"] == "way" and "geometry" in member:
-                    coords = [(n["lon"], n["lat"]) for n in member["geometry"]]
-                    if len(coords) >= 4:
-                        p = safe_polygon(coords)
-                        if p:
-                            polys.append(p)
-            if polys:
-                try:
-                    geom = unary_union(polys)
-                    if not geom.is_valid:
-                        geom = geom.buffer(0)
-                except ShapelyError:
-                    geom = None
-
-        if geom:
-            quartieri_poligoni.append((nome, geom))
-        else:
-            print(f"Ignorata feature {nome}, geometria non valida")
-
-    print(f"Caricati {len(quartieri_poligoni)} poligoni di quartieri")
-    return quartieri_poligoni
+def load_aree(path_json):
+    # Multipoligoni già assemblati e semplificati, dallo store accanto al file Overpass
+    # (ricostruito solo se il file o la tolleranza cambiano): [(nome, tag, geom)]
+    aree = load_neighborhoods(path_json, tolerance_m=SIMPLIFY_M)
+    print(f"Caricati {len(aree)} poligoni di quartieri")
+    return aree
 
 # ----------------------------
-# Determina quartiere da coordinate
+# Determina le aree da coordinate
 # ----------------------------
-def quartiere_from_point(lat, lon, quartieri_poligoni):
+def assegna_aree(pois, gerarchia):
     """
-    Determina il quartiere (municipalità) più vicino al punto dato.
-    Applica buffer progressivi e seleziona sempre il poligono più vicino,
-    anche se più di uno include il punto.
+    Aree di ogni POI con un'unica discesa dell'albero di contenimento
+    (AreaHierarchy.assign_many): un dizionario per POI con quartiere_area_urbana, la
+    prima area nell'elenco che contiene il punto, e l'area di ogni livello (municipio,
+    quartiere, rione; "" per i livelli assenti). Solo per i POI che nessuna area
+    contiene, quartiere_area_urbana è l'area più vicina entro le tolleranze
+    progressive, "" se nessuna è abbastanza vicina.
     """
-    pt = Point(lon, lat)
-    best_name = None
-    best_dist = float("inf")
-    best_tol = 0
-
-    # Buffer progressivi (~55m, ~165m, ~330m, ~660m, ~1300m, ~2600m)
-    buffer_steps = [0.0005, 0.0015, 0.003, 0.006, 0.012, 0.024]
-
-    for tol in buffer_steps:
-        candidates = []
-
-        for nome, pol in quartieri_poligoni:
-            if pol is None:
-                continue
-            try:
-                if pol.buffer(tol).contains(pt):
-                    dist = pol.distance(pt)
-                    candidates.append((nome, dist, tol))
-            except Exception:
-                continue
-
-        # Se ci sono candidati per questa tolleranza, scegli quello più vicino
-        if candidates:
-            candidates.sort(key=lambda x: x[1])  # ordina per distanza
-            best_name, best_dist, best_tol = candidates[0]
-            print(f"⚠️ {lat:.6f},{lon:.6f} incluso in {best_name} con tolleranza {best_tol*111000:.0f} m (distanza {best_dist*111000:.1f} m)")
-            return best_name
-
-    # Fallback: se nessuno lo contiene, assegna il più vicino entro 400 m
-    for nome, pol in quartieri_poligoni:
-        if pol is None:
-            continue
-        try:
-            dist = pol.distance(pt)
-            if dist < best_dist:
-                best_name = nome
-                best_dist = dist
-        except Exception:
-            continue
-
-    if best_name and best_dist < 0.004:
-#        print(f"{lat:.6f},{lon:.6f} assegnato a {best_name} (distanza {best_dist*111000:.1f} m)")
-        return best_name
+    lats = [poi.get("latitudine") for poi in pois]
+    lons = [poi.get("longitudine") for poi in pois]
+    livelli, prima, tol = gerarchia.assign_many(lats, lons)
+
+    for t in sorted(set(tol[tol >= 0].tolist())):  # NaN: non assegnato
+        n = int((tol == t).sum())
+        if t == 0:
+            print(f"Quartiere assegnato per contenimento: {n} POI")
+        else:
+            print(f"Quartiere assegnato con tolleranza {t*111000:.0f} m: {n} POI")
+    print(f"POI senza quartiere: {int((prima < 0).sum())}")
 
-#    print(f"Nessun quartiere trovato per {lat:.6f},{lon:.6f}")
-    return ""
+    return [{"quartiere_area_urbana": gerarchia.names[area] if area >= 0 else "", **gerarchia.names_for(row)}
+            for area, row in zip(prima, livelli)]
 
 
 # ----------------------------
 # Arricchimento POI
 # ----------------------------
-def arricchisci(poi, quartieri_poligoni):
+def arricchisci(poi, aree, data=None):
+    """
+    aree: da assegna_aree (campi quartiere_area_urbana, municipio, quartiere, rione).
+    data: risposta Nominatim già ottenuta (es. da /lookup), altrimenti reverse geocoding;
+    GEOCODE_FAILED se la richiesta è già fallita (senza ritentarla qui).
+    Restituisce (poi, completo): completo è False se il reverse geocoding è fallito
+    (errore di rete o HTTP, risposta None), e il POI non va memorizzato.
+    """
     lat = poi.get("latitudine")
     lon = poi.get("longitudine")
 
@@ -219,29 +199,103 @@ def arricchisci(poi, quartieri_poligoni):
         if tag.startswith("opening_hours="):
             poi["orari"] = tag.split("=", 1)[1]
 
-    data = reverse_geocode(lat, lon)
-    if data and "address" in data:
+    if data is None:
+        data = reverse_geocode(lat, lon)
+    complete = data is not None and data is not GEOCODE_FAILED
+    if complete and "address" in data:
         poi["address"] = estrai_address(data["address"])
 
-    poi["quartiere_area_urbana"] = quartiere_from_point(lat, lon, quartieri_poligoni)
-    return poi
+    poi.update(aree)
+    return poi, complete
 
 # ----------------------------
 # Main
 # ----------------------------
 def main():
-    quartieri_poligoni = load_quartieri(QUARTIERI_JSON)
-
-    with open(INPUT_JSON, "r", encoding="utf-8") as f:
-        pois = json.load(f)
-
-    enriched = []
-    for i, poi in enumerate(pois):
-        print(f"{i+1}/{len(pois)}  {poi.get('nome_poi')}")
-        enriched.append(arricchisci(poi, quartieri_poligoni))
-
-    with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-        json.dump(enriched, f, ensure_ascii=False, indent=2)
+    gerarchia = AreaHierarchy(load_aree(QUARTIERI_JSON))
+    print(gerarchia.report())
+
+    version = input_version(city_slug)  # dataset di osm_poi.py da cui viene l'input
+    pois = read_pois(INPUT_JSON)
+
+    previous = [None] * len(pois)
+    if INCREMENTAL:
+        previous = reusable_outputs(pois, OUTPUT_JSON, load_changes(city_slug, "address", version))
+        print(f"POI invariati riutilizzati: {sum(p is not None for p in previous)}/{len(pois)}")
+
+    aree = assegna_aree(pois, gerarchia)
+
+    # l'output dipende anche dai poligoni dei quartieri (e dai dati del geocoder locale)
+    context = [file_fingerprint(QUARTIERI_JSON), SIMPLIFY_M]
+    if LOCAL_GEOCODER:
+        context = [context, file_fingerprint(ADDRESSES_JSON), LOCAL_GEOCODER.max_distance_m]
+    if USE_LOOKUP:
+        context = [context, "lookup"]
+    memo = StageMemo(memo_path(city_slug), "address", version=STAGE_VERSION, enabled=USE_MEMO,
+                     context=context)
+
+    enriched = [None] * len(pois)
+    with memo:
+        # POI da elaborare: né riutilizzati (--incremental) né già in memo
+        pending = []
+        for i, (poi, prev) in enumerate(zip(pois, previous)):
+            if prev is not None:
+                enriched[i] = prev
+                continue
+            out, key = memo.lookup(poi)
+            if out is not None:
+                enriched[i] = out
+            else:
+                pending.append((i, key))
+
+        # /lookup a blocchi per osm_type/osm_id; il reverse resta per i POI non trovati
+        looked_up = {}
+        if USE_LOOKUP and pending:
+            refs = [(pois[i].get("osm_type"), pois[i].get("osm_id")) for i, _ in pending]
+            looked_up = NOMINATIM.lookup([ref for ref in refs if ref[0] and ref[1] != ""])
+            print(f"Indirizzi da /lookup: {len(looked_up)}/{len(pending)} POI")
+
+        # client asincrono: tutti i reverse mancanti in parallelo, prima dell'arricchimento
+        responses = {}
+        if ASYNC_NOMINATIM and pending:
+            missing = []
+            for i, _ in pending:
+                poi = pois[i]
+                data = looked_up.get((poi.get("osm_type"), poi.get("osm_id")))
+                if data is None and LOCAL_GEOCODER:
+                    data = LOCAL_GEOCODER.reverse(poi.get("latitudine"), poi.get("longitudine"))
+                if data is None:
+                    missing.append(i)
+                responses[i] = data
+            found = NOMINATIM.reverse_many([(pois[i].get("latitudine"), pois[i].get("longitudine")) for i in missing])
+            for i, data in zip(missing, found):
+                if data is None:
+                    # senza coordinate non c'è nulla da ritentare; altrimenti fallito, senza ritentare in arricchisci
+                    no_coords = pois[i].get("latitudine") is None or pois[i].get("longitudine") is None
+                    data = {} if no_coords else GEOCODE_FAILED
+                responses[i] = data
+
+        failed = 0
+        for i, key in pending:
+            poi = pois[i]
+            print(f"{i+1}/{len(pois)}  {poi.get('nome_poi')}")
+            data = responses[i] if i in responses else looked_up.get((poi.get("osm_type"), poi.get("osm_id")))
+            out, complete = arricchisci(poi, aree[i], data)
+            if complete:  # i fallimenti temporanei non vanno in memo: ritentati al prossimo giro
+                memo.store(key, out)
+            else:
+                failed += 1
+            enriched[i] = out
+    print(memo.report())
+    if failed:
+        print(f"Reverse geocoding fallito per {failed} POI: non memorizzati, ritentati al prossimo giro")
+    print(NOMINATIM.report())
+    if NOMINATIM_CACHE:
+        NOMINATIM_CACHE.close()
+        print(NOMINATIM_CACHE.report())
+
+    write_pois(OUTPUT_JSON, enriched, OUTPUT_FORMAT)
+    mark_processed(city_slug, "address", version)
 
     print(f"\nArricchimento completato → {OUTPUT_JSON}")
 
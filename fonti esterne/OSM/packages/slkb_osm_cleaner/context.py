@@ -0,0 +1,32 @@
+class CityContext:
+    """
+    Aggregati cittadini calcolati una sola volta su tutti i POI della città, prima della
+    pulizia dei nomi, e passati in sola lettura ad apply_name_cleaning:
+
+    rfi_count       numero di POI con "rfi" nei tag (stazioni della rete nazionale)
+    """
+
+    __slots__ = ("rfi_count",)
+
+    def __init__(self, city_pois):
+        rfi_count = 0
+        for poi in city_pois:
+            if "tag_k3" in poi and "rfi" in (poi.get("tag_k3") or "").lower():
+                rfi_count += 1
+        object.__setattr__(self, "rfi_count", rfi_count)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CityContext è in sola lettura")
+
+    def __reduce__(self):
+        # ricostruito dai valori già calcolati (es. nei processi worker)
+        return _restore, (self.rfi_count,)
+
+    def report(self):
+        return f"Contesto città: {self.rfi_count} POI RFI"
+
+
+def _restore(rfi_count):
+    context = CityContext.__new__(CityContext)
+    object.__setattr__(context, "rfi_count", rfi_count)
+    return context
@@ -43,3 +43,111 @@ GENERIC_NAMES = {
     "station": "Stazione",
     "railway station": "Stazione ferroviaria"
 }
+
+# ----------------------------
+# Tabelle delle regole di pulizia (rules.py)
+# ----------------------------
+
+# Traduzioni inglese → italiano dei nomi (intero nome o prima parola/e)
+EN_TO_IT = {
+    "parking": "Parcheggio", "restaurant": "Ristorante", "bar": "Bar",
+    "cafe": "Caffè", "fast food": "Fast food", "hotel": "Hotel",
+    "guest house": "Affittacamere", "bed & breakfast": "B&B",
+    "pharmacy": "Farmacia", "bank": "Banca", "atm": "Bancomat",
+    "post office": "Ufficio postale", "post_office": "Ufficio postale",
+    "theatre": "Teatro", "cinema": "Cinema", "viewpoint": "Belvedere",
+    "platform": "Piattaforma", "stop": "Fermata", "station": "Stazione",
+    "park": "Parco", "hospital": "Ospedale", "clinic": "Clinica",
+    "school": "Scuola", "university": "Università", "library": "Biblioteca",
+    "museum": "Museo", "supermarket": "Supermercato", "marketplace": "Mercato",
+    "church": "Chiesa", "chapel": "Cappella",
+}
+
+# Tag che identificano il trasporto pubblico
+TRANSPORT_TAGS = (
+    "public_transport=", "highway=bus_stop", "bus=yes",
+    "railway=", "train=yes", "tram=yes", "light_rail=yes",
+    "subway=yes", "funicular=yes",
+)
+
+# Operatori/reti ferroviarie suburbane (prefisso "Fermata treno")
+FERROVIA_SUBURBANA_KEYWORDS = (
+    "circumvesuviana", "eav", "trenord", "ferrovienord", "ferrovie nord", "fnm",
+    "ferrovie appulo lucane", "ferrovie appulo-lucane", "fal",
+    "ferrovie della calabria", "ferrovie calabria", "fcal",
+    "ferrovie sud est", "fse",
+    "roma–viterbo", "roma-viterbo", "roma viterbo",
+)
+
+# Nomi OSM privi di significato per le fermate (sostituiti dall'indirizzo)
+MEANINGLESS_STOP_NAMES = {
+    "stop", "stop position", "stop_position",
+    "platform", "piattaforma", "fermata", "bus stop", "halt",
+}
+
+# Categorie generiche -> nome italiano
+CATEGORY_TO_NAME = {
+    "post_office": "Ufficio Postale",
+    "bank": "Banca",
+    "atm": "Bancomat",
+    "pharmacy": "Farmacia",
+    "hospital": "Ospedale",
+    "school": "Scuola",
+    "supermarket": "Supermercato",
+    "hotel": "Hotel",
+    "bar": "Bar",
+    "cafe": "Caffè",
+    "restaurant": "Ristorante",
+    "belvedere": "Belvedere",
+    "pub": "Pub",
+    "parcheggio": "Parcheggio",
+    "teatro": "Teatro",
+    "parco": "Parco",
+    # categorie artistiche
+    "Opera d’arte": "Opera d’arte",
+    "Statua / Monumento": "Statua / Monumento",
+    "Opera contemporanea": "Opera contemporanea",
+}
+
+# Categorie artistiche (normalizzate: minuscole, apostrofo semplice)
+ARTWORK_CATEGORIES = {"opera d'arte", "statua / monumento", "opera contemporanea"}
+
+# artwork_type -> italiano
+ARTWORK_TYPE_IT = {
+    "sculpture": "Statua / Monumento",
+    "bust": "Busto",
+    "installation": "Opera contemporanea",
+}
+
+# Nomi generici di una sola parola a cui si aggiunge la via
+GENERIC_WITH_ADDRESS = {
+    "bar", "caffè", "ristorante", "parcheggio", "supermercato",
+    "mercato", "farmacia", "banca", "belvedere", "pub", "hotel", "parco", "teatro",
+}
+STREET_WORDS = ("via", "piazza", "viale", "corso", "largo")
+
+# Parole minuscole nella capitalizzazione (tranne in prima posizione)
+LOWERCASE_WORDS = {
+    "di", "del", "della", "dei", "da", "e", "a", "al", "ai", "alle",
+    "degli", "delle", "nel", "sul", "sulla",
+}
+
+# Parole ignorate nel confronto nome/via
+VIA_STOPWORDS = {
+    "via", "viale", "corso", "piazza", "largo", "vico", "vicolo",
+    "del", "della", "di", "dei", "da", "san", "santa", "santo", "ss",
+}
+
+# Modi di trasporto nei nomi: due fermate con modi diversi (o uno solo dei due
+# specificato) non sono duplicati
+TRANSPORT_MODE_WORDS = {
+    "autobus", "bus", "filobus", "treno", "ferroviaria", "tram", "metropolitana",
+    "metro", "funicolare",
+}
+
+# Parole in più ammesse tra due nomi dello stesso POI (articoli, numerazione);
+# valgono anche le parole generiche di GENERIC_NAMES ("Pizzeria Da Michele" / "Da Michele")
+DUPLICATE_FILLER_WORDS = {
+    "il", "lo", "la", "i", "gli", "le", "l", "un", "una", "n", "nr", "num", "numero",
+    "e", "a", "al", "alla", "all", "ai", "alle", "dal", "dalla", "dello", "degli", "delle",
+}
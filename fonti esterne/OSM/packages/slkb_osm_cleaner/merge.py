@@ -0,0 +1,229 @@
+from difflib import SequenceMatcher
+from math import radians, cos, sin, asin, sqrt, floor, pi
+
+from .mappings import DUPLICATE_FILLER_WORDS, GENERIC_NAMES, TRANSPORT_MODE_WORDS, VIA_STOPWORDS
+from .rules import normalize_for_match
+
+EARTH_RADIUS_M = 6371000
+METERS_PER_DEG = EARTH_RADIUS_M * pi / 180
+# margine sulle celle: nessuna coppia entro la distanza può cadere oltre le celle vicine
+CELL_MARGIN = 1.01
+DEFAULT_MIN_SIMILARITY = 0.9  # somiglianza minima dei nomi nei duplicati simili
+MIN_TYPO_WORD = 6  # lunghezza minima di una parola per tollerarne un refuso ("Michele"/"Michelle")
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Distanza in metri tra due coordinate geografiche"""
+    R = EARTH_RADIUS_M
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 2 * R * asin(sqrt(a))
+
+
+class Grid:
+    """
+    Griglia uniforme in gradi con celle larghe almeno max_distance_m in ogni direzione
+    (in longitudine alla latitudine più lontana dall'equatore, max_abs_lat): due punti
+    a meno di max_distance_m stanno in celle uguali o adiacenti.
+    """
+
+    def __init__(self, max_distance_m, max_abs_lat=0.0):
+        self.dlat = max(max_distance_m, 1e-3) * CELL_MARGIN / METERS_PER_DEG
+        shrink = cos(radians(min(abs(max_abs_lat), 89.9)))
+        self.dlon = min(self.dlat / shrink, 360.0)
+
+    def cell(self, lat, lon):
+        return floor(lat / self.dlat), floor(lon / self.dlon)
+
+    @staticmethod
+    def neighbours(cell):
+        i, j = cell
+        return [(i + di, j + dj) for di in (-1, 0, 1) for dj in (-1, 0, 1)]
+
+
+def merge_nearby_poi(pois, max_distance_m=50):
+    """
+    Unisce POI con stesso nome e distanza inferiore a max_distance_m (default 50 m)
+    per ridurre duplicati visivi come fermate bus adiacenti.
+
+    Ogni POI viene fuso nel primo POI già tenuto (in ordine di ingresso) con lo stesso
+    nome entro la distanza. Il confronto è limitato ai POI con lo stesso nome_poi
+    nelle celle vicine di una griglia (Grid) ampia max_distance_m, invece che a tutti
+    i POI già tenuti.
+    """
+    grid = Grid(max_distance_m, max((abs(poi["latitudine"]) for poi in pois), default=0.0))
+    merged = []
+    fusi = []  # lista per tenere traccia dei POI fusi
+    cells_by_name = {}  # nome_poi -> {cella: [indici in merged]}
+
+    for poi in pois:
+        lat, lon = poi["latitudine"], poi["longitudine"]
+        cell = grid.cell(lat, lon)
+        cells = cells_by_name.setdefault(poi["nome_poi"], {})
+        found = None
+        for near in grid.neighbours(cell):
+            for k in cells.get(near, ()):
+                if found is not None and k > found:
+                    break  # indici crescenti: in questa cella non c'è un POI precedente
+                m = merged[k]
+                if haversine(lat, lon, m["latitudine"], m["longitudine"]) < max_distance_m:
+                    found = k
+                    break
+        if found is not None:
+            fusi.append((poi, merged[found]))  # salva la coppia: POI attuale e quello già presente
+        else:
+            cells.setdefault(cell, []).append(len(merged))
+            merged.append(poi)
+
+    # stampa dettagliata dei POI fusi
+    for poi, m in fusi:
+        print(f"Fuso POI '{poi['nome_poi']}' ({poi['latitudine']},{poi['longitudine']}) "
+              f"in '{m['nome_poi']}' ({m['latitudine']},{m['longitudine']})")
+
+    print(f"Totale POI finali: {len(merged)}")
+    return merged
+
+
+# ----------------------------
+# Duplicati simili (nomi quasi uguali, categoria compatibile)
+# ----------------------------
+class UnionFind:
+    """Insiemi disgiunti sugli indici 0..n-1; la radice è sempre l'indice più basso."""
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]  # dimezzamento del cammino
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i != j:
+            if j < i:
+                i, j = j, i
+            self.parent[j] = i
+        return i
+
+
+def name_tokens(normalized):
+    """Parole significative di un nome normalizzato (senza "via", "di", ...)."""
+    return frozenset(w for w in normalized.split() if w not in VIA_STOPWORDS)
+
+
+# Parole che possono mancare in uno dei due nomi senza renderli diversi
+GENERIC_WORDS = frozenset(DUPLICATE_FILLER_WORDS) | frozenset(
+    w for key, value in GENERIC_NAMES.items() for w in (key, normalize_for_match(value)) if " " not in w
+)
+
+
+def _numbers(tokens):
+    return {w for w in tokens if not w.isalpha()}
+
+
+def name_similarity(a, b, tokens_a, tokens_b, min_similarity=DEFAULT_MIN_SIMILARITY):
+    """
+    Somiglianza in [0, 1] di due nomi normalizzati, prudente: meglio due POI in più
+    che un POI distinto perso.
+
+    - 0 se i numeri ("Bar Via Roma, 12" / "14") o i modi di trasporto
+      ("Fermata treno" / "Fermata") sono diversi;
+    - 1 se i nomi coincidono senza spazi, o se le parole di uno sono quelle dell'altro
+      più sole parole generiche (GENERIC_WORDS: "Pizzeria Da Michele" / "Da Michele"),
+      con almeno una parola non generica in comune ("Bar" / "Bar Ristorante" no);
+    - se resta una sola parola diversa per parte, lunga almeno MIN_TYPO_WORD, il
+      rapporto di SequenceMatcher tra le due (refusi: "Michele" / "Michelle");
+    - 0 altrimenti ("Chiesa di San Gennaro" / "Chiesa di San Gennaro all'Olmo").
+    """
+    if a == b or a.replace(" ", "") == b.replace(" ", ""):
+        return 1.0
+    if _numbers(tokens_a) != _numbers(tokens_b):
+        return 0.0
+    if tokens_a & TRANSPORT_MODE_WORDS != tokens_b & TRANSPORT_MODE_WORDS:
+        return 0.0
+    only_a, only_b = tokens_a - tokens_b, tokens_b - tokens_a
+    if (not only_a or not only_b) and (only_a | only_b) <= GENERIC_WORDS:
+        # non se in comune ci sono solo parole generiche ("Bar" / "Bar Ristorante")
+        return 1.0 if (tokens_a & tokens_b) - GENERIC_WORDS else 0.0
+    if len(only_a) != 1 or len(only_b) != 1:
+        return 0.0
+    x, y = next(iter(only_a)), next(iter(only_b))
+    if min(len(x), len(y)) < MIN_TYPO_WORD or 2 * min(len(x), len(y)) < min_similarity * (len(x) + len(y)):
+        return 0.0  # parole corte ("Mario" / "Maria") o limite sulle sole lunghezze
+    matcher = SequenceMatcher(None, x, y, autojunk=False)
+    if matcher.quick_ratio() < min_similarity:
+        return 0.0
+    return matcher.ratio()
+
+
+def category_key(categoria):
+    """Categoria confrontabile: senza maiuscole e spazi ("" se assente)."""
+    return (categoria or "").strip().lower()
+
+
+def categories_compatible(a, b):
+    """Stessa categoria (chiavi di category_key), o categoria assente in uno dei due."""
+    return not a or not b or a == b
+
+
+def cluster_duplicates(pois, max_distance_m=50, min_similarity=DEFAULT_MIN_SIMILARITY):
+    """
+    Fonde i POI vicini con nomi simili ma non identici ("Pizzeria Da Michele" e
+    "Da Michele", lo stesso bar mappato come nodo e come way), dopo merge_nearby_poi.
+
+    Le coppie candidate sono solo quelle nelle celle vicine di una Grid ampia
+    max_distance_m; una coppia è duplicata se entro la distanza, con categorie
+    compatibili e somiglianza dei nomi normalizzati almeno min_similarity
+    (name_similarity). I gruppi sono tenuti con UnionFind e ogni POI è confrontato
+    solo con le radici (il primo POI di ogni gruppo, in ordine di ingresso): si unisce
+    alla prima che gli somiglia, così ogni POI fuso è vicino e simile al POI che resta,
+    senza catene A~B~C tra POI lontani o diversi.
+    """
+    grid = Grid(max_distance_m, max((abs(poi["latitudine"]) for poi in pois), default=0.0))
+    names = [normalize_for_match(poi.get("nome_poi")) for poi in pois]
+    tokens = [name_tokens(n) for n in names]
+    categories = [category_key(poi.get("categoria_persistente")) for poi in pois]
+    groups = UnionFind(len(pois))
+    cells = {}  # cella -> [radici dei gruppi]
+    pairs = 0
+
+    for i, poi in enumerate(pois):
+        lat, lon = poi["latitudine"], poi["longitudine"]
+        cell = grid.cell(lat, lon)
+        if len(names[i]) >= 3:
+            found = None
+            for near in grid.neighbours(cell):
+                for k in cells.get(near, ()):
+                    if found is not None and k > found:
+                        break  # indici crescenti: in questa cella non c'è un gruppo precedente
+                    if not categories_compatible(categories[i], categories[k]):
+                        continue
+                    m = pois[k]
+                    if haversine(lat, lon, m["latitudine"], m["longitudine"]) >= max_distance_m:
+                        continue
+                    pairs += 1
+                    if name_similarity(names[i], names[k], tokens[i], tokens[k], min_similarity) >= min_similarity:
+                        found = k
+                        break
+            if found is not None:
+                groups.union(found, i)
+            else:
+                cells.setdefault(cell, []).append(i)  # nuovo gruppo: i è confrontabile dai successivi
+
+    kept = []
+    for i, poi in enumerate(pois):
+        root = groups.find(i)
+        if root == i:
+            kept.append(poi)
+        else:
+            m = pois[root]
+            print(f"Fuso POI simile '{poi['nome_poi']}' ({poi['latitudine']},{poi['longitudine']}) "
+                  f"in '{m['nome_poi']}' ({m['latitudine']},{m['longitudine']})")
+
+    print(f"Duplicati simili: {len(pois) - len(kept)} POI fusi ({pairs} coppie vicine confrontate), "
+          f"totale POI finali: {len(kept)}")
+    return kept
@@ -0,0 +1,399 @@
+import logging
+import re
+import time
+import unicodedata
+from functools import lru_cache
+
+from .mappings import (
+    EN_TO_IT, TRANSPORT_TAGS, FERROVIA_SUBURBANA_KEYWORDS, MEANINGLESS_STOP_NAMES,
+    CATEGORY_TO_NAME, ARTWORK_CATEGORIES, ARTWORK_TYPE_IT, GENERIC_WITH_ADDRESS,
+    STREET_WORDS, LOWERCASE_WORDS, VIA_STOPWORDS,
+)
+from .stats import RuleStats
+
+logger = logging.getLogger(__name__)
+
+# ----------------------------
+# Espressioni regolari compilate una volta sola
+# ----------------------------
+# Traduzioni: un'unica alternanza (chiavi più lunghe prima) su nome intero o prima parola/e
+EN_PREFIX_RE = re.compile(
+    "^(?:" + "|".join(re.escape(en) for en in sorted(EN_TO_IT, key=len, reverse=True)) + ")(?= |$)"
+)
+EN_PREFIX_SUBS = {en: re.compile(rf"(?i)^{re.escape(en)}\b") for en in EN_TO_IT}
+SUBURBAN_RAIL_RE = re.compile("|".join(re.escape(k) for k in FERROVIA_SUBURBANA_KEYWORDS))
+TRANSPORT_RE = re.compile("|".join(re.escape(k) for k in TRANSPORT_TAGS))
+
+CAP_RE = re.compile(r"\b\d{5}\b")
+PARENS_RE = re.compile(r"[()]")
+SPACES_RE = re.compile(r"\s{2,}")
+NON_ALNUM_RE = re.compile(r"[^a-z0-9 ]+")
+INSCRIPTION_SEP_RE = re.compile(r"\s*[|/]\s*")
+WIKIDATA_RE = re.compile(r"Q\d+")
+INITIAL_RE = re.compile(r'\b([A-Za-z])\.\s*([A-Za-z][\w\'\-]*)')
+INITIALS_RE = re.compile(r'\b((?:[A-Za-z]\.){2,})(\s*[A-Za-z].+)')
+LETTER_RE = re.compile(r'[A-Za-z]')
+
+
+class CityPatterns:
+    """Espressioni che dipendono dal nome della città, compilate una volta per città."""
+
+    def __init__(self, city):
+        self.city = city
+        if city:
+            c = re.escape(city)
+            self.word = re.compile(rf"(?i)\b{c}\b")
+            self.head = re.compile(rf"(?i)^\s*{c}\s*[-,–:]?\s*")
+            self.tail = re.compile(rf"(?i)\s*[-,–:]\s*{c}\s*$")
+            self.anywhere = re.compile(c, re.IGNORECASE)
+
+    def clean_address(self, addr):
+        """Indirizzo breve per i nomi: senza CAP, città, parentesi e spazi doppi."""
+        if not addr:
+            return ""
+        a = CAP_RE.sub("", addr)
+        if self.city:
+            a = self.word.sub("", a)
+        a = PARENS_RE.sub("", a)
+        a = SPACES_RE.sub(" ", a)
+        return a.strip(" ,")
+
+    def strip_city(self, name):
+        """Toglie il nome della città in testa o in coda al nome."""
+        if not self.city:
+            return name
+        n = self.head.sub("", name.strip())
+        n = self.tail.sub("", n)
+        return n.strip()
+
+
+@lru_cache(maxsize=256)
+def city_patterns(city):
+    return CityPatterns(city)
+
+
+# ----------------------------
+# Utility sui nomi
+# ----------------------------
+@lru_cache(maxsize=65536)
+def _cap_word(w):
+    if "." in w and len(w) <= 6:
+        parts = [p for p in w.split(".") if p]
+        if len(parts) == 2 and len(parts[0]) == 1:
+            return f"{parts[0].upper()}. {parts[1].capitalize()}"
+    if "'" in w:
+        pre, post = w.split("'", 1)
+        return f"{pre.capitalize()}'{post.capitalize()}"
+    return w.capitalize()
+
+
+@lru_cache(maxsize=65536)
+def smart_capitalize(s):
+    """Iniziali maiuscole (apostrofi e iniziali puntate compresi), preposizioni minuscole."""
+    if not s:
+        return s
+    out = []
+    for i, w in enumerate(s.split()):
+        wl = w.lower()
+        out.append(wl if i != 0 and wl in LOWERCASE_WORDS else _cap_word(w))
+    return " ".join(out)
+
+
+def normalize_for_match(s):
+    s = (s or "").lower()
+    if not s.isascii():  # senza accenti la decomposizione non cambia nulla
+        s = ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
+    return NON_ALNUM_RE.sub(" ", s).strip()
+
+
+def should_add_via(name_str, via_str):
+    """Decide se aggiungere la via in base alla sovrapposizione di parole significative."""
+    def words(s):
+        return set(w for w in normalize_for_match(s).split() if w not in VIA_STOPWORDS)
+
+    name_words = words(name_str)
+    via_words = words(via_str)
+    if not via_words:
+        return False
+    common = name_words & via_words
+    # l'unica parola in comune è l'ultima del nome (tipico dei cognomi nelle vie)
+    if len(common) == 1 and list(name_words)[-1] in common:
+        return False
+    # se più del 50% della via è già nel nome → non aggiungere
+    return len(common) / len(via_words) < 0.5
+
+
+def fix_initials_in_name(s):
+    if not s or "." not in s:  # entrambe le espressioni richiedono un punto
+        return s
+    # iniziali singole e multiple, mantenendo la capitalizzazione del resto
+    s = INITIAL_RE.sub(lambda m: f"{m.group(1).upper()}. {smart_capitalize(m.group(2))}", s)
+    s = INITIALS_RE.sub(
+        lambda m: " ".join(c.upper() + '.' for c in LETTER_RE.findall(m.group(1))) + " " + smart_capitalize(m.group(2)),
+        s)
+    return s
+
+
+def parse_tag_dict(tag_str):
+    d = {}
+    for p in tag_str.split(";"):
+        if "=" in p:
+            k, v = p.split("=", 1)
+            d[k.strip().lower()] = v.strip().lower()
+    return d
+
+
+# ----------------------------
+# Stato di un POI durante l'applicazione delle regole
+# ----------------------------
+class NameState:
+    """Campi letti dal POI e nome in lavorazione; tag e indirizzo breve sono calcolati solo se servono."""
+
+    __slots__ = ("name", "original_name", "tag", "categoria", "cat_base", "cat_base_norm",
+                 "address", "city", "patterns", "rfi_count", "_tag_dict", "_via")
+
+    def __init__(self, name, tag, categoria, address, city, rfi_count):
+        self.name = name
+        self.original_name = name
+        self.tag = tag
+        self.categoria = categoria
+        self.cat_base = (categoria.split(":")[-1] if ":" in categoria else categoria).strip()
+        self.cat_base_norm = self.cat_base.lower().replace("’", "'").replace("`", "'").replace("‘", "'")
+        self.address = address
+        self.city = city
+        self.patterns = city_patterns(city)
+        self.rfi_count = rfi_count
+        self._tag_dict = None
+        self._via = None
+
+    @property
+    def tag_dict(self):
+        if self._tag_dict is None:
+            self._tag_dict = parse_tag_dict(self.tag)
+        return self._tag_dict
+
+    @property
+    def via(self):
+        """Indirizzo breve (senza CAP, città e parentesi) da aggiungere ai nomi."""
+        if self._via is None:
+            self._via = self.patterns.clean_address(self.address)
+        return self._via
+
+
+# ----------------------------
+# Regole, nell'ordine in cui sono applicate
+# ----------------------------
+def rule_translation(st):
+    """Nomi inglesi → italiano (nome intero o prima parola/e)."""
+    name_clean = st.name.lower().replace("_", " ").strip()
+    m = EN_PREFIX_RE.match(name_clean)
+    if not m:
+        return False
+    en = m.group(0)
+    if len(en) == len(name_clean):
+        st.name = EN_TO_IT[en]
+    else:
+        st.name = EN_PREFIX_SUBS[en].sub(EN_TO_IT[en], st.name, 1)
+    return True
+
+
+def rule_transport(st):
+    """Trasporto pubblico: prefisso per tipo di fermata/stazione, stazioni RFI col nome della città."""
+    tag, tag_dict = st.tag, st.tag_dict
+    if not TRANSPORT_RE.search(tag):
+        return False
+    name_no_city = st.patterns.strip_city(st.name)
+    branch = True
+
+    if "bus=yes" in tag or "highway=bus_stop" in tag:
+        prefix = "Fermata autobus"
+    elif SUBURBAN_RAIL_RE.search(f"{name_no_city.lower()} {tag_dict.get('operator', '')} {tag_dict.get('network', '')}"):
+        prefix = "Fermata treno"
+    elif "railway=station" in tag:
+        prefix = "Stazione Ferroviaria"
+        if tag_dict.get("operator", "") == "rfi" or tag_dict.get("network", "") == "rfi":
+            branch = "rfi_station"
+            name_no_city = st.city if st.city else st.name
+            # aggiungi indirizzo solo se più stazioni nazionali
+            if st.rfi_count > 1 and st.via:
+                name_no_city = f"{name_no_city} - {st.via}"
+    elif "train=yes" in tag or "railway=stop" in tag:
+        prefix = "Fermata treno"
+    elif "subway=yes" in tag:
+        prefix = "Stazione metropolitana"
+    elif "funicular=yes" in tag:
+        prefix = "Stazione funicolare"
+    elif "tram=yes" in tag or "light_rail=yes" in tag:
+        prefix = "Fermata tram"
+    else:
+        prefix = "Fermata"
+
+    # nomi OSM inutili -> sostituiti dall'indirizzo
+    base = normalize_for_match(name_no_city)
+    if base in MEANINGLESS_STOP_NAMES or len(base) <= 3:
+        toponimo = st.via.strip()
+        st.name = f"{prefix} {smart_capitalize(toponimo)}" if toponimo else prefix
+    elif not name_no_city.lower().startswith(prefix.lower()):
+        st.name = f"{prefix} {name_no_city}".strip()
+    else:
+        st.name = name_no_city.strip()
+    return branch
+
+
+def rule_artwork(st):
+    """Opere d'arte: "Tipo Soggetto" da artwork_type e inscription, senza prefisso generico."""
+    if st.cat_base_norm not in ARTWORK_CATEGORIES:
+        return False
+    artwork_type = st.tag_dict.get("artwork_type", "").replace('"', '').strip().lower()
+    inscription = st.tag_dict.get("inscription", "").replace('"', '').strip()
+
+    # rimuove la città dall'iscrizione
+    if st.city and inscription:
+        inscription = st.patterns.anywhere.sub("", inscription).strip()
+
+    tipo_it = ARTWORK_TYPE_IT.get(artwork_type, smart_capitalize(artwork_type)) if artwork_type else ""
+
+    if inscription:
+        # separatori '/' e '|' e codici Wikidata
+        inscription = INSCRIPTION_SEP_RE.sub(" ", inscription)
+        inscription = WIKIDATA_RE.sub("", inscription)
+        inscription = SPACES_RE.sub(" ", inscription).strip()
+
+    if tipo_it.lower() == "statua / monumento":
+        tipo_it = tipo_it.replace("/", "").strip()
+        if inscription:
+            words = inscription.split()
+            # fino a "Orlandi" compreso, altrimenti le prime 6 parole
+            if "Orlandi" in words:
+                inscription = " ".join(words[:words.index("Orlandi") + 1])
+            else:
+                inscription = " ".join(words[:6])
+            if inscription.lower().startswith("in memoria"):
+                inscription = "in memoria" + inscription[10:]
+
+    if inscription and not inscription.lower().startswith("in memoria"):
+        inscription = smart_capitalize(inscription)
+
+    # "Tipo Soggetto"; senza dettagli resta il nome originale
+    parts = [p for p in (tipo_it, inscription) if p]
+    if parts:
+        st.name = " ".join(parts)
+    return True
+
+
+def rule_generic_category(st):
+    """Categorie generiche (post_office -> Ufficio Postale), con la via se il nome è di una parola."""
+    if st.cat_base_norm in ARTWORK_CATEGORIES or st.cat_base not in CATEGORY_TO_NAME:
+        return False
+    base_name = CATEGORY_TO_NAME[st.cat_base]
+    if len(st.original_name.split()) == 1 and st.via:
+        st.name = f"{base_name} {st.via}"
+    else:
+        st.name = smart_capitalize(base_name)
+    return True
+
+
+def rule_address_append(st):
+    """Nome generico di una sola parola (Bar, Farmacia, ...) -> aggiunge la via."""
+    base_name = st.name.lower()
+    words = base_name.split()
+    if words[0] not in GENERIC_WITH_ADDRESS or len(words) != 1:
+        return False
+    if st.via and not any(x in base_name for x in STREET_WORDS):
+        st.name = f"{st.name} {smart_capitalize(st.via)}"
+        return True
+    return False
+
+
+def rule_final_cleanup(st):
+    """Capitalizzazione finale e iniziali puntate."""
+    st.name = fix_initials_in_name(smart_capitalize(st.name).strip())
+    return True
+
+
+# Ogni regola restituisce False se non si applica, True se si applica, oppure il nome
+# del ramo scattato (es. "rfi_station"), contato in RULE_STATS accanto alla regola
+RULES = (
+    ("translation", rule_translation),
+    ("transport", rule_transport),
+    ("artwork", rule_artwork),
+    ("generic_category", rule_generic_category),
+    ("address_append", rule_address_append),
+    ("final_cleanup", rule_final_cleanup),
+)
+# Regole e rami, nell'ordine del report
+RULE_BRANCHES = ("translation", "transport", "rfi_station", "artwork", "generic_category",
+                 "address_append", "final_cleanup")
+
+# Contatori e tempi delle regole nel processo corrente (vedi stats.RuleStats)
+RULE_STATS = RuleStats()
+
+
+def signature(poi, rfi_count=1):
+    """
+    Tutto ciò che le regole leggono di un POI, già normalizzato:
+    (nome, tag_k3, categoria, indirizzo, città, rfi_count). POI con la stessa firma
+    hanno lo stesso risultato.
+    """
+    return (
+        (poi.get("nome_poi") or "").strip(),
+        (poi.get("tag_k3") or "").lower(),
+        (poi.get("categoria_persistente") or "").strip(),
+        (poi.get("address") or "").strip(),
+        (poi.get("citta_comune") or "").strip(),
+        rfi_count,
+    )
+
+
+def clean_fields(name, tag, categoria, address, city, rfi_count):
+    """
+    Applica RULES a una firma; restituisce (nome, categoria, indirizzo) puliti e le
+    regole (e i rami) scattati. Il tempo di ogni regola è sommato in RULE_STATS.
+    """
+    st = NameState(name, tag, categoria, address, city, rfi_count)
+    fired = []
+    seconds, clock = RULE_STATS.seconds, time.perf_counter
+    t0 = clock()
+    for label, rule in RULES:
+        hit = rule(st)
+        t1 = clock()  # un solo orologio per regola: la fine di una è l'inizio della successiva
+        seconds[label] += t1 - t0
+        t0 = t1
+        if hit:
+            fired.append(label)
+            if hit is not True:
+                fired.append(hit)
+    RULE_STATS.computed += 1
+    return st.name, st.categoria, st.address, tuple(fired)
+
+
+# Memo LRU limitata delle firme già pulite (fermate con lo stesso nome e la stessa via,
+# "Bar" della stessa categoria, ...): le statistiche sono in cached_clean_fields.cache_info()
+NAME_CACHE_SIZE = 100000
+cached_clean_fields = lru_cache(maxsize=NAME_CACHE_SIZE)(clean_fields)
+
+
+def apply_rules(poi, rfi_count=1, use_cache=True):
+    """
+    Applica RULES ai campi del POI; restituisce (nome, categoria, indirizzo) puliti.
+    Le regole scattate sono contate in RULE_STATS; il dettaglio per POI va nel log
+    solo a livello DEBUG.
+    """
+    fields = signature(poi, rfi_count)
+    name, categoria, address, fired = cached_clean_fields(*fields) if use_cache else clean_fields(*fields)
+    RULE_STATS.record(fired)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("POI %s: %r -> %r (categoria %r) [%s]", poi.get("poi_id", "?"), fields[0], name,
+                     fields[2], ", ".join(fired))
+    return name, categoria, address
+
+
+def cache_stats():
+    """(hit, miss) della memo delle firme nel processo corrente."""
+    info = cached_clean_fields.cache_info()
+    return info.hits, info.misses
+
+
+def rule_stats():
+    """Report delle regole nel processo corrente (RuleStats.as_dict, con tutte le regole e i rami)."""
+    return RULE_STATS.as_dict(RULE_BRANCHES)
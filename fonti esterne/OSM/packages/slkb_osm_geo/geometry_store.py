@@ -0,0 +1,168 @@
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+from shapely.validation import make_valid
+
+from slkb_osm_overpass.extract import build_area
+from slkb_osm_overpass.stream import iter_elements_file
+from slkb_osm_store.identity import file_fingerprint
+
+METERS_PER_DEG = 111320.0
+DEFAULT_SIMPLIFY_M = 2.0  # tolleranza di semplificazione (0 = nessuna)
+STORE_VERSION = "1"       # va incrementata quando cambia la costruzione delle geometrie
+
+# Tag conservati accanto alla geometria (livelli amministrativi e tipo di luogo)
+KEPT_TAGS = ("name", "admin_level", "boundary", "place")
+
+
+def store_path(json_path):
+    """<citta>_neighborhood.json -> <citta>_neighborhood.geom.sqlite"""
+    root, _ = os.path.splitext(json_path)
+    return root + ".geom.sqlite"
+
+
+def _valid_area(geom):
+    """Geometria resa valida, ridotta alle sole parti areali (o None)."""
+    if geom is None or geom.is_empty:
+        return None
+    if not geom.is_valid:
+        geom = make_valid(geom)
+    if geom.geom_type == "GeometryCollection":
+        parts = [g for g in geom.geoms if g.geom_type in ("Polygon", "MultiPolygon")]
+        geom = shapely.union_all(parts) if parts else None
+    if geom is None or geom.is_empty or geom.geom_type not in ("Polygon", "MultiPolygon"):
+        return None
+    return geom
+
+
+def element_geometry(el):
+    """
+    Area di un elemento 'out geom': la way chiusa come poligono, la relation assemblata
+    in multipoligono dagli anelli dei suoi membri (outer/inner, anche spezzati su più way).
+    """
+    if el.get("type") == "way" and "geometry" in el:
+        coords = [(n["lon"], n["lat"]) for n in el["geometry"] if n]
+        if len(coords) < 4 or coords[0] != coords[-1]:
+            return None
+        return _valid_area(Polygon(coords))
+
+    if el.get("type") == "relation":
+        outer, inner = [], []
+        for member in el.get("members", []):
+            if member.get("type") != "way" or "geometry" not in member:
+                continue
+            coords = [(n["lon"], n["lat"]) for n in member["geometry"] if n]
+            (inner if member.get("role") == "inner" else outer).append(coords)
+        geom = build_area(outer, inner)
+        if geom is None:
+            # anelli non chiudibili: si tengono almeno i membri già chiusi
+            closed = [Polygon(c) for c in outer if len(c) >= 4 and c[0] == c[-1]]
+            geom = shapely.union_all([make_valid(p) for p in closed]) if closed else None
+        return _valid_area(geom)
+    return None
+
+
+def simplify_m(geom, tolerance_m):
+    """Semplificazione che preserva la topologia, con tolleranza in metri (approssimata in gradi)."""
+    if not tolerance_m:
+        return geom
+    simplified = shapely.simplify(geom, tolerance_m / METERS_PER_DEG, preserve_topology=True)
+    return _valid_area(simplified) or geom
+
+
+class NeighborhoodStore:
+    """
+    Geometrie dei quartieri preelaborate, salvate in SQLite accanto al file Overpass:
+    una riga per area con nome, tag essenziali, WKB del multipoligono già assemblato e
+    semplificato, e bounding box (l'indice spaziale STRtree si ricostruisce da queste
+    in pochi millisecondi). Il file è valido finché non cambiano il JSON di origine,
+    la tolleranza o STORE_VERSION; altrimenti viene ricostruito.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _connect(self):
+        db = sqlite3.connect(self.path)
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS areas ("
+            " pos INTEGER PRIMARY KEY, name TEXT, tags TEXT, wkb BLOB,"
+            " minx REAL, miny REAL, maxx REAL, maxy REAL, vertices INTEGER)"
+        )
+        return db
+
+    @staticmethod
+    def signature(source_path, tolerance_m):
+        return json.dumps([STORE_VERSION, file_fingerprint(source_path), float(tolerance_m or 0)])
+
+    def is_current(self, source_path, tolerance_m):
+        if not os.path.exists(self.path):
+            return False
+        db = self._connect()
+        try:
+            row = db.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+        finally:
+            db.close()
+        return row is not None and row[0] == self.signature(source_path, tolerance_m)
+
+    def build(self, source_path, tolerance_m=DEFAULT_SIMPLIFY_M):
+        """Assembla, semplifica e salva le aree del file Overpass; restituisce [(nome, tag, geom)]."""
+        t0 = time.perf_counter()
+        areas, skipped, raw_vertices = [], 0, 0
+        for el in iter_elements_file(source_path):
+            tags = el.get("tags", {}) or {}
+            name = (tags.get("name") or "unknown").strip() or "unknown"
+            geom = element_geometry(el)
+            if geom is None:
+                print(f"Ignorata feature {name}, geometria non valida")
+                skipped += 1
+                continue
+            raw_vertices += shapely.get_num_coordinates(geom)
+            areas.append((name, {k: tags[k] for k in KEPT_TAGS if k in tags}, simplify_m(geom, tolerance_m)))
+
+        vertices = 0
+        db = self._connect()
+        try:
+            db.execute("DELETE FROM areas")
+            for pos, (name, tags, geom) in enumerate(areas):
+                n = int(shapely.get_num_coordinates(geom))
+                vertices += n
+                db.execute("INSERT INTO areas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (pos, name, json.dumps(tags, ensure_ascii=False), shapely.to_wkb(geom), *geom.bounds, n))
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)",
+                       (self.signature(source_path, tolerance_m),))
+            db.commit()
+        finally:
+            db.close()
+        print(f"Geometrie quartieri: {len(areas)} aree ({skipped} ignorate), vertici {raw_vertices} -> {vertices} "
+              f"(tolleranza {tolerance_m or 0:g} m), {time.perf_counter() - t0:.2f}s -> {self.path}")
+        return areas
+
+    def load(self):
+        """Aree salvate [(nome, tag, geom)], nell'ordine del file di origine."""
+        db = self._connect()
+        try:
+            rows = db.execute("SELECT name, tags, wkb FROM areas ORDER BY pos").fetchall()
+        finally:
+            db.close()
+        if not rows:
+            return []
+        geoms = shapely.from_wkb(np.array([r[2] for r in rows], dtype=object))
+        return [(name, json.loads(tags), geom) for (name, tags, _), geom in zip(rows, geoms)]
+
+
+def load_neighborhoods(source_path, tolerance_m=DEFAULT_SIMPLIFY_M, path=None):
+    """
+    Aree dei quartieri [(nome, tag, geom)] dal file Overpass <citta>_neighborhood.json,
+    passando per il NeighborhoodStore: ricostruito solo se mancante o non aggiornato.
+    """
+    store = NeighborhoodStore(path or store_path(source_path))
+    if store.is_current(source_path, tolerance_m):
+        return store.load()
+    return store.build(source_path, tolerance_m)
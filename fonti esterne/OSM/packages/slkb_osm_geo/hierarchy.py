@@ -0,0 +1,164 @@
+import numpy as np
+import shapely
+from shapely.strtree import STRtree
+
+from .quartieri import QuartieriIndex
+
+# Livelli della gerarchia, dal più ampio al più fine
+LEVELS = ("municipio", "quartiere", "rione")
+
+# Quota minima dell'area di un figlio che deve cadere nel genitore (tollera i bordi imprecisi)
+MIN_CONTAINMENT = 0.9
+
+
+def area_level(tags):
+    """Livello di un'area dai tag OSM: 0 municipio, 1 quartiere, 2 rione (None se non classificabile)."""
+    if tags.get("boundary") == "administrative" or "admin_level" in tags:
+        level = {"9": 0, "10": 1}.get(str(tags.get("admin_level")))
+        if level is not None:
+            return level
+    return {"suburb": 1, "quarter": 2, "neighbourhood": 2}.get(tags.get("place"))
+
+
+class AreaHierarchy:
+    """
+    Albero di contenimento delle aree urbane: municipio (admin_level 9) -> quartiere
+    (admin_level 10, place=suburb) -> rione (place=quarter|neighbourhood).
+
+    Il genitore di un'area è la più piccola area di livello superiore che ne contiene
+    almeno MIN_CONTAINMENT della superficie; le aree senza genitore sono radici (anche
+    i livelli intermedi mancanti sono ammessi). Le aree non classificabili (livello -1)
+    restano radici senza figli: non hanno un livello, ma contano per l'area assegnata
+    da assign_many. La ricerca scende l'albero: un punto viene confrontato solo con i
+    figli delle aree che lo contengono, e restituisce in una passata l'area di ogni livello.
+    """
+
+    def __init__(self, areas, min_containment=MIN_CONTAINMENT):
+        """areas: [(nome, tag, geom)] come da geometry_store.load_neighborhoods."""
+        valid = [(nome, area_level(tags), geom) for nome, tags, geom in areas
+                 if geom is not None and not geom.is_empty]
+        self.names = [nome for nome, _, _ in valid]
+        self.levels = np.array([-1 if level is None else level for _, level, _ in valid], dtype=np.int64)
+        self.geoms = np.array([geom for _, _, geom in valid], dtype=object)
+        shapely.prepare(self.geoms)
+
+        # genitore: la più piccola area di livello superiore che contiene il figlio
+        n = len(self.names)
+        self.parent = np.full(n, -1, dtype=np.int64)
+        if n:
+            surface = shapely.area(self.geoms)
+            child, cand = STRtree(self.geoms).query(self.geoms)
+            upper = (self.levels[cand] >= 0) & (self.levels[cand] < self.levels[child])
+            child, cand = child[upper], cand[upper]
+            shared = shapely.area(shapely.intersection(self.geoms[child], self.geoms[cand]))
+            inside = shared >= min_containment * surface[child]
+            for c, p in zip(child[inside], cand[inside]):
+                q = self.parent[c]
+                if q < 0 or (self.levels[p], -surface[p]) > (self.levels[q], -surface[q]):
+                    self.parent[c] = p  # il più vicino per livello, poi il più piccolo
+
+        # figli di ogni nodo (-1 = radice virtuale), ciascuno con il suo STRtree
+        self.children = {}
+        for i in range(n):
+            self.children.setdefault(int(self.parent[i]), []).append(i)
+        self.children = {k: np.array(v, dtype=np.int64) for k, v in self.children.items()}
+        self.trees = {k: STRtree(self.geoms[v]) for k, v in self.children.items()}
+        self._flat = None  # indice piatto per i punti fuori da ogni area, alla prima necessità
+
+    def __len__(self):
+        return len(self.names)
+
+    def depth(self):
+        depth, frontier = 0, [-1]
+        while frontier:
+            frontier = [c for k in frontier for c in self.children.get(k, ())]
+            depth += bool(frontier)
+        return depth
+
+    def _descend(self, points):
+        """Coppie (punto, area) di tutte le aree che contengono i punti, scendendo l'albero."""
+        hit_points, hit_areas = [], []
+        frontier = [(-1, np.arange(len(points)))]
+        while frontier:
+            node, idx = frontier.pop()
+            children = self.children.get(node)
+            if children is None or not len(idx):
+                continue
+            inp, cand = self.trees[node].query(points[idx])
+            hit = shapely.intersects(self.geoms[children[cand]], points[idx][inp])
+            found, inside = children[cand[hit]], idx[inp[hit]]
+            hit_points.append(inside)
+            hit_areas.append(found)
+            for child in np.unique(found):
+                frontier.append((int(child), inside[found == child]))
+        if not hit_points:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(hit_points), np.concatenate(hit_areas)
+
+    def _locate(self, lats, lons):
+        """Righe di locate_many e, per ogni punto, la prima area che lo contiene (-1 se nessuna)."""
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        out = np.full((len(lats), len(LEVELS)), -1, dtype=np.int64)
+        first = np.full(len(lats), -1, dtype=np.int64)
+        pos = np.flatnonzero(~(np.isnan(lats) | np.isnan(lons)))
+        if not len(self.names) or not len(pos):
+            return out, first
+
+        p, a = self._descend(shapely.points(lons[pos], lats[pos]))
+        if len(p):
+            # la prima area (indice più basso) per ogni coppia (punto, livello)
+            level = self.levels[a]
+            order = np.lexsort((a, level, p))
+            p, a, level = p[order], a[order], level[order]
+            head = np.ones(len(p), dtype=bool)
+            head[1:] = (p[1:] != p[:-1]) | (level[1:] != level[:-1])
+            head &= level >= 0
+            out[pos[p[head]], level[head]] = a[head]
+            # e per ogni punto, di qualsiasi livello
+            lowest = np.full(len(pos), len(self.names), dtype=np.int64)
+            np.minimum.at(lowest, p, a)
+            found = lowest < len(self.names)
+            first[pos[found]] = lowest[found]
+        return out, first
+
+    def locate_many(self, lats, lons):
+        """
+        Aree che contengono ogni punto, per livello: array (n, len(LEVELS)) di indici
+        (-1 dove nessuna area di quel livello contiene il punto). La discesa prosegue
+        in ogni area trovata, anche se un'altra area (di qualsiasi livello) contiene il
+        punto; tra più aree dello stesso livello vince la prima nell'elenco.
+        """
+        return self._locate(lats, lons)[0]
+
+    def assign_many(self, lats, lons):
+        """
+        Aree di ogni punto con una sola discesa dell'albero: (righe di locate_many, area
+        assegnata, tolleranza usata). L'area assegnata è la prima nell'elenco, di
+        qualsiasi livello, che contiene il punto (tolleranza 0), come l'assegnazione
+        piatta di QuartieriIndex; solo per i punti che nessuna area contiene è la più
+        vicina entro le tolleranze progressive di QuartieriIndex, con un indice piatto
+        costruito alla prima necessità. -1 e NaN dove nessuna area è abbastanza vicina.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        rows, first = self._locate(lats, lons)
+        tol = np.where(first >= 0, 0.0, np.nan)
+        outside = np.flatnonzero((first < 0) & ~(np.isnan(lats) | np.isnan(lons)))
+        if len(outside) and len(self.names):
+            if self._flat is None:
+                self._flat = QuartieriIndex(list(zip(self.names, self.geoms)))
+            first[outside], _, tol[outside] = self._flat.locate_many(lats[outside], lons[outside])
+        return rows, first, tol
+
+    def names_for(self, row):
+        """Riga di locate_many -> {"municipio": ..., "quartiere": ..., "rione": ...} ("" se assente)."""
+        return {level: self.names[i] if i >= 0 else "" for level, i in zip(LEVELS, row)}
+
+    def report(self):
+        counts = np.bincount(self.levels[self.levels >= 0], minlength=len(LEVELS))
+        parts = ", ".join(f"{n} {level}" for level, n in zip(LEVELS, counts))
+        unclassified = int((self.levels < 0).sum())
+        if unclassified:
+            parts += f", {unclassified} senza livello"
+        return f"Gerarchia aree: {parts}, profondità {self.depth()}, {int((self.parent < 0).sum())} radici"
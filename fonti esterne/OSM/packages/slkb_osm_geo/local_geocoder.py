@@ -0,0 +1,127 @@
+import math
+
+import numpy as np
+import shapely
+from shapely.strtree import STRtree
+
+from slkb_osm_overpass.stream import iter_elements_file
+
+METERS_PER_DEG = 111320.0
+DEFAULT_MAX_DISTANCE_M = 30.0
+
+# Dati degli indirizzi di un comune: civici (nodi e edifici) e strade con nome
+ADDRESS_CENTER_SELECTORS = [
+    'node["addr:housenumber"]',
+    'way["addr:housenumber"]',
+]
+STREET_GEOM_SELECTORS = [
+    'way["highway"]["name"]',
+]
+
+# Chiave dell'indirizzo Nominatim per tipo di strada (il resto è "road")
+STREET_KEYS = {"pedestrian": "pedestrian", "footway": "footway", "path": "footway"}
+
+
+def address_query(area_filter):
+    """
+    Query Overpass dei dati indirizzo: civici con 'out center' e strade con nome
+    con 'out geom'. area_filter è la riga che definisce l'area .a del comune.
+    """
+    centers = "\n".join(f"  {s}(area.a);" for s in ADDRESS_CENTER_SELECTORS)
+    streets = "\n".join(f"  {s}(area.a);" for s in STREET_GEOM_SELECTORS)
+    return f"""
+[out:json][timeout:300];
+{area_filter}
+(
+{centers}
+);
+out center tags;
+(
+{streets}
+);
+out geom tags;
+"""
+
+
+class LocalGeocoder:
+    """
+    Geocoder inverso offline costruito dai dati indirizzo OSM del comune.
+
+    I civici (nodi ed edifici con addr:housenumber) e le strade con nome sono indicizzati
+    in due STRtree, in una proiezione equirettangolare locale in metri. reverse() cerca
+    il civico più vicino entro max_distance_m, poi la strada più vicina entro la stessa
+    distanza, e restituisce un dizionario nel formato delle risposte Nominatim
+    ({"address": {"road": ..., "house_number": ..., "postcode": ...}}), oppure None:
+    in quel caso si ricade sul servizio Nominatim.
+    """
+
+    def __init__(self, elements, max_distance_m=DEFAULT_MAX_DISTANCE_M):
+        self.max_distance_m = max_distance_m
+        points, point_addr, lines, line_addr = [], [], [], []
+
+        for el in elements:
+            tags = el.get("tags", {}) or {}
+            if "geometry" in el and tags.get("highway") and tags.get("name"):
+                coords = [(p["lon"], p["lat"]) for p in el["geometry"] if p]
+                if len(coords) >= 2:
+                    lines.append(coords)
+                    address = {STREET_KEYS.get(tags["highway"], "road"): tags["name"]}
+                    if tags.get("postal_code"):
+                        address["postcode"] = tags["postal_code"]
+                    line_addr.append(address)
+                continue
+            if "addr:housenumber" in tags:
+                lat = el.get("lat") or el.get("center", {}).get("lat")
+                lon = el.get("lon") or el.get("center", {}).get("lon")
+                road = tags.get("addr:street") or tags.get("addr:place")
+                if lat is None or lon is None or not road:
+                    continue
+                address = {"road": road, "house_number": tags["addr:housenumber"]}
+                if tags.get("addr:postcode"):
+                    address["postcode"] = tags["addr:postcode"]
+                points.append((lon, lat))
+                point_addr.append(address)
+
+        all_lats = [lat for _, lat in points] + [lat for line in lines for _, lat in line]
+        self.lat0 = sum(all_lats) / len(all_lats) if all_lats else 0.0
+        self.kx = METERS_PER_DEG * math.cos(math.radians(self.lat0))
+
+        self.point_addr = point_addr
+        self.points = shapely.points([self._xy(lon, lat) for lon, lat in points]) if points else np.array([])
+        self.point_tree = STRtree(self.points)
+        self.line_addr = line_addr
+        self.lines = np.array([shapely.linestrings([self._xy(lon, lat) for lon, lat in line]) for line in lines],
+                              dtype=object)
+        self.line_tree = STRtree(self.lines)
+
+    @classmethod
+    def from_file(cls, path, max_distance_m=DEFAULT_MAX_DISTANCE_M):
+        """Costruisce il geocoder da un file di risposta Overpass (o da estratto) in streaming."""
+        return cls(iter_elements_file(path), max_distance_m=max_distance_m)
+
+    def _xy(self, lon, lat):
+        return lon * self.kx, lat * METERS_PER_DEG
+
+    def __len__(self):
+        return len(self.point_addr) + len(self.line_addr)
+
+    def reverse(self, lat, lon):
+        """Indirizzo del punto nel formato Nominatim, o None se nulla è entro max_distance_m."""
+        if lat is None or lon is None:
+            return None
+        pt = shapely.Point(*self._xy(lon, lat))
+
+        if len(self.point_addr):
+            idx = self.point_tree.query_nearest(pt, max_distance=self.max_distance_m)
+            if len(idx):
+                return {"address": dict(self.point_addr[int(idx[0])])}
+
+        if len(self.line_addr):
+            idx = self.line_tree.query_nearest(pt, max_distance=self.max_distance_m)
+            if len(idx):
+                return {"address": dict(self.line_addr[int(idx[0])])}
+        return None
+
+    def report(self):
+        return (f"Geocoder locale: {len(self.point_addr)} civici, {len(self.line_addr)} strade "
+                f"(distanza massima {self.max_distance_m:g} m)")
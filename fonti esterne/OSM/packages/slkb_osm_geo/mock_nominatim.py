@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+mock_nominatim.py
+
+Server Nominatim finto per provare in locale osm_poi_address.py (--lookup, reverse,
+client asincrono) senza toccare l'istanza pubblica. Implementa /reverse e /lookup
+con lo stesso formato JSON di Nominatim, a partire da un file di luoghi o da un file
+POI della pipeline.
+
+Uso:
+    python -m slkb_osm_geo.mock_nominatim [--port=8088] [--places=FILE] [--pois=<citta>_osm_poi.json]
+        [--delay=SECONDI] [--error-rate=0.1] [--miss-rate=0.2]
+
+    python osm_poi_address.py <citta> --lookup --nominatim-url=http://127.0.0.1:8088
+
+--places: JSON [{"osm_type": "node", "osm_id": 1, "lat": .., "lon": .., "address": {...}}, ...]
+--pois:   un file POI: a ogni POI viene associato un indirizzo sintetico
+--delay:  latenza simulata per richiesta
+--error-rate: frazione di risposte 429/503 (per provare retry e backoff)
+--miss-rate:  frazione di oggetti che /lookup non trova (per provare il fallback su reverse)
+"""
+
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+OSM_TYPES = {"N": "node", "W": "way", "R": "relation"}
+
+
+class MockNominatim:
+    def __init__(self, places, delay=0.0, error_rate=0.0, miss_rate=0.0, seed=0):
+        self.places = places
+        self.by_ref = {(p["osm_type"], int(p["osm_id"])): p for p in places}
+        self.delay = delay
+        self.error_rate = error_rate
+        self.miss_rate = miss_rate
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"reverse": 0, "lookup": 0, "errors": 0}
+
+    def result(self, place):
+        return {
+            "place_id": abs(hash((place["osm_type"], place["osm_id"]))) % 10 ** 9,
+            "osm_type": place["osm_type"],
+            "osm_id": int(place["osm_id"]),
+            "lat": str(place["lat"]),
+            "lon": str(place["lon"]),
+            "display_name": ", ".join(str(v) for v in place["address"].values()),
+            "address": place["address"],
+        }
+
+    def reverse(self, lat, lon):
+        if not self.places:
+            return {"error": "Unable to geocode"}
+        kx = math.cos(math.radians(lat))
+        place = min(self.places, key=lambda p: ((p["lat"] - lat) ** 2 + ((p["lon"] - lon) * kx) ** 2))
+        return self.result(place)
+
+    def lookup(self, osm_ids):
+        out = []
+        for code in osm_ids.split(","):
+            code = code.strip()
+            if not code or code[0] not in OSM_TYPES:
+                continue
+            place = self.by_ref.get((OSM_TYPES[code[0]], int(code[1:])))
+            if place is None:
+                continue
+            with self.lock:
+                missed = self.rnd.random() < self.miss_rate
+            if not missed:
+                out.append(self.result(place))
+        return out
+
+
+def synthetic_places(pois):
+    places = []
+    for i, poi in enumerate(pois):
+        if poi.get("latitudine") is None or not poi.get("osm_type"):
+            continue
+        places.append({
+            "osm_type": poi["osm_type"], "osm_id": int(poi["osm_id"]),
+            "lat": poi["latitudine"], "lon": poi["longitudine"],
+            "address": {"road": f"Via Finta {i % 97}", "house_number": str(i % 200 + 1), "postcode": "00100"},
+        })
+    return places
+
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status, data):
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+            if mock.delay:
+                time.sleep(mock.delay)
+            with mock.lock:
+                fail = mock.rnd.random() < mock.error_rate
+                if endpoint in mock.counts:
+                    mock.counts[endpoint] += 1
+                if fail:
+                    mock.counts["errors"] += 1
+            if fail:
+                self.send_json(mock.rnd.choice((429, 503)), {"error": "simulated"})
+            elif endpoint == "reverse":
+                self.send_json(200, mock.reverse(float(params["lat"]), float(params["lon"])))
+            elif endpoint == "lookup":
+                self.send_json(200, mock.lookup(params.get("osm_ids", "")))
+            else:
+                self.send_json(404, {"error": "unknown endpoint"})
+
+    return Handler
+
+
+def serve(mock, host="127.0.0.1", port=8088):
+    """Avvia il server in un thread e lo restituisce (server.shutdown() per fermarlo)."""
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    options = {}
+    for arg in sys.argv[1:]:
+        if arg.startswith("--"):
+            name, _, value = arg[2:].partition("=")
+            options[name] = value
+
+    places = []
+    if options.get("places"):
+        with open(options["places"], "r", encoding="utf-8") as f:
+            places = json.load(f)
+    elif options.get("pois"):
+        with open(options["pois"], "r", encoding="utf-8") as f:
+            places = synthetic_places(json.load(f))
+
+    mock = MockNominatim(places, delay=float(options.get("delay") or 0),
+                         error_rate=float(options.get("error-rate") or 0),
+                         miss_rate=float(options.get("miss-rate") or 0))
+    port = int(options.get("port") or 8088)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(mock))
+    print(f"Mock Nominatim su http://127.0.0.1:{port} ({len(places)} luoghi), Ctrl+C per uscire")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"Richieste: {mock.counts}")
+
+
+if __name__ == "__main__":
+    main()
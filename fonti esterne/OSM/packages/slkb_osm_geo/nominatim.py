@@ -0,0 +1,278 @@
+import asyncio
+import random
+import time
+
+import requests
+
+PUBLIC_NOMINATIM_URL = "https://nominatim.openstreetmap.org"
+LOOKUP_BATCH_SIZE = 50  # massimo di osm_ids per richiesta /lookup
+
+OSM_TYPE_CODES = {"node": "N", "way": "W", "relation": "R"}
+
+
+def osm_ref_code(osm_type, osm_id):
+    """('node', 123) -> 'N123', il formato di osm_ids di /lookup."""
+    return f"{OSM_TYPE_CODES[osm_type]}{osm_id}"
+
+
+class NominatimClient:
+    """
+    Client Nominatim sincrono con intervallo minimo tra le richieste (1 s per l'istanza
+    pubblica, come da policy d'uso) e cache opzionale (NominatimCache).
+
+    reverse(lat, lon)  -> risposta /reverse (coordinate agganciate alla griglia della cache)
+    lookup(refs)       -> risposte /lookup per (osm_type, osm_id), a blocchi di 50 id per
+                          richiesta; gli oggetti non trovati sono memorizzati come tali
+                          per non richiederli di nuovo.
+    """
+
+    def __init__(self, base_url=PUBLIC_NOMINATIM_URL, cache=None, min_interval=1.0,
+                 user_agent="SLKB-Geocoder", language="it", timeout=60):
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.min_interval = min_interval
+        self.headers = {"User-Agent": user_agent}
+        self.language = language
+        self.timeout = timeout
+        self.requests = 0
+        self._last_request = 0.0
+
+    def _get(self, endpoint, params):
+        wait = self._last_request + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request = time.monotonic()
+        self.requests += 1
+        params = dict(params, format="json", addressdetails=1, **{"accept-language": self.language})
+        r = requests.get(f"{self.base_url}/{endpoint}", params=params, headers=self.headers, timeout=self.timeout)
+        if r.status_code != 200:
+            return None
+        return r.json()
+
+    def reverse(self, lat, lon):
+        if self.cache:
+            cached = self.cache.get_reverse(lat, lon)
+            if cached is not None:
+                return cached
+        try:
+            data = self._get("reverse", {"lat": lat, "lon": lon})
+        except Exception as e:
+            print(f"❌ Errore Nominatim per {lat},{lon}: {e}")
+            return None
+        if data is not None and self.cache:
+            self.cache.put_reverse(lat, lon, data)
+        return data
+
+    def lookup(self, refs, batch_size=LOOKUP_BATCH_SIZE):
+        """
+        Risolve una lista di (osm_type, osm_id) con /lookup. Restituisce un dizionario
+        (osm_type, osm_id) -> risposta, solo per gli oggetti trovati da Nominatim.
+        """
+        results = {}
+        todo = []
+        for ref in dict.fromkeys(refs):
+            if ref[0] not in OSM_TYPE_CODES:
+                continue
+            cached = self.cache.get(f"lookup:{osm_ref_code(*ref)}") if self.cache else None
+            if cached is None:
+                todo.append(ref)
+            elif cached:  # {} = già cercato e non trovato
+                results[ref] = cached
+
+        for i in range(0, len(todo), batch_size):
+            batch = todo[i:i + batch_size]
+            codes = [osm_ref_code(*ref) for ref in batch]
+            try:
+                data = self._get("lookup", {"osm_ids": ",".join(codes)})
+            except Exception as e:
+                print(f"❌ Errore Nominatim lookup ({len(batch)} id): {e}")
+                continue
+            if data is None:
+                continue
+            found = {}
+            for item in data:
+                if item.get("osm_type") in OSM_TYPE_CODES and "osm_id" in item:
+                    found[(item["osm_type"], int(item["osm_id"]))] = item
+            for ref, code in zip(batch, codes):
+                item = found.get((ref[0], int(ref[1])))
+                if item is not None:
+                    results[ref] = item
+                if self.cache:
+                    self.cache.put(f"lookup:{code}", item or {})
+            print(f"Lookup Nominatim: {i + len(batch)}/{len(todo)} id, {len(found)} trovati nel blocco")
+
+        return results
+
+    def report(self):
+        return f"Richieste Nominatim: {self.requests} ({self.base_url})"
+
+
+# ----------------------------
+# Client asincrono (istanze self-hosted)
+# ----------------------------
+class TokenBucket:
+    """Limitatore a secchiello di gettoni: rate richieste/s in media, burst al più di seguito."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        # il gettone è prenotato subito (saldo anche negativo): chi arriva dopo attende
+        # di più, quindi le richieste partono in ordine di arrivo senza lock
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - 1
+        self.updated = now
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class AsyncNominatimClient:
+    """
+    Client Nominatim asincrono (aiohttp) per istanze che reggono più richieste al secondo.
+
+    - limite di frequenza a token bucket configurabile per endpoint (URL base):
+      rates = {url: (richieste/s, burst)}; l'istanza pubblica resta a 1 richiesta/s;
+    - al più `concurrency` richieste in volo, su un'unica sessione keep-alive;
+    - retry con backoff esponenziale e jitter su 429/5xx e errori di rete
+      (rispettando Retry-After se presente).
+
+    Stessa cache e stesso formato di NominatimClient; reverse_many() e lookup()
+    risolvono interi elenchi di POI in parallelo.
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url=PUBLIC_NOMINATIM_URL, cache=None, rates=None, concurrency=4,
+                 retries=4, backoff=1.0, user_agent="SLKB-Geocoder", language="it", timeout=60):
+        import aiohttp  # noqa: F401  (dipendenza opzionale, solo per questo client)
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        rate, burst = (rates or {}).get(self.base_url, (1.0, 1))
+        if self.base_url == PUBLIC_NOMINATIM_URL and rate > 1:
+            print("Istanza Nominatim pubblica: limite forzato a 1 richiesta/s")
+            rate, burst = 1.0, 1
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = max(1, int(concurrency))
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = {"User-Agent": user_agent}
+        self.language = language
+        self.timeout = timeout
+        self.requests = 0
+        self.retried = 0
+
+    async def _get(self, session, semaphore, endpoint, params):
+        import aiohttp
+        params = dict(params, format="json", addressdetails=1, **{"accept-language": self.language})
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            retry_after = None
+            try:
+                async with semaphore:
+                    self.requests += 1
+                    async with session.get(f"{self.base_url}/{endpoint}", params=params) as r:
+                        if r.status == 200:
+                            return await r.json(content_type=None)
+                        if r.status not in self.RETRY_STATUS:
+                            return None
+                        retry_after = r.headers.get("Retry-After")
+                        error = f"HTTP {r.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+            if attempt == self.retries:
+                raise Exception(f"{error} dopo {self.retries + 1} tentativi")
+            self.retried += 1
+            delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+
+    def _session(self):
+        import aiohttp
+        return aiohttp.ClientSession(
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60),
+        )
+
+    async def _reverse_many(self, points):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = [None] * len(points)
+
+        async with self._session() as session:
+            async def one(i, lat, lon):
+                try:
+                    data = await self._get(session, semaphore, "reverse", {"lat": lat, "lon": lon})
+                except Exception as e:
+                    print(f"❌ Errore Nominatim per {lat},{lon}: {e}")
+                    return
+                if data is not None and self.cache:
+                    self.cache.put_reverse(lat, lon, data)
+                results[i] = data
+
+            tasks = []
+            for i, (lat, lon) in enumerate(points):
+                if lat is None or lon is None:
+                    continue
+                cached = self.cache.get_reverse(lat, lon) if self.cache else None
+                if cached is not None:
+                    results[i] = cached
+                else:
+                    tasks.append(one(i, lat, lon))
+            if tasks:
+                print(f"Reverse Nominatim asincrono: {len(tasks)} richieste, {self.concurrency} in parallelo")
+            await asyncio.gather(*tasks)
+        return results
+
+    async def _lookup(self, refs, batch_size):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = {}
+        todo = []
+        for ref in dict.fromkeys(refs):
+            if ref[0] not in OSM_TYPE_CODES:
+                continue
+            cached = self.cache.get(f"lookup:{osm_ref_code(*ref)}") if self.cache else None
+            if cached is None:
+                todo.append(ref)
+            elif cached:
+                results[ref] = cached
+
+        async with self._session() as session:
+            async def one(batch):
+                codes = [osm_ref_code(*ref) for ref in batch]
+                try:
+                    data = await self._get(session, semaphore, "lookup", {"osm_ids": ",".join(codes)})
+                except Exception as e:
+                    print(f"❌ Errore Nominatim lookup ({len(batch)} id): {e}")
+                    return
+                if data is None:
+                    return
+                found = {(item["osm_type"], int(item["osm_id"])): item
+                         for item in data if item.get("osm_type") in OSM_TYPE_CODES and "osm_id" in item}
+                for ref, code in zip(batch, codes):
+                    item = found.get((ref[0], int(ref[1])))
+                    if item is not None:
+                        results[ref] = item
+                    if self.cache:
+                        self.cache.put(f"lookup:{code}", item or {})
+
+            await asyncio.gather(*(one(todo[i:i + batch_size]) for i in range(0, len(todo), batch_size)))
+        return results
+
+    def reverse(self, lat, lon):
+        return self.reverse_many([(lat, lon)])[0]
+
+    def reverse_many(self, points):
+        """Risposte /reverse per una lista di (lat, lon), nello stesso ordine (None se assente)."""
+        return asyncio.run(self._reverse_many(points))
+
+    def lookup(self, refs, batch_size=LOOKUP_BATCH_SIZE):
+        """Come NominatimClient.lookup, con i blocchi da 50 id richiesti in parallelo."""
+        return asyncio.run(self._lookup(refs, batch_size))
+
+    def report(self):
+        return (f"Richieste Nominatim: {self.requests} ({self.base_url}, {self.bucket.rate:g}/s, "
+                f"{self.concurrency} in parallelo, {self.retried} ritentate)")
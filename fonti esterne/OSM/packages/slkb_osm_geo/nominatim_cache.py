@@ -0,0 +1,155 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = "nominatim_cache.sqlite"  # condivisa tra le città
+DEFAULT_GRID_M = 10.0
+DEFAULT_TTL = 180 * 24 * 3600                  # secondi
+METERS_PER_DEG_LAT = 111320.0
+
+
+def snap(lat, lon, grid_m=DEFAULT_GRID_M):
+    """
+    Cella della griglia di lato ~grid_m metri che contiene il punto:
+    (indice di latitudine, indice di longitudine). Il passo in longitudine è
+    corretto per la latitudine della cella, così le celle restano quasi quadrate.
+    """
+    step_lat = grid_m / METERS_PER_DEG_LAT
+    i = math.floor(lat / step_lat)
+    cos_lat = max(math.cos(math.radians((i + 0.5) * step_lat)), 1e-6)
+    j = math.floor(lon / (step_lat / cos_lat))
+    return i, j
+
+
+class NominatimCache:
+    """
+    Cache su SQLite (modalità WAL) delle risposte Nominatim.
+
+    Le chiavi delle richieste reverse sono la cella di una griglia di ~grid_m metri
+    (snap), quindi punti a pochi metri di distanza condividono la stessa voce; ogni
+    voce ha una scadenza (TTL). Le scritture sono accumulate e confermate a blocchi
+    (commit_every) e alla chiusura, invece di riscrivere l'intera cache a ogni miss.
+    Lo stesso file può essere condiviso tra più città e più processi.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, grid_m=DEFAULT_GRID_M, ttl=DEFAULT_TTL, commit_every=50):
+        self.path = path
+        self.grid_m = grid_m
+        self.ttl = ttl
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, data TEXT, created REAL, expires REAL)"
+        )
+        self._db.commit()
+
+    def reverse_key(self, lat, lon):
+        i, j = snap(lat, lon, self.grid_m)
+        return f"reverse:{self.grid_m:g}:{i}:{j}"
+
+    def get(self, key):
+        """Risposta in cache per la chiave, o None se assente/scaduta."""
+        with self._lock:
+            row = self._db.execute("SELECT data, expires FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def contains(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT expires FROM entries WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] >= time.time()
+
+    def put(self, key, data, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, data, created, expires) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(data, ensure_ascii=False), now, now + (self.ttl if ttl is None else ttl)),
+            )
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self._db.commit()
+                self._pending = 0
+
+    def get_reverse(self, lat, lon):
+        return self.get(self.reverse_key(lat, lon))
+
+    def put_reverse(self, lat, lon, data):
+        self.put(self.reverse_key(lat, lon), data)
+
+    def import_json(self, json_path):
+        """
+        Importa una vecchia cache JSON {"lat,lon": risposta} (<citta>_nominatim_cache.json).
+        Restituisce il numero di voci importate.
+        """
+        if not os.path.exists(json_path):
+            return 0
+        with open(json_path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+        n = 0
+        for coords, data in legacy.items():
+            try:
+                lat, lon = (float(x) for x in coords.split(","))
+            except ValueError:
+                continue
+            key = self.reverse_key(lat, lon)
+            if not self.contains(key):
+                self.put(key, data)
+                n += 1
+        self.flush()
+        return n
+
+    def purge_expired(self):
+        with self._lock:
+            self._db.execute("DELETE FROM entries WHERE expires < ?", (time.time(),))
+            self._db.commit()
+
+    def flush(self):
+        with self._lock:
+            self._db.commit()
+            self._pending = 0
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def report(self):
+        return f"Cache Nominatim: {self.hits} hit, {self.misses} miss ({self.path}, griglia {self.grid_m:g} m)"
+
+
+def geocache_from_argv(argv):
+    """
+    Crea la cache Nominatim dalle opzioni da riga di comando:
+    --no-cache, --geocache=FILE, --geocache-grid=METRI, --geocache-ttl=SECONDI.
+    """
+    if "--no-cache" in argv:
+        return None
+    options = dict(a[2:].split("=", 1) for a in argv if a.startswith("--geocache") and "=" in a)
+    try:
+        grid = float(options.get("geocache-grid") or DEFAULT_GRID_M)
+        ttl = float(options.get("geocache-ttl") or DEFAULT_TTL)
+    except ValueError:
+        print("--geocache-grid/--geocache-ttl non validi, uso i default")
+        grid, ttl = DEFAULT_GRID_M, DEFAULT_TTL
+    return NominatimCache(options.get("geocache") or DEFAULT_CACHE_PATH, grid_m=grid, ttl=ttl)
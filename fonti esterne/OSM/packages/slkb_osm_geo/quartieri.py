@@ -0,0 +1,126 @@
+import numpy as np
+import shapely
+from shapely.geometry import Point
+from shapely.strtree import STRtree
+
+# Tolleranze progressive in gradi (~55m, ~165m, ~330m, ~660m, ~1300m, ~2600m)
+BUFFER_STEPS = (0.0005, 0.0015, 0.003, 0.006, 0.012, 0.024)
+
+
+class QuartieriIndex:
+    """
+    Indice spaziale (STRtree) dei poligoni dei quartieri per l'assegnazione punto -> quartiere.
+
+    Regola di assegnazione: il poligono più vicino al punto (distanza 0 se lo contiene),
+    purché entro l'ultima tolleranza di BUFFER_STEPS; a parità di distanza vince il
+    poligono che compare prima nell'elenco. È la stessa scelta dei buffer progressivi
+    di osm_poi_address.quartiere_from_point, senza ricostruire un buffer per poligono e
+    per punto: prima il contenimento (bbox dall'albero + poligoni preparati), poi una
+    ricerca del più vicino limitata alla distanza massima.
+    """
+
+    def __init__(self, quartieri_poligoni, buffer_steps=BUFFER_STEPS):
+        valid = [(nome, pol) for nome, pol in quartieri_poligoni if pol is not None and not pol.is_empty]
+        self.names = [nome for nome, _ in valid]
+        self.geoms = np.array([pol for _, pol in valid], dtype=object)
+        self.buffer_steps = tuple(buffer_steps)
+        shapely.prepare(self.geoms)
+        self.tree = STRtree(self.geoms)
+
+    def __len__(self):
+        return len(self.names)
+
+    def locate(self, lat, lon):
+        """
+        Quartiere di un punto: (indice del poligono, distanza in gradi, tolleranza usata),
+        oppure None se nessun poligono è entro la distanza massima.
+        """
+        if not len(self.names):
+            return None
+        pt = Point(lon, lat)
+
+        # 1) contenimento (bordo incluso): candidati dal bbox, verifica sui poligoni preparati
+        candidates = self.tree.query(pt)
+        inside = [i for i in candidates if self.geoms[i].intersects(pt)]
+        if inside:
+            return min(inside), 0.0, self.buffer_steps[0]
+
+        # 2) il più vicino entro la distanza massima
+        idx, dist = self.tree.query_nearest(pt, max_distance=self.buffer_steps[-1],
+                                            return_distance=True, all_matches=True)
+        if not len(idx):
+            return None
+        best = min(zip(dist, idx))
+        dist, i = float(best[0]), int(best[1])
+        if dist >= self.buffer_steps[-1]:
+            return None
+        tol = next(t for t in self.buffer_steps if dist < t)
+        return i, dist, tol
+
+    def name(self, i):
+        return self.names[i]
+
+    def locate_many(self, lats, lons):
+        """
+        Versione vettoriale di locate() per interi array di coordinate (None/NaN ammessi).
+
+        I punti sono creati con una sola chiamata (shapely.points); il contenimento è una
+        singola join spaziale sull'albero, verificata con i predicati vettoriali sui
+        poligoni preparati; le tolleranze progressive diventano passate mascherate sui
+        soli punti ancora non assegnati (join "dwithin" alla tolleranza, poi il più vicino
+        tra i candidati).
+
+        Restituisce tre array: indice del poligono (-1 se nessuno), distanza e
+        tolleranza usata (NaN se non assegnato).
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        index = np.full(len(lats), -1, dtype=np.int64)
+        dist = np.full(len(lats), np.nan)
+        tol = np.full(len(lats), np.nan)
+        pos = np.flatnonzero(~(np.isnan(lats) | np.isnan(lons)))
+        if not len(self.names) or not len(pos):
+            return index, dist, tol
+
+        points = shapely.points(lons[pos], lats[pos])
+
+        # 1) contenimento: candidati dai bbox, poi intersects vettoriale (bordo incluso)
+        inp, cand = self.tree.query(points)
+        hit = shapely.intersects(self.geoms[cand], points[inp])
+        inp, cand = _first_per_input(inp[hit], cand[hit])
+        index[pos[inp]] = cand
+        dist[pos[inp]] = 0.0
+        tol[pos[inp]] = self.buffer_steps[0]
+
+        # 2) tolleranze crescenti sui punti rimasti: il più vicino entro la tolleranza
+        todo = np.flatnonzero(index[pos] < 0)
+        for t in self.buffer_steps:
+            if not len(todo):
+                break
+            # candidati entro t con il predicato preparato, distanza esatta solo per questi
+            inp, cand = self.tree.query(points[todo], predicate="dwithin", distance=t)
+            d = shapely.distance(self.geoms[cand], points[todo][inp])
+            keep = d < t
+            inp, cand, d = inp[keep], cand[keep], d[keep]
+            inp, cand, d = _first_per_input(inp, cand, d)
+            target = pos[todo[inp]]
+            index[target] = cand
+            dist[target] = d
+            tol[target] = t
+            todo = np.delete(todo, inp)
+
+        return index, dist, tol
+
+
+def _first_per_input(inp, cand, d=None):
+    """
+    Per ogni punto di input tiene il candidato a distanza minima e, a parità,
+    quello con indice più basso (il primo nell'elenco dei poligoni).
+    """
+    keys = (cand, inp) if d is None else (cand, d, inp)
+    order = np.lexsort(keys)
+    inp, cand = inp[order], cand[order]
+    _, first = np.unique(inp, return_index=True)
+    if d is None:
+        return inp[first], cand[first]
+    return inp[first], cand[first], d[order][first]
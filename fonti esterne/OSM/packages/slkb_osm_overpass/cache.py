@@ -0,0 +1,200 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_DIR = "overpass_cache"
+DEFAULT_TTL = 24 * 3600              # secondi
+DEFAULT_MAX_BYTES = 1024 ** 3        # 1 GB di risposte compresse
+
+
+def normalize_query(query):
+    """
+    Forma canonica del testo di una query Overpass: senza commenti di riga
+    e con gli spazi compattati, così che differenze di sola formattazione
+    producano la stessa chiave.
+    """
+    q = re.sub(r"(?m)^\s*//.*$", "", query)
+    return " ".join(q.split())
+
+
+def query_key(query):
+    return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache su disco delle risposte Overpass, indirizzata per contenuto:
+    la chiave è lo SHA-256 della query normalizzata.
+
+    Ogni risposta è salvata compressa (gzip) in <directory>/<kk>/<chiave>.json.gz;
+    un indice SQLite tiene scadenza (TTL per voce), dimensione e ultimo accesso,
+    usati per l'eviction LRU quando la cache supera max_bytes.
+    Con refresh=True le letture vengono ignorate ma le nuove risposte sono salvate.
+    Le letture restituiscono solo voci più giovani del TTL (default 24 h).
+    Con offline=True le voci sono valide anche se scadute: la cache diventa un archivio
+    di risposte registrate da rieseguire senza rete.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES,
+                 refresh=False, offline=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, created REAL, expires REAL, size INTEGER, last_access REAL)"
+        )
+        self._db.commit()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def get_path(self, query):
+        """
+        Percorso del file compresso (.json.gz) in cache per la query, o None se
+        assente/scaduto; il file si legge in streaming con stream.iter_elements_file.
+        """
+        if self.refresh:
+            return None
+        key = query_key(query)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT expires FROM entries WHERE key = ?", (key,)).fetchone()
+            expired = row and row[0] < now and not self.offline
+            if not row or expired or not os.path.exists(self._path(key)):
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        self.hits += 1
+        return self._path(key)
+
+    def get(self, query):
+        """Restituisce la risposta JSON in cache per la query, o None se assente/scaduta."""
+        path = self.get_path(query)
+        if path is None:
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Voce di cache illeggibile ({os.path.basename(path)}): {e}")
+            return None
+
+    def put(self, query, data, ttl=None):
+        """Salva la risposta JSON della query con il TTL indicato (default: quello della cache)."""
+        key = query_key(query)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._register(key, ttl)
+
+    def put_file(self, query, src_path, ttl=None):
+        """Come put(), ma comprime in streaming una risposta già salvata su file."""
+        key = query_key(query)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(src_path, "rb") as src, gzip.open(tmp, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(tmp, path)
+        self._register(key, ttl)
+
+    def _register(self, key, ttl):
+        path = self._path(key)
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self.stored += 1
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, created, expires, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, now, expires, os.path.getsize(path), now),
+            )
+            self._db.commit()
+            self._evict()
+
+    def _evict(self):
+        """Rimuove le voci scadute e poi le meno usate di recente finché la cache supera max_bytes."""
+        now = time.time()
+        expired = [r[0] for r in self._db.execute("SELECT key FROM entries WHERE expires < ?", (now,))]
+        for key in expired:
+            self._remove(key)
+
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total > self.max_bytes:
+            for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._remove(key)
+                total -= size
+        self._db.commit()
+
+    def _remove(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:  # già rimosso, o ancora aperto in lettura (Windows)
+            pass
+        self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def describe(self):
+        """Modalità della cache, da stampare all'avvio degli script."""
+        if self.offline:
+            return f"Cache Overpass: solo risposte registrate, anche scadute (--offline, {self.directory})"
+        if self.refresh:
+            return f"Cache Overpass: non letta, le nuove risposte sono salvate (--refresh, {self.directory})"
+        return (f"Cache Overpass: attiva, risposte riusate fino a {self.ttl / 3600:.3g} h "
+                f"(--use-cache, {self.directory})")
+
+    def report(self):
+        return (f"Cache Overpass: {self.hits} risposte dalla cache, {self.misses} miss, "
+                f"{self.stored} salvate ({self.directory})")
+
+
+def describe_cache(cache):
+    """Riga di log sulla cache (o sulla sua assenza) per l'avvio degli script."""
+    if cache is None:
+        return "Cache Overpass: disattivata, ogni risposta viene da Overpass (--use-cache per riusarle)"
+    return cache.describe()
+
+
+def cache_from_options(options):
+    """
+    Crea la cache a partire dalle opzioni da riga di comando degli script:
+    --use-cache, --refresh, --offline, --no-cache, --cache-dir=DIR, --cache-ttl=SECONDI.
+
+    La cache è disattivata se non richiesta: senza opzioni ogni esecuzione interroga
+    Overpass, come prima della cache. --use-cache riusa le risposte più giovani di
+    --cache-ttl (default 24 h), --refresh salva le nuove risposte senza leggere la
+    cache, --offline rilegge le risposte registrate anche se scadute.
+    """
+    if not options.keys() & {"use-cache", "refresh", "offline"}:
+        return None
+    if "no-cache" in options:
+        if "offline" in options:
+            print("--offline richiede la cache, --no-cache ignorato")
+        else:
+            return None
+    try:
+        ttl = float(options.get("cache-ttl") or DEFAULT_TTL)
+    except ValueError:
+        print("--cache-ttl non valido, uso il default")
+        ttl = DEFAULT_TTL
+    return ResponseCache(options.get("cache-dir") or DEFAULT_CACHE_DIR, ttl=ttl,
+                         refresh="refresh" in options, offline="offline" in options)
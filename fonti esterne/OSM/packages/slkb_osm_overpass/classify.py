@@ -0,0 +1,111 @@
+from html import unescape
+
+import numpy as np
+import pandas as pd
+
+SEP = "\x1f"  # separatore chiave/valore nelle chiavi di lookup (non compare nei tag OSM)
+
+
+class TagClassifier:
+    """
+    Classificazione a lotti degli elementi OSM secondo le tabelle di osm_poi.py.
+
+    Le tabelle (chiave, valore) -> categoria e l'elenco dei tag ICCD sono compilate una
+    sola volta in dizionari "chiave<SEP>valore"; classify() legge gli elementi in un'unica
+    passata (tag prioritario, tag ICCD, coordinate) e calcola categorie e nomi come
+    colonne di un DataFrame con lookup vettoriali, invece di riscandire TAG_PRIORITY e
+    l'elenco ICCD per ogni elemento e per ogni funzione.
+
+    Il risultato è identico alla classificazione elemento per elemento (pick_tag_priority,
+    map_to_tourism, map_to_persistent, is_iccd_poi, normalize_name), tenuta come
+    riferimento in benchmarks/bench_classify.py.
+    """
+
+    def __init__(self, priority, tourism_map, persistent_map, iccd_tags,
+                 tourism_default="Altro / Generico", persistent_default="Altro",
+                 unnamed="POI senza nome"):
+        self.priority = tuple(priority)
+        self.tourism = {f"{k}{SEP}{v}": c for (k, v), c in tourism_map.items()}
+        self.persistent = {f"{k}{SEP}{v}": c for (k, v), c in persistent_map.items()}
+        self.tourism_default = tourism_default
+        self.persistent_default = persistent_default
+        self.unnamed = unnamed
+
+        # tag ICCD raggruppati per chiave: una colonna per chiave, un isin per colonna
+        self.iccd = {}
+        for k, v in iccd_tags:
+            self.iccd.setdefault(k, set()).add(v)
+
+    def classify(self, elements):
+        """
+        Classifica un lotto di elementi Overpass/estratto. Restituisce un DataFrame
+        (una riga per elemento, nell'ordine di input) con le colonne:
+        type, id, tags, lat, lon, has_links, iccd, prio_key, prio_val,
+        nome_poi, categoria_turistica, categoria_persistente.
+        """
+        elements = elements if isinstance(elements, list) else list(elements)
+        tags = [el.get("tags", {}) or {} for el in elements]
+
+        frame = pd.DataFrame({
+            "type": _objects([el.get("type", "") for el in elements]),
+            "id": _objects([el.get("id", "") for el in elements]),
+            "tags": _objects(tags),
+            "lat": _objects([el.get("lat") or el.get("center", {}).get("lat") for el in elements]),
+            "lon": _objects([el.get("lon") or el.get("center", {}).get("lon") for el in elements]),
+            "has_links": pd.Series([("wikidata" in t or "wikipedia" in t) for t in tags], dtype=bool),
+        })
+
+        # una colonna per chiave di priorità: il tag prioritario è la prima colonna presente
+        columns = {k: [t.get(k) for t in tags] for k in dict.fromkeys(self.priority + tuple(self.iccd))}
+        prio = pd.DataFrame({k: _objects(columns[k]) for k in self.priority}, index=frame.index)
+        present = prio.notna().to_numpy()
+        has_key = present.any(axis=1) if len(self.priority) else np.zeros(len(frame), dtype=bool)
+        first = present.argmax(axis=1) if len(self.priority) else np.zeros(len(frame), dtype=int)
+        keys = np.array(self.priority, dtype=object)[first] if len(self.priority) else first.astype(object)
+        vals = prio.to_numpy()[np.arange(len(frame)), first] if len(self.priority) else first.astype(object)
+        frame["prio_key"] = _objects(np.where(has_key, keys, None))
+        frame["prio_val"] = _objects(np.where(has_key, vals, None))
+        has_key = pd.Series(has_key, index=frame.index)
+
+        iccd = pd.Series(False, index=frame.index)
+        for k, values in self.iccd.items():
+            iccd |= _objects(columns[k]).isin(values)
+        frame["iccd"] = iccd
+
+        # lookup sulle sole coppie distinte (chiave, valore)
+        pair = frame["prio_key"].where(has_key, "") + SEP + frame["prio_val"].where(has_key, "")
+        codes, uniques = pd.factorize(pair)
+        uniques = list(uniques)
+        tourism = np.array([self.tourism.get(u, self.tourism_default) for u in uniques], dtype=object)
+        persistent = np.array([self.persistent.get(u, u.replace(SEP, ":", 1)) for u in uniques], dtype=object)
+        frame["categoria_turistica"] = _objects(tourism[codes] if len(codes) else [])
+        frame["categoria_persistente"] = _objects(persistent[codes] if len(codes) else [])
+        frame.loc[~has_key, "categoria_turistica"] = self.tourism_default
+        frame.loc[~has_key, "categoria_persistente"] = self.persistent_default
+
+        # nome: tag name ripulito, altrimenti il valore del tag prioritario capitalizzato
+        frame["nome_poi"] = _objects(_map_unique([t.get("name") for t in tags], frame["prio_val"].tolist(),
+                                                 self.unnamed))
+        return frame
+
+
+def _objects(values):
+    """Colonna di oggetti Python: niente conversione a stringhe Arrow né a float."""
+    return pd.Series(values, dtype=object)
+
+
+def _map_unique(names, vals, unnamed):
+    """normalize_name calcolato una volta per ogni coppia (name, valore prioritario) distinta."""
+    cache = {}
+    out = []
+    for pair in zip(names, vals):
+        nome = cache.get(pair)
+        if nome is None:
+            name, val = pair
+            if name:
+                nome = unescape(name).strip()
+            else:
+                nome = val.capitalize() if val else unnamed
+            cache[pair] = nome
+        out.append(nome)
+    return out
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from .response import OverpassTimeout, raise_for_remark, raise_for_timeout_status
+from .stream import raise_for_remark_file
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+
+class MirrorHealth:
+    """
+    Stato di salute di un mirror Overpass: latenza media mobile (EWMA),
+    punteggio d'errore mobile (0 = sempre ok, 1 = sempre in errore) e
+    finestra delle ultime latenze per il calcolo dei percentili.
+    """
+
+    def __init__(self, url, alpha=0.3, window=50, default_latency=30.0):
+        self.url = url
+        self.alpha = alpha
+        self.default_latency = default_latency
+        self.latency = None
+        self.error_score = 0.0
+        self.samples = deque(maxlen=window)
+
+    def record_success(self, elapsed):
+        self.samples.append(elapsed)
+        self.latency = elapsed if self.latency is None else self.alpha * elapsed + (1 - self.alpha) * self.latency
+        self.error_score = (1 - self.alpha) * self.error_score
+
+    def record_failure(self):
+        self.error_score = self.alpha + (1 - self.alpha) * self.error_score
+
+    def score(self):
+        """Latenza attesa penalizzata dagli errori recenti: più basso è meglio."""
+        latency = self.latency if self.latency is not None else self.default_latency
+        return latency * (1 + 4 * self.error_score)
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgedOverpassClient:
+    """
+    Client Overpass asincrono con richieste "hedged" sui mirror.
+
+    La query parte sul mirror più sano; se non risponde entro il percentile
+    hedge_percentile delle sue latenze recenti, viene inviata in parallelo al mirror
+    successivo, e così via. Vince la prima risposta valida e le altre richieste
+    in volo vengono cancellate. Un errore fa partire subito il mirror seguente.
+
+    fetch() restituisce il JSON già decodificato (risposte piccole); fetch_to_file()
+    scrive la risposta su disco in streaming, per le query con geometrie pesanti.
+    """
+
+    def __init__(self, servers, hedge_percentile=0.9, default_hedge_delay=15.0,
+                 min_hedge_delay=1.0, request_timeout=300, rounds=2, wait_between_rounds=10,
+                 user_agent="SLKB-Overpass"):
+        if not AIOHTTP_AVAILABLE:
+            raise ImportError("aiohttp non installato: pip install aiohttp")
+        self.mirrors = [MirrorHealth(url) for url in servers]
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.request_timeout = request_timeout
+        self.rounds = rounds
+        self.wait_between_rounds = wait_between_rounds
+        self.user_agent = user_agent
+        self._lock = threading.Lock()  # lo stato è condiviso tra thread (es. fetch a tile)
+
+    def ranked_mirrors(self):
+        with self._lock:
+            return sorted(self.mirrors, key=lambda m: m.score())
+
+    def hedge_delay(self, mirror):
+        with self._lock:
+            p = mirror.percentile(self.hedge_percentile)
+        return max(self.min_hedge_delay, p if p is not None else self.default_hedge_delay)
+
+    async def _post(self, session, mirror, query, path=None):
+        """
+        Esegue la query su un mirror. Senza path restituisce il JSON decodificato,
+        altrimenti scrive il corpo della risposta in path e restituisce path.
+        """
+        t0 = time.monotonic()
+        try:
+            async with session.post(mirror.url, data={"data": query}) as resp:
+                raise_for_timeout_status(resp.status)
+                resp.raise_for_status()
+                if path is None:
+                    text = await resp.text()
+                else:
+                    with open(path, "wb") as f:
+                        async for chunk in resp.content.iter_chunked(1 << 20):
+                            f.write(chunk)
+            if path is None:
+                if not text.strip():
+                    raise Exception("Risposta vuota dal server")
+                data = json.loads(text)
+                raise_for_remark(data)
+            else:
+                raise_for_remark_file(path)
+                data = path
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            with self._lock:
+                mirror.record_failure()
+            raise
+        with self._lock:
+            mirror.record_success(time.monotonic() - t0)
+        return data
+
+    async def _hedged_round(self, session, query, path=None):
+        ranked = self.ranked_mirrors()
+        in_flight = {}
+        errors = []
+        next_idx = 0
+        part_paths = []  # un file parziale per richiesta, solo il vincitore viene tenuto
+
+        def launch():
+            nonlocal next_idx
+            mirror = ranked[next_idx]
+            next_idx += 1
+            part = None
+            if path is not None:
+                part = f"{path}.{next_idx}.part"
+                part_paths.append(part)
+            task = asyncio.ensure_future(self._post(session, mirror, query, part))
+            in_flight[task] = mirror
+            return mirror
+
+        try:
+            launch()
+            while in_flight:
+                timeout = None
+                if next_idx < len(ranked):
+                    timeout = self.hedge_delay(ranked[next_idx - 1])
+                done, _ = await asyncio.wait(in_flight, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    mirror = launch()
+                    print(f"Nessuna risposta entro {timeout:.1f}s, richiesta hedged a {mirror.url}")
+                    continue
+
+                for task in done:
+                    mirror = in_flight.pop(task)
+                    try:
+                        data = task.result()
+                    except Exception as e:
+                        print(f"Errore da {mirror.url}: {e}")
+                        errors.append(e)
+                        continue
+                    print(f"Query eseguita con successo su {mirror.url}")
+                    if path is not None:
+                        os.replace(data, path)
+                        return path
+                    return data
+
+                # nessuna risposta valida tra quelle concluse: passa subito al mirror successivo
+                if next_idx < len(ranked):
+                    launch()
+        finally:
+            for task in in_flight:
+                task.cancel()
+            if in_flight:
+                await asyncio.gather(*in_flight, return_exceptions=True)
+            for part in part_paths:
+                try:
+                    os.remove(part)
+                except OSError:
+                    pass
+
+        if errors and all(isinstance(e, OverpassTimeout) for e in errors):
+            raise OverpassTimeout(str(errors[-1]))
+        raise Exception(f"Tutti i server falliti: {errors[-1] if errors else 'nessuna risposta'}")
+
+    async def fetch(self, query, path=None):
+        """
+        Esegue la query e restituisce il JSON completo della prima risposta valida;
+        con path la risposta viene invece scritta su file e si restituisce path.
+        """
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+        async with aiohttp.ClientSession(timeout=timeout, headers={"User-Agent": self.user_agent}) as session:
+            for attempt in range(1, self.rounds + 1):
+                try:
+                    return await self._hedged_round(session, query, path)
+                except OverpassTimeout:
+                    raise
+                except Exception as e:
+                    if attempt == self.rounds:
+                        raise
+                    print(f"Giro {attempt}/{self.rounds} fallito ({e}), riprovo tra {self.wait_between_rounds}s")
+                    await asyncio.sleep(self.wait_between_rounds)
+
+    def fetch_sync(self, query):
+        """Versione bloccante di fetch(), utilizzabile dagli script sincroni."""
+        return asyncio.run(self.fetch(query))
+
+    def fetch_to_file_sync(self, query, path):
+        """Versione bloccante di fetch() con la risposta scritta in streaming su path."""
+        return asyncio.run(self.fetch(query, path))
+
+    def report(self):
+        """Riepilogo dello stato dei mirror, dal più sano."""
+        lines = []
+        for m in self.ranked_mirrors():
+            lat = f"{m.latency:.1f}s" if m.latency is not None else "n/d"
+            lines.append(f"   {m.url}: latenza {lat}, errori {m.error_score:.2f}")
+        return "\n".join(lines)
@@ -0,0 +1,353 @@
+import bz2
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import xml.etree.ElementTree as ET
+
+from shapely.geometry import Point, LineString
+from shapely.ops import polygonize, unary_union
+from shapely.prepared import prep
+
+from .query import parse_selector, element_matches
+from .tiles import sort_elements
+
+try:
+    import osmium
+    OSMIUM_AVAILABLE = True
+except ImportError:
+    OSMIUM_AVAILABLE = False
+
+# Relation del comune: equivalente di area["name"=...]["boundary"="administrative"]["admin_level"="8"]
+CITY_BOUNDARY_SELECTOR = 'relation["boundary"="administrative"]["admin_level"="8"]'
+
+BATCH_SIZE = 100000
+
+
+# ----------------------------
+# Lettura streaming dei file OSM
+# ----------------------------
+# Ogni lettore produce tuple nell'ordine del file (nodi, way, relation):
+#   ("node", id, tags, lat, lon)
+#   ("way", id, tags, [node_ref, ...])
+#   ("relation", id, tags, [(member_type, ref, role), ...])
+
+def _open_xml(path):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_osm_xml(path, types=("node", "way", "relation")):
+    """Legge un file .osm / .osm.xml (anche .gz/.bz2) con iterparse, a memoria costante."""
+    with _open_xml(path) as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end" or elem.tag not in ("node", "way", "relation"):
+                continue
+            if elem.tag in types:
+                tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+                osm_id = int(elem.get("id"))
+                if elem.tag == "node":
+                    yield "node", osm_id, tags, float(elem.get("lat")), float(elem.get("lon"))
+                elif elem.tag == "way":
+                    yield "way", osm_id, tags, [int(nd.get("ref")) for nd in elem.iter("nd")]
+                else:
+                    members = [(m.get("type"), int(m.get("ref")), m.get("role", "")) for m in elem.iter("member")]
+                    yield "relation", osm_id, tags, members
+            root.clear()
+
+
+def iter_osm_pbf(path, types=("node", "way", "relation")):
+    """Legge un file .osm.pbf con pyosmium."""
+    if not OSMIUM_AVAILABLE:
+        raise ImportError("pyosmium non installato: pip install osmium")
+    entities = 0
+    if "node" in types:
+        entities |= osmium.osm.NODE
+    if "way" in types:
+        entities |= osmium.osm.WAY
+    if "relation" in types:
+        entities |= osmium.osm.RELATION
+    member_types = {"n": "node", "w": "way", "r": "relation"}
+
+    for o in osmium.FileProcessor(path, entities):
+        tags = {t.k: t.v for t in o.tags}
+        if o.is_node():
+            if o.location.valid():
+                yield "node", o.id, tags, o.location.lat, o.location.lon
+        elif o.is_way():
+            yield "way", o.id, tags, [n.ref for n in o.nodes]
+        else:
+            yield "relation", o.id, tags, [(member_types[m.type], m.ref, m.role) for m in o.members]
+
+
+def iter_osm_file(path, types=("node", "way", "relation")):
+    if path.endswith(".pbf"):
+        return iter_osm_pbf(path, types)
+    return iter_osm_xml(path, types)
+
+
+# ----------------------------
+# Geometrie
+# ----------------------------
+def way_center(coords):
+    """Centro del bounding box della way, come 'out center' di Overpass."""
+    lats = [lat for lat, lon in coords]
+    lons = [lon for lat, lon in coords]
+    return round((min(lats) + max(lats)) / 2, 7), round((min(lons) + max(lons)) / 2, 7)
+
+
+def build_area(outer_lines, inner_lines=()):
+    """
+    Ricostruisce l'area di una relation multipoligono dai tratti delle sue way:
+    poligonizza separatamente anelli esterni e interni e sottrae i secondi ai primi.
+    Ogni linea è una lista di coordinate (lon, lat).
+    """
+    def faces(lines):
+        lines = [LineString(c) for c in lines if len(c) >= 2]
+        return unary_union(list(polygonize(lines))) if lines else None
+
+    outer = faces(outer_lines)
+    if outer is None or outer.is_empty:
+        return None
+    inner = faces(inner_lines)
+    if inner is not None and not inner.is_empty:
+        outer = outer.difference(inner)
+    return outer if not outer.is_empty else None
+
+
+# ----------------------------
+# Indice dell'estratto
+# ----------------------------
+class OsmExtract:
+    """
+    Backend offline al posto di Overpass: legge un estratto OSM locale (stile Geofabrik)
+    e produce gli stessi dizionari elemento delle query 'out center' / 'out geom'.
+
+    Alla prima apertura l'estratto viene indicizzato in un file SQLite accanto ad esso
+    (riusato per tutti i comuni finché file e selettori non cambiano):
+      1. passata sulle relation: confini comunali (admin_level 8) e relation dei selettori;
+      2. passata su nodi e way: le posizioni dei nodi finiscono in un indice su disco
+         temporaneo, i selettori sono valutati una sola volta su ogni elemento e le
+         way membro delle relation vengono salvate con la loro geometria.
+    La memoria resta limitata: posizioni dei nodi e geometrie stanno su disco.
+
+    center_selectors: nodi e way restituiti con lat/lon o center (POI_QUERIES)
+    geom_selectors:   way e relation restituite con la geometria completa (quartieri)
+    """
+
+    def __init__(self, path, center_selectors=(), geom_selectors=(), index_path=None):
+        self.path = path
+        self.center_selectors = list(center_selectors)
+        self.geom_selectors = list(geom_selectors)
+
+        signature = json.dumps([self.center_selectors, self.geom_selectors])
+        digest = hashlib.sha256(signature.encode("utf-8")).hexdigest()[:8]
+        self.index_path = index_path or f"{path}.{digest}.sqlite"
+
+        stat = os.stat(path)
+        self.source_id = f"{stat.st_size}:{int(stat.st_mtime)}"
+
+        self.db = sqlite3.connect(self.index_path)
+        if not self._index_is_current():
+            self._build_index()
+
+    # ---------- costruzione indice ----------
+    def _index_is_current(self):
+        try:
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+        except sqlite3.OperationalError:
+            return False
+        return bool(row) and row[0] == self.source_id
+
+    def _build_index(self):
+        print(f"Indicizzazione estratto {self.path} ...")
+        db = self.db
+        for table in ("meta", "relations", "way_geoms", "elements"):
+            db.execute(f"DROP TABLE IF EXISTS {table}")
+        db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute("CREATE TABLE relations (id INTEGER PRIMARY KEY, tags TEXT, members TEXT, is_city INTEGER)")
+        db.execute("CREATE TABLE way_geoms (id INTEGER PRIMARY KEY, nodes TEXT, coords TEXT)")
+        db.execute(
+            "CREATE TABLE elements (type TEXT, id INTEGER, lat REAL, lon REAL, tags TEXT, geom TEXT,"
+            " PRIMARY KEY (type, id))"
+        )
+
+        parsed_center = [parse_selector(s) for s in self.center_selectors]
+        parsed_geom = [parse_selector(s) for s in self.geom_selectors]
+        parsed_city = parse_selector(CITY_BOUNDARY_SELECTOR)
+
+        def matches(parsed_list, el):
+            return any(element_matches(p, el) for p in parsed_list)
+
+        # 1) relation
+        member_ways = set()
+        n_rel = 0
+        for _, osm_id, tags, members in iter_osm_file(self.path, types=("relation",)):
+            el = {"type": "relation", "tags": tags}
+            is_city = element_matches(parsed_city, el)
+            if not (is_city or matches(parsed_geom, el)):
+                continue
+            db.execute("INSERT INTO relations VALUES (?, ?, ?, ?)",
+                       (osm_id, json.dumps(tags, ensure_ascii=False), json.dumps(members), int(is_city)))
+            member_ways.update(ref for mtype, ref, _ in members if mtype == "way")
+            n_rel += 1
+        db.commit()
+        print(f"  Relation rilevanti: {n_rel} ({len(member_ways)} way membro)")
+
+        # 2) nodi e way, con indice temporaneo delle posizioni dei nodi
+        tmp_dir = tempfile.mkdtemp(prefix="slkb_nodes_")
+        nodes_db = sqlite3.connect(os.path.join(tmp_dir, "nodes.sqlite"))
+        nodes_db.execute("PRAGMA journal_mode = OFF")
+        nodes_db.execute("PRAGMA synchronous = OFF")
+        nodes_db.execute("CREATE TABLE nodes (id INTEGER PRIMARY KEY, lat REAL, lon REAL)")
+
+        def locate(refs):
+            found = {}
+            for i in range(0, len(refs), 900):  # limite parametri SQLite
+                chunk = refs[i:i + 900]
+                q = f"SELECT id, lat, lon FROM nodes WHERE id IN ({','.join('?' * len(chunk))})"
+                found.update((r[0], (r[1], r[2])) for r in nodes_db.execute(q, chunk))
+            return [found[r] for r in refs if r in found]
+
+        batch = []
+        n_el = 0
+        nodes_done = False
+        try:
+            for item in iter_osm_file(self.path, types=("node", "way")):
+                if item[0] == "node":
+                    _, osm_id, tags, lat, lon = item
+                    batch.append((osm_id, lat, lon))
+                    if len(batch) >= BATCH_SIZE:
+                        nodes_db.executemany("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?)", batch)
+                        batch = []
+                    if tags:
+                        el = {"type": "node", "tags": tags}
+                        if matches(parsed_center, el) or matches(parsed_geom, el):
+                            db.execute("INSERT OR REPLACE INTO elements VALUES ('node', ?, ?, ?, ?, NULL)",
+                                       (osm_id, lat, lon, json.dumps(tags, ensure_ascii=False)))
+                            n_el += 1
+                    continue
+
+                if not nodes_done:
+                    nodes_db.executemany("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?)", batch)
+                    nodes_db.commit()
+                    batch = []
+                    nodes_done = True
+
+                _, osm_id, tags, refs = item
+                el = {"type": "way", "tags": tags}
+                is_center = bool(tags) and matches(parsed_center, el)
+                is_geom = bool(tags) and matches(parsed_geom, el)
+                is_member = osm_id in member_ways
+                if not (is_center or is_geom or is_member):
+                    continue
+
+                coords = locate(refs)
+                if not coords:
+                    continue
+                if is_member:
+                    db.execute("INSERT OR REPLACE INTO way_geoms VALUES (?, ?, ?)",
+                               (osm_id, json.dumps(refs), json.dumps(coords)))
+                if is_center or is_geom:
+                    lat, lon = way_center(coords)
+                    geom = json.dumps({"nodes": refs, "coords": coords}) if is_geom else None
+                    db.execute("INSERT OR REPLACE INTO elements VALUES ('way', ?, ?, ?, ?, ?)",
+                               (osm_id, lat, lon, json.dumps(tags, ensure_ascii=False), geom))
+                    n_el += 1
+        finally:
+            nodes_db.close()
+            try:
+                os.remove(os.path.join(tmp_dir, "nodes.sqlite"))
+                os.rmdir(tmp_dir)
+            except OSError:
+                pass
+
+        db.execute("INSERT INTO meta VALUES ('source', ?)", (self.source_id,))
+        db.commit()
+        print(f"  Elementi indicizzati: {n_el}")
+
+    # ---------- interrogazione ----------
+    def _relation_members_geometry(self, members):
+        out = []
+        for mtype, ref, role in members:
+            member = {"type": mtype, "ref": ref, "role": role}
+            if mtype == "way":
+                row = self.db.execute("SELECT coords FROM way_geoms WHERE id = ?", (ref,)).fetchone()
+                if row:
+                    member["geometry"] = [{"lat": lat, "lon": lon} for lat, lon in json.loads(row[0])]
+            out.append(member)
+        return out
+
+    def city_area(self, city):
+        """Area (shapely) del comune con il nome indicato, o None se non presente nell'estratto."""
+        for tags_json, members_json in self.db.execute("SELECT tags, members FROM relations WHERE is_city = 1"):
+            if json.loads(tags_json).get("name") != city:
+                continue
+            outer, inner = [], []
+            for member in self._relation_members_geometry(json.loads(members_json)):
+                if "geometry" not in member:
+                    continue
+                line = [(p["lon"], p["lat"]) for p in member["geometry"]]
+                (inner if member["role"] == "inner" else outer).append(line)
+            area = build_area(outer, inner)
+            if area is not None:
+                return area
+        return None
+
+    def elements(self, city):
+        """
+        Elementi dei selettori che ricadono nel comune, nell'ordine di Overpass.
+        Nodi e way 'center' sono filtrati sul punto (come l'area del comune);
+        way e relation 'geom' sono inclusi se almeno un vertice è interno al comune.
+        Restituisce None se il comune non è presente nell'estratto.
+        """
+        area = self.city_area(city)
+        if area is None:
+            return None
+        inside = prep(area)
+        minlon, minlat, maxlon, maxlat = area.bounds
+        results = []
+
+        rows = self.db.execute(
+            "SELECT type, id, lat, lon, tags, geom FROM elements"
+            " WHERE (geom IS NOT NULL) OR (lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?)",
+            (minlat, maxlat, minlon, maxlon),
+        )
+        for osm_type, osm_id, lat, lon, tags_json, geom_json in rows:
+            tags = json.loads(tags_json)
+            if geom_json:
+                geom = json.loads(geom_json)
+                if not any(inside.contains(Point(c_lon, c_lat)) for c_lat, c_lon in geom["coords"]):
+                    continue
+                results.append({
+                    "type": osm_type, "id": osm_id, "nodes": geom["nodes"],
+                    "geometry": [{"lat": c_lat, "lon": c_lon} for c_lat, c_lon in geom["coords"]],
+                    "tags": tags,
+                })
+                continue
+            if not inside.contains(Point(lon, lat)):
+                continue
+            if osm_type == "node":
+                results.append({"type": "node", "id": osm_id, "lat": lat, "lon": lon, "tags": tags})
+            else:
+                results.append({"type": osm_type, "id": osm_id, "center": {"lat": lat, "lon": lon}, "tags": tags})
+
+        parsed_geom = [parse_selector(s) for s in self.geom_selectors]
+        for osm_id, tags_json, members_json in self.db.execute("SELECT id, tags, members FROM relations"):
+            tags = json.loads(tags_json)
+            if not any(element_matches(p, {"type": "relation", "tags": tags}) for p in parsed_geom):
+                continue
+            members = self._relation_members_geometry(json.loads(members_json))
+            if not any(inside.contains(Point(p["lon"], p["lat"]))
+                       for m in members for p in m.get("geometry", [])):
+                continue
+            results.append({"type": "relation", "id": osm_id, "members": members, "tags": tags})
+
+        return sort_elements(results)
@@ -0,0 +1,195 @@
+import json
+import os
+
+# ----------------------------
+# Stato per città e file delle modifiche
+# ----------------------------
+# <city>_osm_state.json        timestamp OSM dell'ultima estrazione (osm3s.timestamp_osm_base)
+# <city>_osm_poi_changes.json  registro degli aggiornamenti incrementali dall'ultima estrazione
+#                              completa: un lotto per esecuzione, {"since", "until", "changed",
+#                              "removed"}, letto dagli stadi successivi (indirizzi, nomi, wiki)
+#                              con --incremental
+# <city>_osm_stages.json       per ogni stadio, la versione (timestamp OSM) del dataset da cui
+#                              derivava il suo input all'ultima esecuzione
+#
+# Ogni stadio somma i lotti dalla versione che ha elaborato l'ultima volta a quella del suo
+# input: più aggiornamenti incrementali senza eseguire gli stadi in mezzo non perdono modifiche.
+
+
+def state_path(city_slug):
+    return f"{city_slug}_osm_state.json"
+
+
+def changes_path(city_slug):
+    return f"{city_slug}_osm_poi_changes.json"
+
+
+def stages_path(city_slug):
+    return f"{city_slug}_osm_stages.json"
+
+
+def _load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def load_state(city_slug):
+    return _load_json(state_path(city_slug), {})
+
+
+def save_state(city_slug, state):
+    _save_json(state_path(city_slug), state)
+
+
+def newer_filter(timestamp):
+    """Filtro Overpass sugli elementi modificati dopo timestamp (ISO 8601)."""
+    return f'(newer:"{timestamp}")'
+
+
+def merge_changes(previous, changed_keys, changed_pois, current_keys):
+    """
+    Applica a un dataset POI esistente le modifiche di un aggiornamento incrementale.
+
+    previous:      POI dell'ultima esecuzione
+    changed_keys:  (osm_type, osm_id) degli elementi modificati da allora
+    changed_pois:  POI rielaborati per quegli elementi (senza quelli ora scartati dai filtri)
+    current_keys:  (osm_type, osm_id) di tutti gli elementi oggi presenti
+
+    I POI modificati mantengono poi_id e posizione; i nuovi sono aggiunti in coda; quelli
+    spariti da OSM, o che dopo la modifica non passano più i filtri, sono rimossi.
+    Restituisce (POI aggiornati, poi_id modificati o nuovi, poi_id rimossi).
+    """
+    def key(poi):
+        return poi["osm_type"], poi["osm_id"]
+
+    changed_by_key = {key(p): p for p in changed_pois}
+    merged, changed_ids, removed_ids = [], [], []
+
+    for poi in previous:
+        k = key(poi)
+        if k not in current_keys:
+            removed_ids.append(poi["poi_id"])
+        elif k in changed_keys:
+            new = changed_by_key.pop(k, None)
+            if new is None:
+                removed_ids.append(poi["poi_id"])
+                continue
+            new["poi_id"] = poi["poi_id"]
+            merged.append(new)
+            changed_ids.append(new["poi_id"])
+        else:
+            merged.append(poi)
+
+    for new in changed_by_key.values():
+        if key(new) in current_keys:
+            merged.append(new)
+            changed_ids.append(new["poi_id"])
+
+    return merged, changed_ids, removed_ids
+
+
+# ----------------------------
+# Registro delle modifiche
+# ----------------------------
+def append_changes(city_slug, batch):
+    """
+    Aggiunge al registro il lotto di un aggiornamento incrementale ({"since", "until",
+    "changed", "removed"}). I lotti già elaborati da tutti gli stadi registrati sono
+    rimossi; senza "until" la catena si interrompe e il registro viene azzerato
+    (gli stadi rielaborano tutto).
+    """
+    if not batch.get("until"):
+        reset_changes(city_slug)
+        return
+    batches = _load_json(changes_path(city_slug), {}).get("batches", [])
+    versions = [v for v in _load_json(stages_path(city_slug), {}).values() if v]
+    if versions:
+        oldest = min(versions)
+        batches = [b for b in batches if b["until"] > oldest]
+    batches.append(batch)
+    _save_json(changes_path(city_slug), {"batches": batches})
+
+
+def reset_changes(city_slug):
+    """Dopo un'estrazione completa: nessun lotto e nessuno stadio aggiornato, va rielaborato tutto."""
+    for path in (changes_path(city_slug), stages_path(city_slug)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# ----------------------------
+# Supporto agli stadi successivi
+# ----------------------------
+def input_version(city_slug, upstream=None):
+    """
+    Versione del dataset da cui deriva l'input di uno stadio: quella registrata dallo
+    stadio upstream (es. "address" per i nomi), o lo stato di osm_poi.py se None.
+    Va letta all'avvio dello stadio e passata a load_changes e mark_processed.
+    """
+    if upstream is None:
+        return load_state(city_slug).get("timestamp_osm_base")
+    return _load_json(stages_path(city_slug), {}).get(upstream)
+
+
+def mark_processed(city_slug, stage, version):
+    """Registra che lo stadio ha elaborato il dataset alla versione data (None: sconosciuta)."""
+    stages = _load_json(stages_path(city_slug), {})
+    stages[stage] = version
+    _save_json(stages_path(city_slug), stages)
+
+
+def load_changes(city_slug, stage, version):
+    """
+    Modifiche che lo stadio non ha ancora elaborato: l'unione dei lotti del registro
+    dalla versione elaborata l'ultima volta dallo stadio fino a version (quella del suo
+    input). Restituisce {"changed", "removed"}, o None se la catena dei lotti non copre
+    l'intervallo (prima esecuzione, estrazione completa nel frattempo, versione ignota):
+    in quel caso va rielaborato tutto.
+    """
+    last = _load_json(stages_path(city_slug), {}).get(stage)
+    if not last or not version:
+        return None
+    changed, removed = set(), set()
+    if last == version:
+        return {"changed": [], "removed": []}
+    batches = _load_json(changes_path(city_slug), {}).get("batches", [])
+    start = next((i for i, b in enumerate(batches) if b["since"] == last), None)
+    if start is None:
+        return None
+    for batch in batches[start:]:  # lotti consecutivi: since di ognuno = until del precedente
+        if batch["since"] != last:
+            return None
+        changed.update(batch["changed"])
+        removed.update(batch["removed"])
+        last = batch["until"]
+        if last == version:
+            return {"changed": sorted(changed), "removed": sorted(removed)}
+    return None
+
+
+def reusable_outputs(pois, previous_output_json, changes):
+    """
+    Per ogni POI in ingresso restituisce il record già prodotto da questo stadio
+    nell'esecuzione precedente, se il POI non è cambiato, altrimenti None.
+    Senza modifiche (load_changes ha restituito None) o output precedente nulla è
+    riutilizzabile.
+    """
+    from slkb_osm_store.columnar import pois_exist, read_pois
+
+    if changes is None or not pois_exist(previous_output_json):
+        return [None] * len(pois)
+
+    previous = {p.get("poi_id"): p for p in read_pois(previous_output_json)}
+    changed = set(changes.get("changed", []))
+
+    return [
+        previous.get(poi.get("poi_id")) if poi.get("poi_id") not in changed else None
+        for poi in pois
+    ]
@@ -0,0 +1,104 @@
+import re
+
+# ----------------------------
+# Parsing dei selettori Overpass semplici
+# ----------------------------
+# Supporta la forma usata in POI_QUERIES: tipo elemento seguito da filtri sui tag,
+# es. 'node["amenity"~"restaurant|cafe"]', 'way["leisure"="park"]', 'node["name"]'.
+SELECTOR_RE = re.compile(r'^\s*(node|way|relation|nwr)\s*((?:\[[^\]]*\]\s*)*)$')
+FILTER_RE = re.compile(r'\[\s*"([^"]+)"\s*(?:(!=|=|!~|~)\s*"([^"]*)")?\s*\]')
+
+
+def parse_selector(selector):
+    """
+    Scompone un selettore Overpass in (tipo_elemento, filtri).
+    Ogni filtro è una tupla (chiave, operatore, valore) con operatore in
+    "" (solo presenza), "=", "!=", "~", "!~"; per le regex il valore è già compilato.
+    """
+    m = SELECTOR_RE.match(selector)
+    if not m:
+        raise ValueError(f"Selettore Overpass non supportato: {selector}")
+    osm_type, filters_str = m.groups()
+
+    filters = []
+    for key, op, value in FILTER_RE.findall(filters_str):
+        if op in ("~", "!~"):
+            value = re.compile(value)
+        filters.append((key, op, value))
+
+    if len(filters) != filters_str.count("["):
+        raise ValueError(f"Filtri non riconosciuti nel selettore: {selector}")
+    return osm_type, filters
+
+
+def element_matches(parsed_selector, el):
+    """
+    Valuta lato client un selettore già parsato su un elemento Overpass
+    (stessa semantica di Overpass: regex non ancorate e case-sensitive).
+    """
+    osm_type, filters = parsed_selector
+    if osm_type != "nwr" and el.get("type") != osm_type:
+        return False
+
+    tags = el.get("tags", {}) or {}
+    for key, op, value in filters:
+        v = tags.get(key)
+        if op == "":
+            ok = v is not None
+        elif op == "=":
+            ok = v == value
+        elif op == "!=":
+            ok = v != value
+        elif op == "~":
+            ok = v is not None and value.search(v) is not None
+        else:  # "!~"
+            ok = v is None or value.search(v) is None
+        if not ok:
+            return False
+    return True
+
+
+# ----------------------------
+# Query unione
+# ----------------------------
+def chunk_selectors(selectors, max_per_query=0):
+    """
+    Divide i selettori in gruppi di al più max_per_query elementi
+    (0 o negativo = un unico gruppo con tutti i selettori).
+    """
+    selectors = list(selectors)
+    if max_per_query <= 0 or max_per_query >= len(selectors):
+        return [selectors] if selectors else []
+    return [selectors[i:i + max_per_query] for i in range(0, len(selectors), max_per_query)]
+
+
+def union_body(selectors, suffix="(area.a)"):
+    """
+    Costruisce il corpo di un'unione Overpass applicando a ogni selettore
+    lo stesso filtro spaziale (di default l'area risolta in .a).
+    """
+    return "\n".join(f"  {sel}{suffix};" for sel in selectors)
+
+
+def route_elements(elements, selectors):
+    """
+    Smista gli elementi restituiti da una query unione verso i selettori che li hanno prodotti.
+    Un elemento che soddisfa più selettori viene assegnato a ciascuno di essi, come
+    avverrebbe eseguendo le query separatamente; l'ordine di arrivo è preservato.
+    """
+    parsed = [(sel, parse_selector(sel)) for sel in selectors]
+    routed = {sel: [] for sel in selectors}
+    unmatched = 0
+
+    for el in elements:
+        found = False
+        for sel, p in parsed:
+            if element_matches(p, el):
+                routed[sel].append(el)
+                found = True
+        if not found:
+            unmatched += 1
+
+    if unmatched:
+        print(f"⚠️ {unmatched} elementi non riconducibili a nessun selettore")
+    return routed
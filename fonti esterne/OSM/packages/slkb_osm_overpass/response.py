@@ -0,0 +1,28 @@
+import re
+
+# Overpass segnala timeout ed esaurimento memoria con HTTP 200 e un campo "remark";
+# in quel caso la lista "elements" è parziale e non va usata come risultato completo.
+TIMEOUT_REMARK_RE = re.compile(r"runtime error:.*(timed out|out of memory|run out of memory)", re.IGNORECASE)
+
+# Codici HTTP con cui i mirror rifiutano query troppo onerose
+TIMEOUT_STATUS_CODES = (504,)
+
+
+class OverpassTimeout(Exception):
+    """La query ha superato timeout o memoria consentiti dal server Overpass."""
+
+
+def raise_for_remark(data):
+    """
+    Solleva OverpassTimeout se la risposta JSON di Overpass riporta un errore
+    di timeout o di memoria nel campo "remark".
+    """
+    remark = (data or {}).get("remark", "")
+    if remark and TIMEOUT_REMARK_RE.search(remark):
+        raise OverpassTimeout(remark.strip())
+
+
+def raise_for_timeout_status(status_code):
+    """Solleva OverpassTimeout per gli status HTTP che indicano una query troppo pesante."""
+    if status_code in TIMEOUT_STATUS_CODES:
+        raise OverpassTimeout(f"HTTP {status_code}")
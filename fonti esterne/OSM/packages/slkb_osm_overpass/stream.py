@@ -0,0 +1,167 @@
+import gzip
+import json
+import os
+import re
+
+from .response import raise_for_remark
+
+CHUNK_SIZE = 1 << 16
+TAIL_SIZE = 8192  # "remark" è l'ultima chiave della risposta Overpass
+
+DECODER = json.JSONDecoder()
+VALUE_END = ",]}: \t\r\n"
+REMARK_RE = re.compile(r'"remark"\s*:\s*("(?:[^"\\]|\\.)*")')
+OSM_BASE_RE = re.compile(r'"timestamp_osm_base"\s*:\s*"([^"]+)"')
+HEAD_SIZE = 4096  # "osm3s" precede "elements" nella risposta Overpass
+
+
+def save_response(resp, path, chunk_size=1 << 20):
+    """Scrive su disco il corpo di una risposta requests aperta con stream=True."""
+    with open(path, "wb") as f:
+        for chunk in resp.iter_content(chunk_size):
+            f.write(chunk)
+
+
+def raise_for_remark_file(path):
+    """
+    Controlla una risposta Overpass salvata su file senza caricarla:
+    solleva se il file è vuoto e OverpassTimeout se il "remark" finale segnala
+    un timeout o un esaurimento di memoria.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        raise Exception("Risposta vuota dal server")
+    with open(path, "rb") as f:
+        f.seek(max(0, size - TAIL_SIZE))
+        tail = f.read().decode("utf-8", errors="replace")
+    m = REMARK_RE.search(tail)
+    if m:
+        raise_for_remark({"remark": json.loads(m.group(1))})
+
+
+def read_osm_base(path):
+    """
+    Timestamp dei dati OSM su cui il server ha risposto (osm3s.timestamp_osm_base),
+    letto dall'inizio del file di risposta (anche .gz), o None se assente.
+    """
+    with open_response(path) as f:
+        head = f.read(HEAD_SIZE)
+    m = OSM_BASE_RE.search(head)
+    return m.group(1) if m else None
+
+
+class _JsonStream:
+    """Buffer di lettura su un file di testo per la decodifica JSON a pezzi."""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size):
+        data = self.f.read(size)
+        if not data:
+            self.eof = True
+            return
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+
+    def peek(self):
+        """Primo carattere significativo (saltando gli spazi), "" a fine file."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return ""
+            self.fill(self.chunk_size)
+
+    def expect(self, ch):
+        if self.peek() != ch:
+            raise ValueError(f"JSON Overpass non valido: atteso '{ch}' alla posizione {self.pos}")
+        self.pos += 1
+
+    def decode(self):
+        """Decodifica il valore JSON successivo, leggendo altro testo finché non è completo."""
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buf, self.pos)
+                # un numero troncato dal buffer (es. "0." di "0.6") va completato col pezzo successivo
+                if self.eof or (end < len(self.buf) and self.buf[end] in VALUE_END):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # lettura a dimensione crescente: elementi molto grandi restano lineari
+            self.fill(max(self.chunk_size, len(self.buf) - self.pos))
+
+
+def iter_json_elements(f, meta=None, chunk_size=CHUNK_SIZE):
+    """
+    Legge una risposta JSON di Overpass da un file di testo e restituisce uno alla
+    volta gli oggetti dell'array "elements", senza mai caricare l'intero documento.
+    Le altre chiavi di primo livello (version, osm3s, remark, ...) vengono copiate
+    in meta, se fornito, man mano che si incontrano.
+    """
+    stream = _JsonStream(f, chunk_size)
+    stream.expect("{")
+    while True:
+        ch = stream.peek()
+        if ch == "}" or ch == "":
+            return
+        if ch == ",":
+            stream.pos += 1
+            continue
+        key = stream.decode()
+        stream.expect(":")
+        if key != "elements":
+            value = stream.decode()
+            if meta is not None:
+                meta[key] = value
+            continue
+
+        stream.expect("[")
+        while True:
+            ch = stream.peek()
+            if ch == "]":
+                stream.pos += 1
+                break
+            if ch == ",":
+                stream.pos += 1
+                continue
+            if ch == "":
+                raise ValueError("JSON Overpass troncato dentro 'elements'")
+            yield stream.decode()
+
+
+def open_response(path):
+    """Apre in testo una risposta salvata, compressa (.gz) o no."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_elements_file(path, delete=False, meta=None):
+    """
+    Generatore sugli elementi di una risposta Overpass salvata su file.
+    Con delete=True il file (temporaneo) viene rimosso a fine lettura.
+    """
+    try:
+        with open_response(path) as f:
+            yield from iter_json_elements(f, meta=meta)
+    finally:
+        if delete:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def count_elements_file(path):
+    """Conta gli elementi di una risposta su file in streaming."""
+    return sum(1 for _ in iter_elements_file(path))
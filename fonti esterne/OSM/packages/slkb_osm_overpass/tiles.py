@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .response import OverpassTimeout
+
+# Ordine di output di Overpass ("out" asc): nodi, poi way, poi relation, per id crescente
+TYPE_ORDER = {"node": 0, "way": 1, "relation": 2}
+
+
+def split_bbox(bbox):
+    """Divide un bbox (sud, ovest, nord, est) nei quattro quadranti del quadtree."""
+    s, w, n, e = bbox
+    mid_lat = (s + n) / 2
+    mid_lon = (w + e) / 2
+    return [
+        (s, w, mid_lat, mid_lon),
+        (s, mid_lon, mid_lat, e),
+        (mid_lat, w, n, mid_lon),
+        (mid_lat, mid_lon, n, e),
+    ]
+
+
+def bbox_filter(bbox):
+    """Filtro bbox Overpass '(sud,ovest,nord,est)'."""
+    return "({:.7f},{:.7f},{:.7f},{:.7f})".format(*bbox)
+
+
+def sort_elements(elements):
+    """Ordina gli elementi come li restituirebbe una singola query Overpass."""
+    return sorted(elements, key=lambda el: (TYPE_ORDER.get(el.get("type"), len(TYPE_ORDER)), el.get("id", 0)))
+
+
+def fetch_tiled(build_query, run_query, bbox, max_workers=2, min_tile_deg=0.005):
+    """
+    Scarica gli elementi di un bbox suddividendolo adattivamente a quadtree.
+
+    Si parte dall'intero bbox; un tile la cui query va in timeout o supera la memoria
+    (OverpassTimeout) viene diviso in quattro e rimesso in coda, finché il lato non
+    scende sotto min_tile_deg. Al più max_workers tile sono in volo contemporaneamente.
+    Gli elementi che attraversano i bordi dei tile sono deduplicati per (type, id).
+
+    build_query(tile) -> testo della query per il tile
+    run_query(query)  -> lista di elementi, solleva OverpassTimeout se la query è troppo pesante
+
+    Restituisce (elementi ordinati, tile falliti).
+    """
+    elements = {}
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = {pool.submit(run_query, build_query(bbox)): bbox}
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                tile = pending.pop(future)
+                try:
+                    result = future.result()
+                except OverpassTimeout as e:
+                    s, w, n, e_ = tile
+                    if max(n - s, e_ - w) / 2 < min_tile_deg:
+                        print(f"❌ Tile {bbox_filter(tile)} troppo pesante anche alla dimensione minima: {e}")
+                        failed.append(tile)
+                        continue
+                    print(f"Tile {bbox_filter(tile)} troppo pesante ({e}), suddivido in 4")
+                    for sub in split_bbox(tile):
+                        pending[pool.submit(run_query, build_query(sub))] = sub
+                    continue
+                except Exception as e:
+                    print(f"❌ Tile {bbox_filter(tile)} fallito: {e}")
+                    failed.append(tile)
+                    continue
+
+                for el in result:
+                    elements.setdefault((el.get("type"), el.get("id")), el)
+
+    return sort_elements(elements.values()), failed
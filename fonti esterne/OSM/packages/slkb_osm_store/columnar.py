@@ -0,0 +1,126 @@
+import json
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+FORMATS = ("json", "parquet", "both")
+
+# Colonne a bassa cardinalità salvate come dizionario Arrow (categorie)
+CATEGORY_COLUMNS = (
+    "osm_type", "categoria_persistente", "categoria_turistica", "citta_comune",
+    "quartiere_area_urbana", "municipio", "quartiere", "rione", "zona_turistica", "tipo_geometria", "source",
+)
+
+# Colonne con valori non scalari (dict/liste), salvate come testo JSON
+JSON_COLUMNS_KEY = b"slkb_json_columns"
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def parquet_path(json_path):
+    """<citta>_osm_poi.json -> <citta>_osm_poi.parquet"""
+    root, _ = os.path.splitext(json_path)
+    return root + ".parquet"
+
+
+def output_format(argv):
+    """Formato di output da riga di comando: --format=json|parquet|both (default json)."""
+    fmt = next((a.split("=", 1)[1] for a in argv if a.startswith("--format=")), "json")
+    if fmt not in FORMATS:
+        print(f"--format non valido ({fmt}), uso json")
+        return "json"
+    if fmt != "json" and not PYARROW_AVAILABLE:
+        print("pyarrow non installato (pip install pyarrow), uso json")
+        return "json"
+    return fmt
+
+
+def pois_to_table(pois):
+    """
+    Converte una lista di POI in tabella Arrow: una colonna per campo (nell'ordine di
+    prima comparsa), categorie come dizionario, valori annidati serializzati in JSON.
+    """
+    fields = list(dict.fromkeys(k for poi in pois for k in poi))
+    arrays, json_columns = [], []
+    for name in fields:
+        values = [poi.get(name) for poi in pois]
+        array = None
+        if all(isinstance(v, SCALAR_TYPES) for v in values):
+            try:
+                array = pa.array(values)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):  # tipi misti nella colonna
+                array = None
+        if array is None:
+            array = pa.array([None if v is None else json.dumps(v, ensure_ascii=False) for v in values],
+                             type=pa.string())
+            json_columns.append(name)
+        elif name in CATEGORY_COLUMNS and pa.types.is_string(array.type):
+            array = array.dictionary_encode()
+        arrays.append(array)
+
+    table = pa.Table.from_arrays(arrays, names=fields) if fields else pa.table({})
+    return table.replace_schema_metadata({JSON_COLUMNS_KEY: json.dumps(json_columns).encode("utf-8")})
+
+
+def table_to_pois(table):
+    """Inverso di pois_to_table; i campi assenti (null) non compaiono nel record."""
+    meta = table.schema.metadata or {}
+    json_columns = set(json.loads(meta.get(JSON_COLUMNS_KEY, b"[]")))
+    columns = {}
+    for name in table.column_names:
+        values = table.column(name).to_pylist()
+        if name in json_columns:
+            values = [None if v is None else json.loads(v) for v in values]
+        columns[name] = values
+    return [
+        {name: values[i] for name, values in columns.items() if values[i] is not None}
+        for i in range(table.num_rows)
+    ]
+
+
+def write_pois(json_path, pois, fmt="json"):
+    """Salva i POI in JSON (json_path), Parquet (stesso nome, .parquet) o entrambi."""
+    if fmt in ("json", "both"):
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(pois, f, ensure_ascii=False, indent=2)
+    if fmt in ("parquet", "both"):
+        pq.write_table(pois_to_table(pois), parquet_path(json_path), compression="zstd")
+
+
+def latest_path(json_path):
+    """
+    File POI da leggere per json_path: il .parquet omonimo se esiste ed è il più
+    recente dei due, altrimenti il JSON (None se nessuno dei due esiste).
+    """
+    pq_path = parquet_path(json_path)
+    candidates = [p for p in (json_path, pq_path) if os.path.exists(p)]
+    if pq_path in candidates and not PYARROW_AVAILABLE:
+        candidates.remove(pq_path)
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
+def read_pois(json_path, columns=None):
+    """
+    Legge i POI salvati da write_pois, dal formato più recente tra JSON e Parquet.
+    Con columns (solo Parquet) si caricano soltanto i campi indicati.
+    """
+    path = latest_path(json_path)
+    if path is None:
+        raise FileNotFoundError(json_path)
+    if path.endswith(".parquet"):
+        return table_to_pois(pq.read_table(path, columns=columns))
+    with open(path, "r", encoding="utf-8") as f:
+        pois = json.load(f)
+    if columns is not None:
+        pois = [{k: poi[k] for k in columns if k in poi} for poi in pois]
+    return pois
+
+
+def pois_exist(json_path):
+    return latest_path(json_path) is not None
@@ -0,0 +1,35 @@
+import hashlib
+import json
+import uuid
+
+# Namespace fisso degli identificativi POI: cambiarlo cambia tutti i poi_id
+POI_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://www.openstreetmap.org/")
+
+
+def stable_poi_id(source, osm_type, osm_id):
+    """
+    Identificativo deterministico di un POI (UUID v5 di source/osm_type/osm_id):
+    lo stesso elemento OSM ha lo stesso poi_id in ogni esecuzione.
+    """
+    return str(uuid.uuid5(POI_NAMESPACE, f"{source}/{osm_type}/{osm_id}"))
+
+
+def fingerprint(record):
+    """
+    Impronta del contenuto di un record (SHA-256 del JSON canonico, chiavi ordinate):
+    cambia se e solo se cambia almeno un campo.
+    """
+    canonical = json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """Impronta SHA-256 del contenuto di un file (None se il file non esiste)."""
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                h.update(chunk)
+    except FileNotFoundError:
+        return None
+    return h.hexdigest()
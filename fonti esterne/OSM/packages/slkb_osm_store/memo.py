@@ -0,0 +1,99 @@
+import json
+import sqlite3
+import time
+
+from .identity import fingerprint
+
+
+def memo_path(city_slug):
+    return f"{city_slug}_stage_memo.sqlite"
+
+
+class StageMemo:
+    """
+    Memoizzazione per POI dell'output di uno stadio della pipeline.
+
+    L'output è salvato con chiave (poi_id, impronta dell'input, versione dello stadio):
+    un POI già elaborato con lo stesso input e la stessa versione viene saltato.
+    Per ogni (stadio, poi_id) si tiene solo l'ultima elaborazione, quindi il file
+    non cresce tra un'esecuzione e l'altra. Incrementare version invalida lo stadio.
+
+    Uso:
+        with StageMemo(memo_path(city_slug), "address", version="1") as memo:
+            out, key = memo.lookup(poi)
+            if out is None:
+                out = elabora(poi)
+                memo.store(key, out)
+    """
+
+    def __init__(self, path, stage, version="1", enabled=True, context=None, commit_every=100):
+        self.path = path
+        self.stage = stage
+        self.version = str(version)
+        self.enabled = enabled
+        self.context = context  # dati non per-POI da cui dipende l'output (entrano nell'impronta)
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self._db = None
+        if enabled:
+            self._db = sqlite3.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS memo ("
+                " stage TEXT, poi_id TEXT, fingerprint TEXT, version TEXT, output TEXT, updated REAL,"
+                " PRIMARY KEY (stage, poi_id))"
+            )
+            self._db.commit()
+
+    def key(self, poi):
+        record = poi if self.context is None else {"poi": poi, "context": self.context}
+        return poi.get("poi_id"), fingerprint(record)
+
+    def lookup(self, poi):
+        """
+        Restituisce (output memorizzato o None, chiave). La chiave va calcolata prima
+        di elaborare il POI, perché gli stadi lo modificano sul posto.
+        """
+        key = self.key(poi)
+        if self._db is None or key[0] is None:
+            return None, key
+        row = self._db.execute(
+            "SELECT output FROM memo WHERE stage = ? AND poi_id = ? AND fingerprint = ? AND version = ?",
+            (self.stage, key[0], key[1], self.version),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None, key
+        self.hits += 1
+        return json.loads(row[0]), key
+
+    def store(self, key, output):
+        if self._db is None or key[0] is None:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO memo (stage, poi_id, fingerprint, version, output, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (self.stage, key[0], key[1], self.version, json.dumps(output, ensure_ascii=False), time.time()),
+        )
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._db.commit()
+            self._pending = 0
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def report(self):
+        if not self.enabled:
+            return f"Memo stadio '{self.stage}': disattivata"
+        return f"Memo stadio '{self.stage}' v{self.version}: {self.hits} riusati, {self.misses} elaborati"
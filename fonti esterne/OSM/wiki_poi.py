@@ -9,6 +9,11 @@ from urllib.parse import quote
 
 import os
 
+sys.path.append(r"packages")
+from slkb_osm_overpass.incremental import input_version, load_changes, mark_processed, reusable_outputs
+from slkb_osm_store.memo import StageMemo, memo_path
+from slkb_osm_store.columnar import output_format, read_pois, write_pois
+
 try:
     import openai
     OPENAI_AVAILABLE = True
@@ -21,7 +26,7 @@ except ImportError:
 # Argomenti CLI
 # ---------------------------
 if len(sys.argv) < 2:
-    print("Uso: python enrich_poi_city.py <CITTÀ>")
+    print("Uso: python enrich_poi_city.py <CITTÀ> [--incremental] [--no-memo] [--format=json|parquet|both]")
     sys.exit(1)
 
 CITY_NAME = sys.argv[1]
@@ -29,6 +34,12 @@ CITY_CAPITALIZED = " ".join(word.capitalize() for word in CITY_NAME.split())
 city_slug = CITY_CAPITALIZED.lower().replace(" ", "_")
 INPUT_JSON = f"{city_slug}_osm_poi_name.json"
 OUTPUT_JSON = f"{city_slug}_poi.json"
+INCREMENTAL = "--incremental" in sys.argv  # riusa i POI non modificati (osm_poi.py --incremental)
+USE_MEMO = "--no-memo" not in sys.argv  # riusa l'output dei POI già arricchiti con lo stesso input
+OUTPUT_FORMAT = output_format(sys.argv)  # l'input è letto nel formato più recente disponibile
+
+# Versione dello stadio: va incrementata quando cambia la logica di enrich_poi
+STAGE_VERSION = "1"
 
 print(f"Input: {INPUT_JSON}")
 print(f"Output previsto: {OUTPUT_JSON}\n")
@@ -85,6 +96,23 @@ wiki = wikipediaapi.Wikipedia(
 )
 
 
+# ---------------------------
+# Errori temporanei (rete, 429/5xx): il POI resta senza dati ma non va in memo,
+# così viene ritentato al prossimo giro
+# ---------------------------
+class TransientFailure(Exception):
+    pass
+
+
+# Risposte HTTP che indicano un dato assente, non un errore temporaneo
+PERMANENT_HTTP_STATUS = {400, 404, 410}
+
+
+def is_transient(error):
+    response = getattr(error, "response", None)
+    return response is None or response.status_code not in PERMANENT_HTTP_STATUS
+
+
 # ---------------------------
 # Wikidata helpers
 # ---------------------------
@@ -122,6 +150,8 @@ def get_wikidata_metadata(qcode):
 
     except requests.exceptions.RequestException as e:
         print(f"Errore nel recuperare Wikidata Q{qcode}: {e}")
+        if is_transient(e):
+            raise TransientFailure(f"Wikidata {qcode}: {e}") from e
         return None, None, None
     except Exception as e:
         print(f"Errore inatteso Wikidata Q{qcode}: {e}")
@@ -154,8 +184,14 @@ def get_wikipedia_page(nome, comune=None):
     # fallback ricerca API
     search = f"https://it.wikipedia.org/w/api.php?action=query&list=search&format=json&utf8=&srsearch={quote(nome)}"
     try:
-        r = requests.get(search, timeout=10).json()
-    except:
+        resp = requests.get(search, timeout=10)
+        resp.raise_for_status()
+        r = resp.json()
+    except requests.exceptions.RequestException as e:
+        if is_transient(e):
+            raise TransientFailure(f"ricerca Wikipedia {nome!r}: {e}") from e
+        return None
+    except ValueError:
         return None
 
     results = r.get("query", {}).get("search", [])
@@ -338,6 +374,13 @@ def get_wikipedia_info(poi, coord_tolerance=0.01):
 import time
 
 def enrich_poi(poi):
+    """
+    Restituisce (poi arricchito, completo): completo è False se una richiesta a
+    Wikidata/Wikipedia è fallita per un errore temporaneo (TransientFailure), e il
+    POI non va memorizzato.
+    """
+    complete = True
+
     # ---------------------------
     # 1. Parse tag_k3 → tags dict
     # ---------------------------
@@ -349,7 +392,11 @@ def enrich_poi(poi):
     wikidata_q = poi.get("wikidata") or poi["tags"].get("wikidata")
     if wikidata_q:
         poi["wikidata"] = wikidata_q  # normalizza
-        desc, wp_title, wp_url = get_wikidata_metadata(wikidata_q)
+        try:
+            desc, wp_title, wp_url = get_wikidata_metadata(wikidata_q)
+        except TransientFailure:
+            complete = False
+            wp_url = None
 
         if wp_url and not poi.get("wikipedia"):
             poi["wikipedia"] = wp_url
@@ -365,29 +412,49 @@ def enrich_poi(poi):
     # 4. Storia, architettura e Wikipedia 
     # ---------------------------
     t0 = time.time()
-    wiki_info = get_wikipedia_info(poi)
+    try:
+        wiki_info = get_wikipedia_info(poi)
+    except TransientFailure as e:
+        print(f"[{poi['nome_poi']}] Errore temporaneo, da ritentare: {e}")
+        wiki_info = {}
+        complete = False
     poi.update(wiki_info)
     print(f"[{poi['nome_poi']}] Wikipedia fetch: {time.time()-t0:.3f}s")
 
-    return poi
+    return poi, complete
 
 
 # ---------------------------
 # Caricamento + salvataggio
 # ---------------------------
 print("⏳ Carico POI...")
-with open(INPUT_JSON, "r", encoding="utf-8") as f:
-    pois = json.load(f)
+version = input_version(city_slug, "names")  # dataset da cui derivava l'input
+pois = read_pois(INPUT_JSON)
 
 print(f"POI da processare: {len(pois)}")
 
+previous = [None] * len(pois)
+if INCREMENTAL:
+    previous = reusable_outputs(pois, OUTPUT_JSON, load_changes(city_slug, "wiki", version))
+    print(f"POI invariati riutilizzati: {sum(p is not None for p in previous)}/{len(pois)}")
+
 result = []
-for i, poi in enumerate(pois):
-    print(f" → ({i+1}/{len(pois)}) {poi['nome_poi']}")
-    result.append(enrich_poi(poi))
+with StageMemo(memo_path(city_slug), "wiki", version=STAGE_VERSION, enabled=USE_MEMO) as memo:
+    for i, (poi, prev) in enumerate(zip(pois, previous)):
+        if prev is not None:
+            result.append(prev)
+            continue
+        out, key = memo.lookup(poi)
+        if out is None:
+            print(f" → ({i+1}/{len(pois)}) {poi['nome_poi']}")
+            out, complete = enrich_poi(poi)
+            if complete:  # i fallimenti temporanei non vanno in memo
+                memo.store(key, out)
+        result.append(out)
+    print(memo.report())
 
 print("\nSalvo output...")
-with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-    json.dump(result, f, ensure_ascii=False, indent=2)
+write_pois(OUTPUT_JSON, result, OUTPUT_FORMAT)
+mark_processed(city_slug, "wiki", version)
 
 print(f"\nCompletato! File generato: {OUTPUT_JSON}")